@@ -0,0 +1,217 @@
+import io
+import os
+import time
+import queue
+import zipfile
+import threading
+from PIL import Image
+from loguru import logger
+
+
+archive_extensions = ('.cbz', '.zip')
+
+
+class ArchiveEntry:
+    """An image inside a chapter archive, as listed in the archive's central directory."""
+
+    def __init__(self, name: str, size: int, crc: int):
+        self.name = name
+        self.size = size
+        self.crc = crc
+
+
+def is_archive(path: str) -> bool:
+    return path.lower().endswith(archive_extensions) and os.path.isfile(path)
+
+
+def list_archive_images(archive_path: str, image_extensions: tuple[str]) -> list[ArchiveEntry]:
+    """
+    Returns the images in an archive. Only its central directory is read, so no page is decompressed.
+    An archive that can't be read yet (e.g. still being copied) has no images.
+    """
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            return [
+                ArchiveEntry(info.filename, info.file_size, info.CRC) for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(image_extensions)
+                and not info.filename.startswith("__MACOSX/") and not os.path.basename(info.filename).startswith(".")
+            ]
+    except (zipfile.BadZipFile, OSError) as e:
+        logger.warning(f"Can't read '{archive_path}': {e}")
+        return []
+
+
+def split_archive_path(path: str) -> tuple[str, str] | None:
+    """
+    Splits the path of a page inside an archive (e.g. "chapter.cbz/001.jpg") into the archive's path and the page's name in it.
+    Returns None for a path that isn't inside an archive.
+    """
+    if os.path.exists(path):
+        return None
+
+    lowered = path.lower()
+    for extension in archive_extensions:
+        start = lowered.find(extension)
+        while start != -1:
+            end = start + len(extension)
+            if end < len(path) and path[end] in ("/", os.sep) and os.path.isfile(path[:end]):
+                return path[:end], path[end + 1:].replace(os.sep, "/")
+            start = lowered.find(extension, end)
+    return None
+
+
+def open_image_file(path: str) -> str | io.BytesIO:
+    """Returns what to open a page from: its path, or for a page inside an archive, the page read straight from the archive."""
+    parts = split_archive_path(path)
+    if parts is None:
+        return path
+
+    archive_path, name = parts
+    with zipfile.ZipFile(archive_path) as archive:
+        return io.BytesIO(archive.read(name))
+
+
+def read_file(path: str) -> bytes:
+    """Reads a file, also inside an archive."""
+    parts = split_archive_path(path)
+    if parts is None:
+        with open(path, "rb") as f:
+            return f.read()
+
+    archive_path, name = parts
+    with zipfile.ZipFile(archive_path) as archive:
+        return archive.read(name)
+
+
+def image_exists(path: str) -> bool:
+    """Checks if a page exists, in a folder or inside an archive."""
+    if os.path.exists(path):
+        return True
+
+    parts = split_archive_path(path)
+    if parts is None:
+        return False
+
+    try:
+        with zipfile.ZipFile(parts[0]) as archive:
+            archive.getinfo(parts[1])
+        return True
+    except (KeyError, zipfile.BadZipFile, OSError):
+        return False
+
+
+class ArchiveWriter:
+    """
+    Packs a chapter's output into one .cbz instead of a file per image, from a background thread,
+    so encoding & writing an image overlaps with overlaying the next one.
+
+    Images are already compressed, so they're stored without compression. The archive is written to a
+    temporary file and only renamed to its final name by close(), so an unfinished archive never looks done.
+    Encoded members are appended and synced to disk sync_every at a time, and the rest when the writer stops,
+    since every append rewrites the central directory. The temporary archive is left readable after each of those,
+    so with resume, an interrupted chapter carries on with the members it already has instead of starting a new archive.
+    """
+
+    def __init__(self, archive_path: str, queue_size: int = 2, resume: bool = False, sync_every: int = 8):
+        self.path = archive_path
+        self.sync_every = sync_every
+        self.temp_path = os.path.join(os.path.dirname(archive_path), f".{os.path.basename(archive_path)}.tmp")
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.members = set()
+
+        os.makedirs(os.path.dirname(os.path.abspath(archive_path)), exist_ok=True)
+        if resume and os.path.exists(self.temp_path):
+            try:
+                with zipfile.ZipFile(self.temp_path) as archive:
+                    self.members = set(archive.namelist())
+            except (zipfile.BadZipFile, OSError):
+                # Cut off in the middle of a member, so none of them can be read
+                logger.warning(f"Can't resume '{self.temp_path}'. Starting a new archive...")
+                resume = False
+        if not (resume and self.members):
+            zipfile.ZipFile(self.temp_path, "w").close()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        pending = [] # (name, encoded data, done) not in the archive yet
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error:
+                continue
+
+            name, data, done = item
+            try:
+                if isinstance(data, Image.Image):
+                    # Encode here rather than on the caller's thread, then let go of the image
+                    buffer = io.BytesIO()
+                    data.save(buffer, format=Image.registered_extensions()[os.path.splitext(name)[1].lower()], quality=100)
+                    data.close()
+                    data = buffer.getvalue()
+                elif isinstance(data, str):
+                    data = read_file(data)
+
+                pending.append((name, data, done))
+                if len(pending) >= self.sync_every:
+                    self._write(pending)
+                    pending = []
+            except Exception as e:
+                self.error = e
+
+        # Also on abort, so a resumed chapter keeps the members that were already encoded
+        if pending and not self.error:
+            try:
+                self._write(pending)
+            except Exception as e:
+                self.error = e
+
+    def _write(self, members: list[tuple[str, bytes, object]]):
+        # Appending rewrites the central directory, so the archive can be read up to these members if the run stops
+        with open(self.temp_path, "r+b") as f:
+            with zipfile.ZipFile(f, "a", zipfile.ZIP_STORED) as archive:
+                for name, data, done in members:
+                    archive.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Only report members once they're on disk, e.g. for the checkpoint to skip them
+        for name, data, done in members:
+            self.members.add(name)
+            if done:
+                done()
+
+    def has(self, name: str) -> bool:
+        """Checks if a member is already in the archive, e.g. from the interrupted run it resumed."""
+        return name in self.members
+
+    def add(self, name: str, data: object, done=None):
+        """
+        Queues a member: a PIL image (encoded by its extension & closed once written), the path of a file, or bytes.
+        done() is called once it's synced to disk. Waits while the queue is full, so finished images don't pile up in memory.
+        """
+        if self.error:
+            raise self.error
+        self.queue.put((name, data, done))
+
+    def close(self):
+        """Writes the queued members and moves the archive to its final name."""
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.error:
+            os.remove(self.temp_path)
+            raise self.error
+
+        os.replace(self.temp_path, self.path)
+        logger.success(f"Packed the translated images into '{self.path}'.")
+
+    def abort(self, keep: bool = False):
+        """Stops writing. The unfinished archive is removed, unless keep, so the chapter can resume from it."""
+        self.queue.put(None)
+        self.thread.join()
+        if not keep and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
@@ -0,0 +1,94 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from loguru import logger
+from colorama import Fore, init
+
+from app.core.result import NumpyEncoder
+from app.core.metrics import metrics
+
+
+init(autoreset=True)
+
+
+class ChapterCheckpoint:
+    """
+    Saves the finished units of a chapter (detections, OCR chunks, translations & output images)
+    to output_dir/.checkpoint, so a chapter interrupted halfway resumes from its last finished unit.
+
+    Every unit is written to a temporary file first and then renamed, so a killed process never leaves
+    a half-written unit behind. A checkpoint is only resumed if the chapter's images and the settings
+    it was made with haven't changed, and it's removed once the chapter is done.
+    """
+
+    def __init__(self, output_dir: str, key: dict, enabled: bool = True):
+        self.path = os.path.join(output_dir, ".checkpoint")
+        self.key = hashlib.sha1(json.dumps(key, sort_keys=True, cls=NumpyEncoder).encode("utf-8")).hexdigest()
+        self.enabled = enabled
+        self.resumed = False
+
+        key_path = os.path.join(self.path, "key")
+        if enabled and os.path.exists(key_path):
+            with open(key_path, "r", encoding="utf-8") as f:
+                self.resumed = f.read() == self.key
+
+    def exists(self) -> bool:
+        """Returns whether the chapter has an unfinished run, so its partial outputs aren't mistaken for finished ones."""
+        return self.enabled and os.path.isdir(self.path)
+
+    def start(self):
+        """Resumes the unfinished run, or starts a new checkpoint if there's none or it doesn't match anymore."""
+        if not self.enabled:
+            return
+
+        if self.resumed:
+            logger.info(Fore.GREEN + f"- Found an unfinished run. RESUMING...")
+            return
+
+        if self.exists():
+            logger.info(f"- Images or settings changed since the unfinished run. Starting over...")
+            self.clear()
+
+        os.makedirs(self.path, exist_ok=True)
+        self.write("key", self.key)
+
+    def write(self, name: str, text: str):
+        path = os.path.join(self.path, name)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def save(self, name: str, data: object):
+        """Saves a finished unit."""
+        if self.enabled:
+            self.write(f"{name}.json", json.dumps(data, cls=NumpyEncoder, ensure_ascii=False))
+
+    def load(self, name: str) -> object | None:
+        """Returns a finished unit, or None if it isn't finished yet."""
+        if not self.resumed:
+            return None
+
+        path = os.path.join(self.path, f"{name}.json")
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        # Convert bounding boxes back to NumPy arrays
+        if isinstance(data, list):
+            for item in data:
+                if isinstance(item, dict) and "box" in item:
+                    item["box"] = np.array(item["box"], dtype=np.int32)
+
+        metrics.count("resumed_units")
+        return data
+
+    def clear(self):
+        """Removes the checkpoint once the chapter is done."""
+        shutil.rmtree(self.path, ignore_errors=True)
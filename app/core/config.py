@@ -14,3 +14,14 @@ def load_config(config_file_path):
         raise json.JSONDecodeError(f"Error: Invalid JSON format in '{config_file_path}'!")
 
 
+def merge_config(config: dict, overrides: dict) -> dict:
+    """
+    Returns a copy of config with overrides applied, merging nested sections key by key.
+    """
+    merged = dict(config)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
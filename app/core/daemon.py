@@ -0,0 +1,262 @@
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import threading
+from loguru import logger
+from datetime import datetime
+from colorama import Fore, Style, init
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from _version import __version__
+from app.core.config import merge_config
+from app.core.metrics import metrics
+
+
+init(autoreset=True)
+
+ansi_pattern = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class Job:
+    def __init__(self, input_path: str, output_path: str, overwrite: bool, load_json: bool, overrides: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.input_path = input_path
+        self.output_path = output_path
+        self.overwrite = overwrite
+        self.load_json = load_json
+        self.overrides = overrides
+        self.status = "queued"
+        self.submitted = datetime.now().isoformat(timespec="seconds")
+        self.started = None
+        self.finished = None
+        self.started_time = None
+        self.elapsed = None
+        self.chapters_done = 0
+        self.chapters_total = None
+        self.chapter = None
+        self.chapters = []
+        self.error = None
+
+    def update_progress(self, done: int, total: int, chapter: str | None):
+        self.chapters_done = done
+        self.chapters_total = total
+        self.chapter = chapter
+
+    def to_dict(self) -> dict:
+        running = self.status == "running"
+        totals = {}
+        for chapter in self.chapters:
+            for name, stage in chapter["stages"].items():
+                totals[name] = round(totals.get(name, 0) + stage["wall_s"], 4)
+
+        return {
+            "id": self.id,
+            "status": self.status,
+            "input": self.input_path,
+            "output": self.output_path,
+            "overrides": self.overrides,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "elapsed_s": round(time.perf_counter() - self.started_time, 3) if running else self.elapsed,
+            "progress": {
+                "chapters_done": self.chapters_done,
+                "chapters_total": self.chapters_total,
+                "chapter": self.chapter,
+                "stage": metrics.current_stage if running else None,
+            },
+            "stage_totals_s": totals,
+            "chapters": self.chapters,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    Runs submitted jobs one at a time with the same Pipeline, so its models stay loaded.
+    Each job is run with config.json plus its own overrides.
+    """
+
+    def __init__(self, pipeline: object, config: dict, history: int = 100):
+        self.pipeline = pipeline
+        self.config = config
+        self.history = history
+        self.jobs = {}
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, request: dict) -> Job:
+        input_path = request.get("input")
+        if not input_path or not os.path.isdir(input_path):
+            raise ValueError(f"Input folder '{input_path}' does not exist!")
+
+        overrides = request.get("config") or {}
+        if not isinstance(overrides, dict):
+            raise ValueError("'config' must be an object with the config.json sections to override.")
+
+        job = Job(
+            input_path,
+            request.get("output") or f"{input_path}-shitted",
+            bool(request.get("overwrite", False)),
+            bool(request.get("load_json", False)),
+            overrides,
+        )
+
+        with self.lock:
+            self.jobs[job.id] = job
+            self.prune()
+        self.queue.put(job)
+
+        logger.info(Fore.CYAN + f"\nJob {job.id} queued: '{job.input_path}'")
+        return job
+
+    def prune(self):
+        # Forget the oldest finished jobs beyond history
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in ("done", "failed", "cancelled")]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels a job that hasn't started yet."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job.status != "queued":
+                return False
+            job.status = "cancelled"
+            job.finished = datetime.now().isoformat(timespec="seconds")
+            return True
+
+    def position(self, job: Job) -> int:
+        """Returns how many queued jobs will run before this one, counting itself."""
+        with self.lock:
+            position = 0
+            for queued in self.jobs.values():
+                position += queued.status == "queued"
+                if queued is job:
+                    return position
+            return 0
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job.status == "cancelled":
+                continue
+
+            job.status = "running"
+            job.started = datetime.now().isoformat(timespec="seconds")
+            job.started_time = time.perf_counter()
+            logger.info(Style.BRIGHT + Fore.CYAN + f"\nJob {job.id} started: '{job.input_path}'")
+
+            try:
+                self.pipeline.configure(merge_config(self.config, job.overrides))
+                job.chapters = self.pipeline.translate_folder(job.input_path, job.output_path, job.overwrite, job.load_json, job.update_progress)
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = ansi_pattern.sub("", f"{type(e).__name__}: {e}")
+                logger.opt(exception=e).error(Fore.RED + f"\nJob {job.id} failed!")
+
+            job.elapsed = round(time.perf_counter() - job.started_time, 3)
+            job.finished = datetime.now().isoformat(timespec="seconds")
+            logger.info(Style.BRIGHT + Fore.CYAN + f"\nJob {job.id} {job.status} in {job.elapsed:.1f}s.")
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    jobs: JobQueue = None
+
+    def log_message(self, format, *args):
+        logger.trace(f"[daemon] {self.address_string()} {format % args}")
+
+    def send_json(self, status: int, data: dict | list):
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_job_id(self) -> str | None:
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)/?", self.path)
+        return match.group(1) if match else None
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+
+        if path == "/health":
+            jobs = self.jobs.list()
+            self.send_json(200, {
+                "status": "ok",
+                "version": __version__,
+                "models": list(self.jobs.pipeline.models),
+                "queued": sum(1 for job in jobs if job.status == "queued"),
+                "running": next((job.id for job in jobs if job.status == "running"), None),
+            })
+        elif path == "/jobs":
+            self.send_json(200, [job.to_dict() for job in self.jobs.list()])
+        elif job_id := self.get_job_id():
+            job = self.jobs.get(job_id)
+            if job:
+                self.send_json(200, job.to_dict())
+            else:
+                self.send_json(404, {"error": f"Job '{job_id}' not found."})
+        else:
+            self.send_json(404, {"error": f"Unknown path '{self.path}'."})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self.send_json(404, {"error": f"Unknown path '{self.path}'."})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("Request body must be a JSON object.")
+            job = self.jobs.submit(request)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        self.send_json(202, {**job.to_dict(), "position": self.jobs.position(job)})
+
+    def do_DELETE(self):
+        job_id = self.get_job_id()
+        job = self.jobs.get(job_id) if job_id else None
+
+        if not job:
+            self.send_json(404, {"error": f"Job '{job_id}' not found."})
+        elif self.jobs.cancel(job_id):
+            self.send_json(200, job.to_dict())
+        else:
+            self.send_json(409, {"error": f"Job '{job_id}' is {job.status} and can't be cancelled."})
+
+
+def serve(pipeline: object, config: dict, host: str = "127.0.0.1", port: int = 8765):
+    """Accepts jobs over HTTP and runs them with the already loaded pipeline until interrupted."""
+    handler = type("ConfiguredDaemonHandler", (DaemonHandler,), {"jobs": JobQueue(pipeline, config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    if host not in ("127.0.0.1", "localhost", "::1"):
+        logger.warning(Fore.YELLOW + f"Listening on '{host}'. Anyone who can reach it can translate any folder this machine can read.")
+
+    logger.success(Style.BRIGHT + Fore.GREEN + f"\nListening on http://{host}:{server.server_address[1]}. Submit jobs with POST /jobs.")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("\nStopping...")
+    finally:
+        server.server_close()
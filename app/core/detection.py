@@ -1,16 +1,24 @@
 import os
+import json
+import time
 import threading
 import numpy as np
 from PIL import Image
 from tqdm import tqdm
-import onnxruntime as ort
 from loguru import logger
 from colorama import init, Fore
 from concurrent.futures import ThreadPoolExecutor
 
+from app.core.lazy import LazyModule
 from app.core.model import download_repo_snapshot
+from app.core.image_utils_pil import fill_tile_batch, generate_tiles, image_to_array, iter_tile_batches, plan_axis, plan_detection_tiles, plan_tiles, save_debug_tiles
+from app.core.prefetch import prefetch
+from app.core.resources import budget
+from app.core.quantization import get_quantized_model_path, quantize_detector, resolve_quantization_method
 
 
+ort = LazyModule("onnxruntime")
+
 init(autoreset=True)
 lock = threading.Lock()
 
@@ -24,6 +32,14 @@ def get_bbox_coords(points: list[list]):
     return min_x, min_y, max_x, max_y, center_y
 
 
+def preprocess_tile(image: object) -> np.ndarray:
+    """Converts an RGB tile to the model's normalized NCHW float32 input."""
+    image_np = np.asarray(image)
+    batch = np.empty((1, 3, *image_np.shape[:2]), dtype=np.float32)
+    fill_tile_batch([{"image": image_np}], batch)
+    return batch
+
+
 class TextAreaDetection:
     """
     A class to handle text area detection.
@@ -33,9 +49,13 @@ class TextAreaDetection:
     :return: A list of dictionary containing bounding boxes among others.
     """
 
-    def __init__(self, confidence_threshold: float, use_gpu: bool):
+    def __init__(self, confidence_threshold: float, use_gpu: bool, session_config: dict | None = None, precision: str = "fp32", quantization: list | None = None):
         """
         Initializes detection model.
+
+        :param session_config: ONNX Runtime session settings (DETECTION.session in config.json).
+        :param precision: "fp32" or "int8".
+        :param quantization: [method, calibration_dir, calibration_tiles, DETECTION.tile] for "int8".
         """
         logger.info(f"Initializing detection model...")
 
@@ -48,6 +68,21 @@ class TextAreaDetection:
         if not os.path.exists(self.model_path):
             download_repo_snapshot(repo_id=self.repo_id, local_dir=self.snapshot_path)
 
+        # Use the INT8 copy of the model, quantizing it on first run
+        self.precision = precision
+        if precision == "int8":
+            method, calibration_dir, calibration_tiles, tile = quantization or ["dynamic", None, 32, {"width": "original", "height": "tile_width", "overlap": 0.5}]
+            # Resolve the fallback first, so a dynamic model is never kept under the static one's name
+            method = resolve_quantization_method(method, calibration_dir)
+            quantized_model_path = get_quantized_model_path(self.snapshot_path, self.file_name, method, [calibration_dir, calibration_tiles, tile])
+
+            if not os.path.exists(quantized_model_path):
+                quantize_detector(self.model_path, quantized_model_path, method, [calibration_dir, calibration_tiles, tile, 640])
+
+            self.model_path = quantized_model_path
+        elif precision != "fp32":
+            raise ValueError(Fore.RED + f"Unknown detection precision '{precision}'! Use \"fp32\" or \"int8\".")
+
         self.confidence_threshold = confidence_threshold
 
         self.classes = {0: "bubble", 1: "text_bubble", 2: "text_free"}
@@ -64,20 +99,17 @@ class TextAreaDetection:
         else:
             self.providers = ["CPUExecutionProvider"]
 
+        session_config = session_config or {}
+
         # Define the number of threads
-        self.num_threads = int(os.cpu_count() / 2) or 1
+        self.num_threads = max(1, budget.cpus // 2)
 
-        session_options = ort.SessionOptions()
-        session_options.inter_op_num_threads = (
-            self.num_threads
-        )  # For parallel model execution
-        session_options.intra_op_num_threads = (
-            self.num_threads
-        )  # For parallel computation inside each operator
-
-        self.session = ort.InferenceSession(
-            self.model_path, sess_options=session_options, providers=self.providers
-        )
+        # Choose sequential/parallel execution and thread counts
+        profile = session_config.get("profile", "auto")
+        if profile == "auto":
+            profile = self.choose_session_profile(session_config)
+
+        self.session = self.create_session(profile, session_config)
 
         if not self.session:
             raise Exception(Fore.RED + "Failed to initialize detection model!")
@@ -87,6 +119,139 @@ class TextAreaDetection:
 
         logger.info("Detection model initialized.\n")
 
+    def build_session_options(self, profile: str, session_config: dict) -> object:
+        """Builds ORT session options for the "sequential" or "parallel" profile."""
+        cpu_count = budget.cpus
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session_options.enable_cpu_mem_arena = session_config.get("memory_arena", True)
+        session_options.enable_mem_pattern = session_config.get("memory_arena", True)
+
+        if profile == "parallel":
+            # Run independent graph branches concurrently and split the cores between them
+            session_options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+            inter_threads = session_config.get("inter_op_threads") or max(1, min(2, cpu_count // 4))
+            intra_threads = session_config.get("intra_op_threads") or max(1, cpu_count // inter_threads)
+        elif profile == "sequential":
+            # Run operators one by one and give every operator all the cores
+            session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            inter_threads = session_config.get("inter_op_threads") or 1
+            intra_threads = session_config.get("intra_op_threads") or cpu_count
+        else:
+            raise ValueError(Fore.RED + f"Unknown session profile '{profile}'! Use \"auto\", \"sequential\", or \"parallel\".")
+
+        session_options.inter_op_num_threads = inter_threads # For parallel model execution
+        session_options.intra_op_num_threads = intra_threads # For parallel computation inside each operator
+
+        return session_options
+
+    def get_optimized_model_path(self) -> str:
+        """Path of the cached optimized graph. It depends on the ORT version and the execution provider."""
+        device = "cpu" if self.providers[0] == "CPUExecutionProvider" else "gpu"
+        base_name = os.path.splitext(os.path.basename(self.model_path))[0]
+        return f"{self.snapshot_path}/optimized/{base_name}-ort{ort.__version__}-{device}.onnx"
+
+    def save_optimized_model(self, session_config: dict) -> str | None:
+        """
+        Saves the optimized graph on first run and returns its path, or None if it isn't cached.
+        It's written before any session is timed, so every profile runs on the same graph.
+        """
+        # Only CPU graphs are cached because some GPU providers can't serialize their fused nodes
+        if not session_config.get("save_optimized_model", True) or self.providers[0] != "CPUExecutionProvider":
+            return None
+
+        optimized_model_path = self.get_optimized_model_path()
+        if os.path.exists(optimized_model_path):
+            return optimized_model_path
+
+        os.makedirs(os.path.dirname(optimized_model_path), exist_ok=True)
+        temp_path = f"{optimized_model_path}.tmp"
+
+        # Extended (not layout) optimizations keep the saved graph portable between CPUs
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        session_options.optimized_model_filepath = temp_path
+        ort.InferenceSession(self.model_path, sess_options=session_options, providers=self.providers)
+        os.replace(temp_path, optimized_model_path)
+
+        logger.info(f"Optimized detection model saved to '{optimized_model_path}'.")
+        return optimized_model_path
+
+    def create_session(self, profile: str, session_config: dict, quiet: bool = False) -> object:
+        """Creates an inference session from the saved optimized graph if it's cached, or from the model."""
+        session_options = self.build_session_options(profile, session_config)
+        model_path = self.save_optimized_model(session_config)
+
+        if model_path:
+            # Already optimized, so don't spend the startup optimizing it again
+            session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        else:
+            model_path = self.model_path
+
+        session = ort.InferenceSession(
+            model_path, sess_options=session_options, providers=self.providers
+        )
+
+        if not quiet:
+            logger.info(f"Detection session profile: {profile} (inter-op: {session_options.inter_op_num_threads}, intra-op: {session_options.intra_op_num_threads})")
+
+        return session
+
+    def choose_session_profile(self, session_config: dict) -> str:
+        """
+        Picks the session profile for this host: by a short micro-benchmark on first run (cached in the model folder), or by core count.
+        """
+        cpu_count = budget.cpus
+
+        if not session_config.get("benchmark", True):
+            # Parallel execution only pays off when there are enough cores to split
+            return "parallel" if cpu_count >= 8 else "sequential"
+
+        profile_path = f"{self.snapshot_path}/optimized/session_profile.json"
+        host_key = f"ort{ort.__version__}-{self.providers[0]}-{cpu_count}cpu-{self.precision}"
+
+        profiles = {}
+        if os.path.exists(profile_path):
+            with open(profile_path, "r", encoding="utf-8") as f:
+                profiles = json.load(f)
+            if host_key in profiles:
+                return profiles[host_key]["profile"]
+
+        logger.info("Benchmarking detection session profiles...")
+
+        # Random noise behaves more like a real tile than an all-zero input
+        sample = np.random.default_rng(0).random((1, 3, 640, 640), dtype=np.float32)
+        target_sizes = np.array([[640, 640]], dtype=np.int64)
+
+        # Both profiles are timed on the saved graph, as it's what later runs load
+        self.save_optimized_model(session_config)
+
+        timings = {}
+        for profile in ("sequential", "parallel"):
+            session = self.create_session(profile, session_config, quiet=True)
+            output_names = [out.name for out in session.get_outputs()]
+            inputs = {"images": sample, "orig_target_sizes": target_sizes}
+
+            # Warm up once, then keep the best of a few runs
+            session.run(output_names, inputs)
+            runs = []
+            for _ in range(3):
+                start = time.perf_counter()
+                session.run(output_names, inputs)
+                runs.append(time.perf_counter() - start)
+            timings[profile] = min(runs)
+            logger.info(f"- {profile}: {timings[profile] * 1000:.1f} ms/tile")
+
+        best_profile = min(timings, key=timings.get)
+
+        profiles[host_key] = {"profile": best_profile, "ms_per_tile": {k: round(v * 1000, 2) for k, v in timings.items()}}
+        os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+        with open(profile_path, "w", encoding="utf-8") as f:
+            json.dump(profiles, f, indent=4)
+
+        return best_profile
+
     def detect_text_areas(
         self,
         image_name: str,
@@ -98,29 +263,19 @@ class TextAreaDetection:
     ) -> list[dict]:
         """Runs detection on each tile and adjusts coordinates to original image space."""
 
-        result_list = []
-
         # with lock:
         if image_tiled:
-            slice_img_np = np.array(slice["image"])
-            top_offset = slice["top_offset"]
-            left_offset = slice["left_offset"]
-            scale_x = slice["scale_x"]
-            scale_y = slice["scale_y"]
+            slice_img_np = np.asarray(slice["image"])
+            offsets = [slice["top_offset"], slice["left_offset"], slice["scale_x"], slice["scale_y"]]
         else:
             logger.info(
                 f"Detecting text areas with ogkalu/comic-text-and-bubble-detector.onnx..."
             )
 
-            slice_img_np = np.array(slice)
-            top_offset = 0
-            left_offset = 0
-            scale_x = 1
-            scale_y = 1
+            slice_img_np = np.asarray(slice)
+            offsets = [0, 0, 1, 1]
 
-        slice_float32 = slice_img_np.astype(np.float32) / 255.0
-        slice_transposed = slice_float32.transpose(2, 0, 1)
-        slice_batchd = np.expand_dims(slice_transposed, axis=0)
+        slice_batchd = preprocess_tile(slice_img_np)
         # Run inference
         results = self.session.run(
             self.output_names,
@@ -139,56 +294,231 @@ class TextAreaDetection:
         if isinstance(boxes, np.ndarray) and boxes.ndim == 3 and boxes.shape[0] == 1:
             boxes = boxes[0]
 
-        if results:
-            n = 0
-            for lab, box, scr in zip(labels, boxes, scores):
-                # Filter out lower confidence
-                if float(scr) < float(self.confidence_threshold):
-                    continue
-                # Skip bubble only detections
-                if lab == 0:
-                    continue
-                label_name = self.classes[lab]
-                # Convert bbox to four-corner coordinates
-                xmin, ymin, xmax, ymax = box
-
-                top_left = [xmin, ymin]
-                top_right = [xmax, ymin]
-                bottom_right = [xmax, ymax]
-                bottom_left = [xmin, ymax]
-
-                corners = [top_left, top_right, bottom_right, bottom_left]
-
-                # Adjust coordinates back to the original slice size (inverse scaling) and then to the original full image coordinate system (offsets)
-                adjusted_points = [
-                    [
-                        (int(p[0]) * scale_x) + left_offset,
-                        (int(p[1]) * scale_y) + top_offset,
-                    ]
-                    for p in corners
+        return self.parse_detections(labels, boxes, scores, offsets, image_name, number, log_level)
+
+    def parse_detections(
+        self,
+        labels: np.ndarray,
+        boxes: np.ndarray,
+        scores: np.ndarray,
+        offsets: list[int | float],
+        image_name: str,
+        number: int,
+        log_level: str,
+        confidence_threshold: float | None = None,
+    ) -> list[dict]:
+        """Filters one tile's model outputs and maps the boxes back to the original image space."""
+
+        result_list = []
+        top_offset, left_offset, scale_x, scale_y = offsets
+        confidence_threshold = self.confidence_threshold if confidence_threshold is None else confidence_threshold
+
+        for lab, box, scr in zip(labels, boxes, scores):
+            # Filter out lower confidence
+            if float(scr) < float(confidence_threshold):
+                continue
+            # Skip bubble only detections
+            if lab == 0:
+                continue
+            label_name = self.classes[lab]
+            # Convert bbox to four-corner coordinates
+            xmin, ymin, xmax, ymax = box
+
+            top_left = [xmin, ymin]
+            top_right = [xmax, ymin]
+            bottom_right = [xmax, ymax]
+            bottom_left = [xmin, ymax]
+
+            corners = [top_left, top_right, bottom_right, bottom_left]
+
+            # Adjust coordinates back to the original slice size (inverse scaling) and then to the original full image coordinate system (offsets)
+            adjusted_points = [
+                [
+                    (int(p[0]) * scale_x) + left_offset,
+                    (int(p[1]) * scale_y) + top_offset,
                 ]
+                for p in corners
+            ]
 
-                _, _, _, _, center_y = get_bbox_coords(adjusted_points)
+            _, _, _, _, center_y = get_bbox_coords(adjusted_points)
 
-                result = {
-                    "box": np.array(adjusted_points, dtype=np.int32),
-                    "confidence": float(scr),
-                    "original_text": "",
-                    "text_confidence": 0,
-                    "translated_text": "",
-                    "center_y": center_y,
-                    "image_name": image_name,
-                    "number": number,
-                }
+            result = {
+                "box": np.array(adjusted_points, dtype=np.int32),
+                "confidence": float(scr),
+                "original_text": "",
+                "text_confidence": 0,
+                "translated_text": "",
+                "center_y": center_y,
+                "image_name": image_name,
+                "number": number,
+            }
 
-                if log_level == "TRACE":
-                    logger.info(f"({scr:.2f}) {label_name} {adjusted_points}")
-                n += 1
+            if log_level == "TRACE":
+                logger.info(f"({scr:.2f}) {label_name} {adjusted_points}")
 
-                result_list.append(result)
+            result_list.append(result)
 
         return result_list
 
+    def get_batch_size(self, batch_size: int) -> int:
+        """Models exported with a fixed batch dimension can only take that many tiles at once."""
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        if isinstance(batch_dim, int) and batch_dim > 0:
+            return batch_dim
+        return batch_size
+
+    def detect_tiles(
+        self,
+        image_name: str,
+        tiles: list[dict] | object,
+        target_sizes: list[int],
+        log_level: str,
+        batch_size: int = 1,
+        confidence_threshold: float | None = None,
+        total: int | None = None,
+        prefetch_depth: int = 2,
+    ) -> list[dict]:
+        """
+        Runs detection on all tiles of one image, batch_size tiles per inference.
+
+        Tiles can be a list or an iterator (e.g. generate_tiles). Batching runs in a background thread with up to
+        prefetch_depth batches ready, so the next batch is tiled while the current one is in the model.
+
+        :param total: Number of tile positions for the progress bar, if tiles is an iterator.
+        """
+
+        logger.info(f"\nDetecting text areas with ogkalu/comic-text-and-bubble-detector.onnx...")
+
+        if total is None:
+            total = len(tiles)
+
+        batches = iter_tile_batches(tiles, self.get_batch_size(batch_size), target_sizes[0], prefetch_depth)
+        if prefetch_depth > 0:
+            batches = prefetch(batches, prefetch_depth)
+
+        detections = []
+        number = 0
+        with tqdm(total=total) as progress:
+            for batch, batch_tiles in batches:
+                n = len(batch_tiles)
+
+                results = self.session.run(
+                    self.output_names,
+                    {
+                        "images": batch,
+                        "orig_target_sizes": np.array([target_sizes] * n, dtype=np.int64),
+                    },
+                )
+                labels, boxes, scores = results[:3]
+
+                for i, slice in enumerate(batch_tiles):
+                    offsets = [slice["top_offset"], slice["left_offset"], slice["scale_x"], slice["scale_y"]]
+                    detections.extend(self.parse_detections(labels[i], boxes[i], scores[i], offsets, image_name, number, log_level, confidence_threshold))
+                    number += 1
+
+                # Skipped blank tiles count as done too
+                progress.update(batch_tiles[-1].get("index", progress.n + n - 1) + 1 - progress.n)
+
+            progress.update(total - progress.n)
+
+        return detections
+
+    def detect_image(
+        self,
+        image_name: str,
+        number: int | str,
+        image: list[object | int],
+        tiling: list[dict | int],
+        output_dir: str,
+        log_level: str,
+    ) -> list[dict]:
+        """
+        Tiles one image as set in DETECTION.tile ("original", fixed, or adaptive size & overlap) and runs detection on the tiles.
+        With coarse-to-fine enabled, full-resolution tiles only go around the candidates from a downscaled pass.
+
+        :param tiling: [tile_config, coarse_config, target_size, batch_size].
+        """
+        img, width, height = image
+        tile_config, coarse_config, target_size, batch_size = tiling
+        resample = tile_config.get('resample', "bilinear")
+        blank_threshold = tile_config.get('blank_threshold', 0)
+
+        image_np = image_to_array(img)
+
+        tile_height, tile_width, overlap, positions = plan_detection_tiles(image_np, tile_config, target_size)
+
+        if coarse_config.get('enable', False):
+            positions = self.plan_fine_tiles(image_np, [tile_height, tile_width, overlap], tiling, log_level)
+
+        logger.info(f"\nTiling image into {len(positions)} tiles of {tile_width}x{tile_height} px...")
+
+        # Tiles are made on demand, so only the batches in the prefetch queue are in memory at once
+        image_slices = generate_tiles(image_np, positions, tile_height, tile_width, target_size, resample, blank_threshold)
+
+        # Save image tiles if debug mode is on
+        if log_level == "TRACE":
+            image_slices = save_debug_tiles(image_slices, number, output_dir)
+
+        return self.detect_tiles(image_name, image_slices, target_sizes=[target_size, target_size], log_level=log_level, batch_size=batch_size, total=len(positions))
+
+    def plan_fine_tiles(
+        self,
+        image_np: np.ndarray,
+        tile: list[int],
+        tiling: list[dict | int],
+        log_level: str,
+    ) -> list[tuple[int, int]]:
+        """
+        Runs a coarse detection pass on bigger (more downscaled) tiles with a lower confidence threshold,
+        then returns full-resolution tile positions covering only the rows around the candidates.
+        """
+        height, width = image_np.shape[:2]
+        tile_height, tile_width, overlap = tile
+        tile_config, coarse_config, target_size, batch_size = tiling
+
+        scale = coarse_config.get('scale', 0.5)
+        margin = coarse_config.get('margin', 64)
+        confidence_threshold = coarse_config.get('confidence_threshold', self.confidence_threshold / 2)
+
+        # Coarse tiles cover 1/scale times more rows (and columns, if the image is wide enough) each
+        coarse_height = min(height, int(tile_height / scale))
+        coarse_width = min(width, int(tile_width / scale))
+        coarse_overlap = int(coarse_height * tile_config['overlap'])
+        coarse_positions = plan_tiles(width, height, coarse_height, coarse_width, coarse_overlap)
+
+        logger.info(f"\nCoarse pass on {len(coarse_positions)} tiles of {coarse_width}x{coarse_height} px...")
+
+        coarse_tiles = generate_tiles(
+            image_np, coarse_positions, coarse_height, coarse_width, target_size, tile_config.get('resample', "bilinear"), tile_config.get('blank_threshold', 0)
+        )
+        candidates = self.detect_tiles("", coarse_tiles, [target_size, target_size], log_level, batch_size, confidence_threshold, total=len(coarse_positions))
+
+        # Merge the candidates' rows (plus margin) into bands
+        bands = []
+        for ymin, ymax in sorted((int(c["box"][0][1]) - margin, int(c["box"][2][1]) + margin) for c in candidates):
+            ymin, ymax = max(0, ymin), min(height, ymax)
+            if bands and ymin <= bands[-1][1]:
+                bands[-1][1] = max(bands[-1][1], ymax)
+            else:
+                bands.append([ymin, ymax])
+
+        # Cover every band with full-resolution tiles, centering the ones shorter than a tile
+        tops = []
+        for ymin, ymax in bands:
+            band_height = ymax - ymin
+            if band_height <= tile_height:
+                tops.append(max(0, min((ymin + ymax - tile_height) // 2, height - tile_height)))
+            else:
+                tops.extend(max(0, min(ymin + top, height - tile_height)) for top in plan_axis(band_height, tile_height, overlap))
+
+        lefts = plan_axis(width, tile_width, overlap)
+        positions = list(dict.fromkeys((left, top) for top in tops for left in lefts))
+
+        full_tiles = len(plan_tiles(width, height, tile_height, tile_width, overlap))
+        logger.info(f"Found {len(candidates)} candidates in {len(bands)} bands. Running {len(positions)}/{full_tiles} full-resolution tiles.")
+
+        return positions
+
     def batch_threaded(
         self,
         image_name: str,
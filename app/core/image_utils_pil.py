@@ -1,10 +1,55 @@
 import os
+import math
+import time
+import numpy as np
 from loguru import logger
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageDraw
+from app.core.metrics import metrics
+from app.core.storage import storage
 Image.MAX_IMAGE_PIXELS = None
 
 
+def decode_image(image_path: str, draft_width: int | None = None) -> object | None:
+    """
+    Opens and fully decodes an image, also inside an archive. With draft_width, JPEGs are decoded at 1/2, 1/4 or 1/8 of their size
+    (the smallest still at least draft_width wide) instead, and None is returned if the image can't be reduced.
+    """
+    img = Image.open(storage.open_page(image_path))
+
+    if draft_width:
+        if img.format != "JPEG" or img.width < draft_width * 2:
+            img.close()
+            return None
+        img.draft(None, (draft_width, max(1, round(img.height * draft_width / img.width))))
+
+    img.load()
+    return img
+
+
+def load_images(image_paths: list[str | None], workers: int, draft_width: int | None = None) -> tuple[list, list]:
+    """
+    Decodes images on a thread pool, since Pillow releases the GIL while decoding.
+    Paths that are None (e.g. pages restored from the page cache) are skipped and stay None.
+
+    :return: The full-resolution images and, with draft_width, reduced copies for detection (None where there's none).
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        images = [executor.submit(decode_image, path) if path else None for path in image_paths]
+        drafts = [executor.submit(decode_image, path, draft_width) if path and draft_width else None for path in image_paths]
+
+        return [future.result() if future else None for future in images], [future.result() if future else None for future in drafts]
+
+
+def scale_detections(detections: list[dict], scale_x: float, scale_y: float) -> list[dict]:
+    """Maps detections made on a reduced copy of an image back to the full-resolution image."""
+    for detection in detections:
+        detection["box"] = np.rint(detection["box"] * [scale_x, scale_y]).astype(np.int32)
+        detection["center_y"] = detection["center_y"] * scale_y
+    return detections
+
+
 def merge_images_vertically(images: list[object], output_dir: str, log_level: str):
     """
     Merges all images in each subfolder into a single image and saves it 
@@ -58,63 +103,265 @@ def merge_images_vertically(images: list[object], output_dir: str, log_level: st
     return final_image
 
 
-def slice_image_in_tiles(image: list[object|int], tile_height: int, tile_width: int, target_max_dim: int, overlap: int, number: int, output_dir:str, log_level:str) -> list[dict]:
+def get_resample_filter(name: str) -> int:
+    """Maps a filter name from config.json ("nearest", "box", "bilinear", "hamming", "bicubic", "lanczos") to Pillow's resampling filter."""
+    try:
+        return Image.Resampling[name.upper()]
+    except KeyError:
+        raise ValueError(f"Unknown resampling filter '{name}'!")
+
+
+def plan_axis(length: int, tile_size: int, overlap: int) -> list[int]:
+    """
+    Returns the start of every overlapping tile along one axis, clamped to the edge.
+    """
+    starts = []
+
+    stride = tile_size - overlap
+    if stride <= 0: stride = tile_size
+
+    for start in range(0, length, stride):
+        starts.append(max(0, min(start, length - tile_size)))
+        if start + tile_size >= length: break
+
+    return starts
+
+
+def plan_tiles(width: int, height: int, tile_height: int, tile_width: int, overlap: int) -> list[tuple[int, int]]:
+    """
+    Returns the (left, top) position of every overlapping tile (sliding window), clamped to the image edges.
+    """
+    lefts = plan_axis(width, tile_width, overlap)
+    return [(left, top) for top in plan_axis(height, tile_height, overlap) for left in lefts]
+
+
+def get_adaptive_tile_width(width: int, target_max_dim: int, max_downscale: float, overlap_ratio: float) -> int:
+    """
+    Picks the fewest tile columns that keep every tile within max_downscale of the detection input size,
+    and returns the tile width that makes those columns (with overlap) cover the image width.
+    """
+    columns = max(1, math.ceil(width / (target_max_dim * max_downscale)))
+    if columns == 1:
+        return width
+
+    # n tiles overlapping by overlap_ratio cover n*w - (n-1)*w*overlap_ratio pixels
+    return math.ceil(width / (columns - (columns - 1) * overlap_ratio))
+
+
+def find_gutter_rows(image_np: np.ndarray, blank_threshold: float, chunk_rows: int = 2048) -> np.ndarray:
+    """
+    Marks the rows that are plain across the whole image width (e.g. gutters between panels).
+    Text can't cross these rows, so tiles can be cut there without overlap.
+    """
+    height = image_np.shape[0]
+    gutter_rows = np.zeros(height, dtype=bool)
+
+    # Work in chunks so tall merged chapters don't need a full-size float copy
+    for start in range(0, height, chunk_rows):
+        rows = image_np[start:start + chunk_rows, ::2]
+        # Largest standard deviation of any channel, like is_blank_tile, so flat colored gutters count too
+        gutter_rows[start:start + chunk_rows] = rows.std(axis=1).reshape(len(rows), -1).max(axis=1) < blank_threshold
+
+    return gutter_rows
+
+
+def plan_tiles_adaptive(width: int, height: int, tile_height: int, tile_width: int, overlap: int, gutter_rows: np.ndarray) -> list[tuple[int, int]]:
+    """
+    Like plan_tiles, but starts each next row of tiles at the lowest gutter row within the overlap of the previous one.
+    The full overlap is only used where no gutter is found.
+    """
+    lefts = plan_axis(width, tile_width, overlap)
+
+    tops = []
+    top = 0
+    while True:
+        top = max(0, min(top, height - tile_height))
+        tops.append(top)
+
+        bottom = top + tile_height
+        if bottom >= height: break
+
+        # Any gutter row between the overlap start and the tile bottom is a safe cut
+        window_start = max(top + 1, bottom - overlap)
+        gutters = np.flatnonzero(gutter_rows[window_start:bottom + 1])
+        top = window_start + int(gutters[-1]) if gutters.size else bottom - overlap
+
+    return [(left, top) for top in tops for left in lefts]
+
+
+def plan_detection_tiles(image_np: np.ndarray, tile_config: dict, target_max_dim: int) -> tuple[int, int, int, list[tuple[int, int]]]:
+    """
+    Calculates the tile size, overlap, and tile positions of an image from DETECTION.tile in config.json.
+
+    :return: tile_height, tile_width, overlap in px, and (left, top) positions.
+    """
+    height, width = image_np.shape[:2]
+    overlap_ratio = tile_config['overlap']
+
+    if tile_config['width'] == "original":
+        tile_width = width
+    elif tile_config['width'] == "adaptive":
+        tile_width = get_adaptive_tile_width(width, target_max_dim, tile_config.get('max_downscale', 2), overlap_ratio)
+    else:
+        tile_width = tile_config['width']
+
+    tile_height = tile_width if tile_config['height'] == "tile_width" else tile_config['height']
+
+    overlap = int(tile_height * overlap_ratio)
+
+    if tile_config.get('adaptive_overlap', False):
+        gutter_rows = find_gutter_rows(image_np, tile_config.get('blank_threshold') or 2)
+        positions = plan_tiles_adaptive(width, height, tile_height, tile_width, overlap, gutter_rows)
+    else:
+        positions = plan_tiles(width, height, tile_height, tile_width, overlap)
+
+    return tile_height, tile_width, overlap, positions
+
+
+def is_blank_tile(tile_np: np.ndarray, blank_threshold: float) -> bool:
+    """
+    Checks if a tile is plain (e.g. white or flat-color gutter) by the standard deviation of its pixels,
+    per channel so a flat color doesn't count as varied. Every second pixel is enough to catch text strokes while keeping it cheap.
+    """
+    return float(tile_np[::2, ::2].std(axis=(0, 1)).max()) < blank_threshold
+
+
+def generate_tiles(image_np: np.ndarray, positions: list[tuple[int, int]], tile_height: int, tile_width: int, target_max_dim: int, resample: str = "bilinear", blank_threshold: float = 0):
+    """
+    Yields tiles of an RGB uint8 image as views, resizing only the ones that aren't target_max_dim x target_max_dim.
+    Tiles whose pixel standard deviation is below blank_threshold are skipped as they can't contain text.
+    """
+    resample_filter = get_resample_filter(resample)
+    skipped = 0
+
+    for index, (effective_left, effective_top) in enumerate(positions):
+        # Time only the work done here, not the consumer's between yields
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+
+        tile_np = image_np[effective_top:effective_top + tile_height, effective_left:effective_left + tile_width]
+
+        if blank_threshold and is_blank_tile(tile_np, blank_threshold):
+            skipped += 1
+            metrics.record("tile", time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+            continue
+
+        # Tiles at the right & bottom edges of a page smaller than a tile are padded with black to the full tile size,
+        # like a PIL crop past the image, so they're scaled the same way as the others instead of stretched
+        if tile_np.shape[0] < tile_height or tile_np.shape[1] < tile_width:
+            padded = np.zeros((tile_height, tile_width, *tile_np.shape[2:]), dtype=tile_np.dtype)
+            padded[:tile_np.shape[0], :tile_np.shape[1]] = tile_np
+            tile_np = padded
+
+        # Resize image if its size is not equal to target dimension for the detection model (640x640)
+        original_tile_h, original_tile_w = tile_np.shape[:2]
+        scale_x = 1
+        scale_y = 1
+
+        if original_tile_w != target_max_dim or original_tile_h != target_max_dim:
+            # Full-width tiles are contiguous, so Pillow wraps them without copying
+            resized = Image.fromarray(tile_np).resize((target_max_dim, target_max_dim), resample_filter)
+            tile_np = np.asarray(resized)
+
+            # Calculate scaling factors
+            scale_x = original_tile_w / target_max_dim
+            scale_y = original_tile_h / target_max_dim
+
+        metrics.record("tile", time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+        metrics.count("tiles")
+
+        yield {
+            'image': tile_np,
+            'index': index,
+            'top_offset': effective_top,
+            'left_offset': effective_left,
+            'scale_x': scale_x,
+            'scale_y': scale_y
+        }
+
+    if skipped:
+        logger.info(f"Skipped {skipped}/{len(positions)} blank tiles.")
+        metrics.count("blank_tiles", skipped)
+
+
+def image_to_array(image: object) -> np.ndarray:
+    """Converts a PIL image to an RGB uint8 array once, so tiles can be taken as views."""
+    if isinstance(image, np.ndarray):
+        return image
+    return np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+
+
+def slice_image_in_tiles(image: list[object|int], tile_height: int, tile_width: int, target_max_dim: int, overlap: int, number: int, output_dir:str, log_level:str, resample: str = "bilinear", blank_threshold: float = 0, positions: list[tuple[int, int]] | None = None) -> list[dict]:
     """
     Generates overlapping image tiles (sliding window) for OCR processing. 
     Resizes tiles to fit within target_max_dim while maintaining aspect ratio,
     and returns the scaling factors.
+
+    The image is converted to a NumPy array once and every tile is a view of it (or its resized copy).
+    Pass positions to use an already planned tile layout instead of the fixed sliding window.
     """
-    img_pil, width, height = image
-
-    tiles = []
-
-    stride_y = tile_height - overlap
-    stride_x = tile_width - overlap
-    if stride_y <= 0: stride_y = tile_height
-    if stride_x <= 0: stride_x = tile_width
-
-    for top in range(0, height, stride_y):
-        for left in range(0, width, stride_x):
-            effective_top = max(0, min(top, height - tile_height))
-            effective_left = max(0, min(left, width - tile_width))
-            box = (effective_left, effective_top, effective_left + tile_width, effective_top + tile_height)
-            cropped_img_pil = img_pil.crop(box)
-
-            # Resize image if its size is not equal to target dimension for the detection model (640x640)
-            original_tile_w, original_tile_h = cropped_img_pil.size
-            scale_x = 1
-            scale_y = 1
-
-            if original_tile_w != target_max_dim or original_tile_h != target_max_dim:
-                cropped_img_pil = cropped_img_pil.resize((target_max_dim, target_max_dim), Image.Resampling.LANCZOS)
-
-                # Calculate scaling factors
-                resized_tile_w, resized_tile_h = cropped_img_pil.size
-                scale_x = original_tile_w / resized_tile_w
-                scale_y = original_tile_h / resized_tile_h
-
-            tiles.append({
-                'image': cropped_img_pil, 
-                'top_offset': effective_top, 
-                # 'bottom_offset': effective_top + tile_height, 
-                'left_offset': effective_left,
-                # 'right_offset': effective_left + tile_width,
-                'scale_x': scale_x,
-                'scale_y': scale_y
-            })
-            if left + tile_width >= width: break
-        if top + tile_height >= height: break
+    img, width, height = image
+
+    image_np = image_to_array(img)
+
+    if positions is None:
+        positions = plan_tiles(width, height, tile_height, tile_width, overlap)
+    tiles = generate_tiles(image_np, positions, tile_height, tile_width, target_max_dim, resample, blank_threshold)
 
     # Save image tiles if debug mode is on
     if log_level == "TRACE":
-        output_path = f"{output_dir}/debug/tile"
-        os.makedirs(output_path, exist_ok=True)
-        for i, slice in enumerate(tiles):
-            image_slice = slice["image"]
-            save_path = f"{output_path}/tile{number}_{i:02d}.jpg"
-            image_slice.save(save_path, quality=100)
+        tiles = save_debug_tiles(tiles, number, output_dir)
+
+    return list(tiles)
+
+
+def save_debug_tiles(tiles, number: int | str, output_dir: str):
+    """Saves tiles as they pass through, for debug mode."""
+    output_path = f"{output_dir}/debug/tile"
+    os.makedirs(output_path, exist_ok=True)
+    for i, slice in enumerate(tiles):
+        image_slice = Image.fromarray(slice["image"])
+        save_path = f"{output_path}/tile{number}_{i:02d}.jpg"
+        image_slice.save(save_path, quality=100)
+        yield slice
+
+
+def fill_tile_batch(tiles: list[dict], batch: np.ndarray) -> int:
+    """
+    Writes tiles as normalized CHW float32 straight into a preallocated NCHW batch buffer.
+
+    :return: The number of tiles written.
+    """
+    for i, tile in enumerate(tiles):
+        # One pass per tile: uint8 HWC view -> float32 CHW slot, without temporary copies
+        np.multiply(tile["image"].transpose(2, 0, 1), np.float32(1 / 255), out=batch[i])
+
+    return len(tiles)
+
+
+def iter_tile_batches(tiles, batch_size: int, target_max_dim: int, depth: int = 2):
+    """
+    Groups tiles from an iterator into (NCHW float32 batch, tiles) pairs of up to batch_size tiles.
+
+    Batches are written into a ring of depth + 2 preallocated buffers, so that up to depth batches can wait in a prefetch queue
+    while one is being filled and one is being used for inference, without ever overwriting a batch still in use.
+    """
+    ring = [np.empty((batch_size, 3, target_max_dim, target_max_dim), dtype=np.float32) for _ in range(depth + 2)]
+    slot = 0
+
+    batch_tiles = []
+    for tile in tiles:
+        batch_tiles.append(tile)
+        if len(batch_tiles) == batch_size:
+            n = fill_tile_batch(batch_tiles, ring[slot])
+            yield ring[slot][:n], batch_tiles
+            slot = (slot + 1) % len(ring)
+            batch_tiles = []
+
+    if batch_tiles:
+        n = fill_tile_batch(batch_tiles, ring[slot])
+        yield ring[slot][:n], batch_tiles
 
-    return tiles
 
 def crop_out_box(box: list[int], image: object, upscale: list[bool|int|float], output_dir: str, crop_name: str, log_level: str) -> object:
     [xmin, ymin, xmax, ymax] = box
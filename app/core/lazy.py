@@ -0,0 +1,62 @@
+import sys
+import time
+import importlib
+from loguru import logger
+
+
+# Seconds spent importing each lazily imported module, in the order they were imported
+import_times = {}
+
+
+def import_module(name: str) -> object:
+    """Imports a module and records how long it took, if it wasn't imported yet."""
+    if name in sys.modules:
+        return sys.modules[name]
+
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    import_times[name] = time.perf_counter() - start
+
+    logger.trace(f"Imported {name} in {import_times[name]:.2f}s")
+    return module
+
+
+class LazyModule:
+    """
+    Stands in for a heavy module until one of its attributes is used, so it's only imported by the stages that need it.
+
+    Use `litellm = LazyModule("litellm")` in place of `import litellm`.
+    """
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self) -> object:
+        if self._module is None:
+            self.__dict__["_module"] = import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute: str, value):
+        setattr(self._load(), attribute, value)
+
+    def __delattr__(self, attribute: str):
+        delattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self._name}' ({'loaded' if self._module else 'not loaded'})>"
+
+
+def log_import_times(startup_seconds: float):
+    """Logs how long startup took and which heavy modules were imported later, slowest first."""
+    logger.debug(f"\nStartup imports: {startup_seconds:.2f}s")
+
+    if not import_times:
+        logger.debug("No heavy module was imported.")
+        return
+
+    for name, seconds in sorted(import_times.items(), key=lambda item: item[1], reverse=True):
+        logger.debug(f"- {name}: {seconds:.2f}s")
@@ -0,0 +1,281 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from loguru import logger
+from datetime import datetime
+from natsort import natsorted
+from colorama import Fore, Style, init
+
+from app.core.archive import ArchiveEntry, archive_extensions, is_archive, list_archive_images
+
+
+init(autoreset=True)
+
+ansi_pattern = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class LibraryIndex:
+    """
+    Remembers every folder of the library with its modification time, page count, a signature of its images
+    and how far each chapter got, so runs can find pending chapters without listing unchanged folders
+    or checking output folders.
+
+    Archives (.cbz/.zip) are chapters of their own, saved like folders without subfolders.
+    """
+
+    def __init__(self, db_path: str = "library.db"):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self._create_tables()
+
+    def _create_tables(self):
+        # Every folder is saved, with its parent, so unchanged folders don't need to be listed to find their subfolders
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chapters (
+                path TEXT PRIMARY KEY,
+                signature TEXT,
+                status TEXT,
+                error TEXT,
+                updated REAL
+            )
+        """)
+
+        # Columns added after the first version of the index
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(chapters)")}
+        for column, column_type in (("parent", "TEXT"), ("mtime_ns", "INTEGER"), ("page_count", "INTEGER DEFAULT 0")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE chapters ADD COLUMN {column} {column_type}")
+
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chapters_parent ON chapters (parent)
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS stages (
+                path TEXT,
+                stage TEXT,
+                updated REAL,
+                PRIMARY KEY (path, stage)
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, path: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT signature, status, error, updated, mtime_ns, page_count FROM chapters WHERE path = ?", (os.path.abspath(path),)
+            ).fetchone()
+        if not row:
+            return None
+        return {"signature": row[0], "status": row[1], "error": row[2], "updated": row[3], "mtime_ns": row[4], "page_count": row[5] or 0}
+
+    def get_children(self, path: str) -> list[str]:
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT path FROM chapters WHERE parent = ?", (os.path.abspath(path),))]
+
+    def is_done(self, path: str, signature: str) -> bool:
+        chapter = self.get(path)
+        return bool(chapter) and chapter["status"] == "done" and chapter["signature"] == signature
+
+    def mark(self, path: str, signature: str, status: str, error: str | None = None, page_count: int | None = None):
+        """Sets the status of a chapter. Its stages are cleared when it's pending again."""
+        path = os.path.abspath(path)
+        error = ansi_pattern.sub("", error) if error else None
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO chapters (path, signature, status, error, updated, page_count) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET signature = excluded.signature, status = excluded.status, error = excluded.error, "
+                "updated = excluded.updated, page_count = COALESCE(?, page_count)",
+                (path, signature, status, error, time.time(), page_count or 0, page_count)
+            )
+            if status == "pending":
+                self.conn.execute("DELETE FROM stages WHERE path = ?", (path,))
+            self.conn.commit()
+
+    def mark_stage(self, path: str, stage: str):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO stages (path, stage, updated) VALUES (?, ?, ?)", (os.path.abspath(path), stage, time.time()))
+            self.conn.commit()
+
+    def update_folder(self, path: str, parent: str | None, mtime_ns: int, images: list[os.DirEntry | ArchiveEntry]) -> str | None:
+        """Saves a listed folder and returns the signature of its images. A chapter whose images changed goes back to pending."""
+        path = os.path.abspath(path)
+        signature = get_chapter_signature(images) if images else None
+        chapter = self.get(path)
+
+        with self.lock:
+            if chapter is None:
+                self.conn.execute(
+                    "INSERT INTO chapters (path, parent, mtime_ns, page_count, signature, status, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (path, parent, mtime_ns, len(images), signature, "pending" if images else None, time.time())
+                )
+            elif chapter["signature"] != signature:
+                self.conn.execute(
+                    "UPDATE chapters SET parent = ?, mtime_ns = ?, page_count = ?, signature = ?, status = ?, error = NULL, updated = ? WHERE path = ?",
+                    (parent, mtime_ns, len(images), signature, "pending" if images else None, time.time(), path)
+                )
+                self.conn.execute("DELETE FROM stages WHERE path = ?", (path,))
+            else:
+                self.conn.execute("UPDATE chapters SET parent = ?, mtime_ns = ? WHERE path = ?", (parent, mtime_ns, path))
+
+        return signature
+
+    def remove_missing(self, path: str, children: set[str]):
+        """Forgets the subfolders of path (and everything under them) that are gone."""
+        for child in self.get_children(path):
+            if child not in children:
+                with self.lock:
+                    self.conn.execute("DELETE FROM chapters WHERE path = ? OR path LIKE ?", (child, child + os.sep + "%"))
+                    self.conn.execute("DELETE FROM stages WHERE path = ? OR path LIKE ?", (child, child + os.sep + "%"))
+
+    def scan(self, root: str, image_extensions: tuple[str], rescan: bool = False) -> list[tuple[str, list[str], str]]:
+        """
+        Returns the (folder or archive, image names, signature) of chapters under root that aren't done, in natural order.
+
+        Only folders whose modification time changed since the last scan are listed. The others are found
+        through the index, so a chapter that's done costs one stat. With rescan, every folder is listed.
+        """
+        root = os.path.abspath(root)
+        pending = []
+        stack = [(root, None)]
+
+        while stack:
+            path, parent = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+            chapter = self.get(path)
+            if chapter and chapter["mtime_ns"] == mtime_ns and not rescan:
+                stack.extend((child, path) for child in self.get_children(path))
+                if chapter["page_count"] and chapter["status"] != "done":
+                    images = list_images(path, image_extensions)
+                    pending.append((path, [entry.name for entry in images], get_chapter_signature(images)))
+                continue
+
+            # New or changed archive
+            if is_archive(path):
+                images = list_archive_images(path, image_extensions)
+                signature = self.update_folder(path, parent, mtime_ns, images)
+                if images and not self.is_done(path, signature):
+                    pending.append((path, [entry.name for entry in images], signature))
+                continue
+
+            # New or changed folder
+            subfolders = set()
+            images = []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir() or (entry.is_file() and entry.name.lower().endswith(archive_extensions)):
+                        subfolders.add(os.path.abspath(entry.path))
+                    elif entry.is_file() and entry.name.lower().endswith(image_extensions):
+                        images.append(entry)
+
+            signature = self.update_folder(path, parent, mtime_ns, images)
+            self.remove_missing(path, subfolders)
+            stack.extend((child, path) for child in subfolders)
+
+            if images and not self.is_done(path, signature):
+                pending.append((path, [entry.name for entry in images], signature))
+
+        with self.lock:
+            self.conn.commit()
+
+        return natsorted(pending, key=lambda chapter: chapter[0])
+
+    def summarize(self, root: str) -> dict:
+        """Counts chapters & pages under root by status, and chapters by the last stage they finished."""
+        root = os.path.abspath(root)
+        pattern = root.rstrip(os.sep) + os.sep + "%"
+
+        with self.lock:
+            statuses = self.conn.execute(
+                "SELECT status, COUNT(*), SUM(page_count) FROM chapters WHERE page_count > 0 AND (path = ? OR path LIKE ?) GROUP BY status",
+                (root, pattern)
+            ).fetchall()
+            stages = self.conn.execute(
+                "SELECT stage, COUNT(*) FROM stages WHERE path = ? OR path LIKE ? GROUP BY stage", (root, pattern)
+            ).fetchall()
+            failed = self.conn.execute(
+                "SELECT path, error FROM chapters WHERE status = 'failed' AND (path = ? OR path LIKE ?) ORDER BY updated DESC",
+                (root, pattern)
+            ).fetchall()
+            last_updated = self.conn.execute(
+                "SELECT MAX(updated) FROM chapters WHERE path = ? OR path LIKE ?", (root, pattern)
+            ).fetchone()[0]
+
+        return {
+            "chapters": {status or "unknown": count for status, count, pages in statuses},
+            "pages": {status or "unknown": pages or 0 for status, count, pages in statuses},
+            "stages": dict(stages),
+            "failed": [{"path": path, "error": error} for path, error in failed],
+            "last_updated": last_updated,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def list_images(dirpath: str, image_extensions: tuple[str]) -> list[os.DirEntry | ArchiveEntry]:
+    """Returns the image files directly in dirpath, or in it if it's an archive."""
+    if is_archive(dirpath):
+        return list_archive_images(dirpath, image_extensions)
+
+    try:
+        with os.scandir(dirpath) as entries:
+            return [entry for entry in entries if entry.is_file() and entry.name.lower().endswith(image_extensions)]
+    except FileNotFoundError:
+        return []
+
+
+def get_chapter_signature(images: list[os.DirEntry | ArchiveEntry]) -> str:
+    """
+    Hashes the names, sizes & modification times of the images, so any added, removed or replaced page changes it.
+    Images in an archive have no modification time of their own, so their CRC is used instead.
+    """
+    digest = hashlib.sha1()
+    for entry in sorted(images, key=lambda entry: entry.name):
+        if isinstance(entry, ArchiveEntry):
+            digest.update(f"{entry.name}\0{entry.size}\0{entry.crc:08x}\n".encode("utf-8"))
+        else:
+            stat = entry.stat()
+            digest.update(f"{entry.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def show_status(index: LibraryIndex, input_path: str, image_extensions: tuple[str]):
+    """Updates the index with the chapters in input_path and logs how far their translation got."""
+    index.scan(input_path, image_extensions)
+    summary = index.summarize(input_path)
+
+    chapters, pages = summary["chapters"], summary["pages"]
+    total = sum(chapters.values())
+    done = chapters.get("done", 0)
+
+    logger.info(Style.BRIGHT + Fore.CYAN + f"Library: '{os.path.abspath(input_path)}'")
+    logger.info(f"Index: '{index.db_path}'")
+    if summary["last_updated"]:
+        logger.info(f"Last updated: {datetime.fromtimestamp(summary['last_updated']).isoformat(sep=' ', timespec='seconds')}")
+
+    logger.info(f"\nChapters: {total} ({sum(pages.values())} pages)")
+    logger.info(Fore.GREEN + f"- Done: {done} ({pages.get('done', 0)} pages)")
+    logger.info(Fore.YELLOW + f"- Pending: {chapters.get('pending', 0)} ({pages.get('pending', 0)} pages)")
+    logger.info(Fore.RED + f"- Failed: {chapters.get('failed', 0)} ({pages.get('failed', 0)} pages)")
+    if total:
+        logger.info(f"Progress: {done / total:.1%}")
+
+    if summary["stages"]:
+        logger.info("\nChapters by finished stage:")
+        for stage in ("ocr", "translate", "overlay"):
+            logger.info(f"- {stage}: {summary['stages'].get(stage, 0)}")
+
+    if summary["failed"]:
+        logger.info(Fore.RED + "\nFailed chapters:")
+        for chapter in summary["failed"]:
+            logger.info(f"- {chapter['path']}: {chapter['error']}")
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import atexit
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from loguru import logger
+
+
+def get_rss() -> int | None:
+    """Returns the current resident set size of this process in bytes, or None if it can't be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    # Linux fallback without psutil
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Metrics:
+    """
+    Records wall time, CPU time & peak RSS per stage and counters per chapter, and appends them to a JSONL file.
+
+    Stages can be timed with `with metrics.stage("detect"):` or recorded from other threads with metrics.record().
+    Repeated stages within a chapter (e.g. one detection per image when merging is disabled) are added up.
+    """
+
+    def __init__(self, sample_interval: float = 0.05):
+        self.path = None
+        self.chapter = None
+        self.started = None
+        self.stages = {}
+        self.counters = {}
+        self.active_stages = []
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()
+        self.sampler = None
+
+    def open(self, path: str):
+        """Sets the JSONL file and starts sampling RSS in the background."""
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        if self.sampler is None and get_rss() is not None:
+            self.sampler = threading.Thread(target=self._sample_rss, daemon=True)
+            self.sampler.start()
+
+    def _sample_rss(self):
+        # Peak RSS of a stage is the highest sample while it's running
+        while True:
+            rss = get_rss()
+            with self.lock:
+                for record in self.active_stages:
+                    record["peak_rss"] = max(record["peak_rss"], rss)
+            time.sleep(self.sample_interval)
+
+    def start_chapter(self, chapter: str):
+        with self.lock:
+            self.chapter = chapter
+            self.started = datetime.now().isoformat(timespec="seconds")
+            self.stages = {}
+            self.counters = {}
+
+    def record(self, name: str, wall: float, cpu: float, peak_rss: int | None = None):
+        """Adds a measurement to a stage. Safe to call from worker threads."""
+        with self.lock:
+            stage = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": None})
+            stage["calls"] += 1
+            stage["wall_s"] += wall
+            stage["cpu_s"] += cpu
+            if peak_rss is not None:
+                peak_rss_mb = round(peak_rss / 1024 / 1024, 1)
+                stage["peak_rss_mb"] = max(stage["peak_rss_mb"] or 0, peak_rss_mb)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times a stage. CPU time is for the whole process, so it includes ONNX Runtime/torch threads."""
+        rss = get_rss()
+        record = {"name": name, "peak_rss": rss or 0}
+        with self.lock:
+            self.active_stages.append(record)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+
+            with self.lock:
+                self.active_stages.remove(record)
+            peak_rss = max(record["peak_rss"], get_rss() or 0) if rss is not None else None
+
+            self.record(name, wall, cpu, peak_rss)
+
+    @property
+    def current_stage(self) -> str | None:
+        """Name of the innermost stage running right now."""
+        with self.lock:
+            return self.active_stages[-1]["name"] if self.active_stages else None
+
+    def count(self, name: str, value: int | float = 1):
+        """Adds to a counter (e.g. tiles, detections, prompt_tokens, cache hits). Safe to call from worker threads."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def end_chapter(self, log_level: str = "INFO") -> dict | None:
+        """Appends the chapter's stages & counters as one JSON line and returns them."""
+        if self.chapter is None:
+            return None
+
+        with self.lock:
+            entry = {
+                "chapter": self.chapter,
+                "started": self.started,
+                "stages": {name: {**stage, "wall_s": round(stage["wall_s"], 4), "cpu_s": round(stage["cpu_s"], 4)} for name, stage in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+            self.chapter = None
+
+        if log_level == "TRACE":
+            summary = ", ".join(f"{name} {stage['wall_s']:.2f}s" for name, stage in entry["stages"].items())
+            logger.debug(f"\nStage times: {summary}")
+            logger.debug(f"Counters: {entry['counters']}")
+
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        return entry
+
+
+# Shared instance, like loguru's logger
+metrics = Metrics()
+
+
+def start_profiler(output_base: str):
+    """
+    Profiles the rest of the run with pyinstrument if it's installed, or cProfile otherwise.
+    The result is saved when the program exits, even after an error.
+    """
+    try:
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+
+        def stop():
+            profiler.stop()
+            output_path = f"{output_base}.html"
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            logger.info(f"\nProfile saved to '{output_path}'.")
+    except ImportError:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def stop():
+            profiler.disable()
+            output_path = f"{output_base}.prof"
+            profiler.dump_stats(output_path)
+            logger.info(f"\nProfile saved to '{output_path}'. Open it with 'python -m pstats {output_path}' or snakeviz.")
+
+    atexit.register(stop)
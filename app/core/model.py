@@ -2,7 +2,10 @@ import os
 from tqdm import tqdm
 from loguru import logger
 from colorama import Fore, Style, init
-from huggingface_hub import hf_hub_download, snapshot_download
+
+from app.core.lazy import LazyModule
+
+huggingface_hub = LazyModule("huggingface_hub")
 
 os.environ["HF_HUB_DISABLE_PROGRESS_BARS"] = "0"
 init(autoreset=True)
@@ -10,7 +13,7 @@ init(autoreset=True)
 def download_model(repo_id: str, file_name: str, local_dir: str):
     logger.info(Style.BRIGHT + Fore.YELLOW + "Model does not exist. Initiating download...")
 
-    local_path = hf_hub_download(
+    local_path = huggingface_hub.hf_hub_download(
         repo_id=repo_id,
         filename=file_name,
         local_dir=local_dir
@@ -21,7 +24,7 @@ def download_model(repo_id: str, file_name: str, local_dir: str):
 def download_repo_snapshot(repo_id: str, local_dir: str):
     logger.info(Style.BRIGHT + Fore.YELLOW + "Repo snapshot does not exist. Initiating download...")
 
-    local_path = snapshot_download(
+    local_path = huggingface_hub.snapshot_download(
         repo_id=repo_id,
         local_dir=local_dir
     )
@@ -0,0 +1,113 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+from loguru import logger
+
+from app.core.metrics import metrics
+
+
+class OCRCache:
+    """
+    Remembers the text recognized in each crop, keyed by a hash of its grayscale pixels, so recurring bubbles
+    (catchphrases, logos, repeated panels) are only recognized once, across chapters and runs.
+
+    It's kept in SQLite and bounded to max_entries, forgetting the least recently used crops first.
+    With near_match, a crop of about the same size whose difference hash is at most max_distance bits away
+    also counts, for crops that differ only by compression noise or a pixel of offset.
+    """
+
+    def __init__(self, db_path: str, model: str, max_entries: int = 100000, near_match: bool = False, max_distance: int = 6):
+        self.db_path = db_path
+        self.model = model
+        self.max_entries = max_entries
+        self.near_match = near_match
+        self.max_distance = max_distance
+        self.puts = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # Shared by runs at once, so wait for their writes instead of failing
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.lock = threading.Lock()
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS crops (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                width INTEGER,
+                height INTEGER,
+                dhash BLOB,
+                text TEXT,
+                confidence REAL,
+                last_used REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_crops_last_used ON crops (last_used)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_crops_size ON crops (model, width, height)")
+        self.conn.commit()
+
+    def describe(self, crop: object) -> dict:
+        """Returns the hash key, size & difference hash of a crop."""
+        gray = crop.convert("L")
+        key = hashlib.blake2b(f"{self.model}|{gray.size}".encode("utf-8") + gray.tobytes(), digest_size=16).hexdigest()
+
+        # Each bit says whether a pixel is brighter than its right neighbour
+        pixels = np.asarray(gray.resize((17, 16), Image.Resampling.BOX), dtype=np.int16)
+        dhash = np.packbits((pixels[:, 1:] > pixels[:, :-1]).flatten()).tobytes()
+
+        return {"key": key, "width": gray.size[0], "height": gray.size[1], "dhash": dhash}
+
+    def get(self, crop: dict) -> tuple[str, float] | None:
+        """Returns the (text, confidence) of the crop if it was recognized before."""
+        with self.lock:
+            row = self.conn.execute("SELECT key, text, confidence FROM crops WHERE key = ?", (crop["key"],)).fetchone()
+
+            if row is None and self.near_match:
+                candidates = self.conn.execute(
+                    "SELECT key, text, confidence, dhash FROM crops WHERE model = ? AND width BETWEEN ? AND ? AND height BETWEEN ? AND ?",
+                    (self.model, crop["width"] - 2, crop["width"] + 2, crop["height"] - 2, crop["height"] + 2)
+                ).fetchall()
+                dhash = np.frombuffer(crop["dhash"], dtype=np.uint8)
+                for candidate in candidates:
+                    distance = int(np.unpackbits(np.bitwise_xor(dhash, np.frombuffer(candidate[3], dtype=np.uint8))).sum())
+                    if distance <= self.max_distance:
+                        row = candidate[:3]
+                        break
+
+            if row is None:
+                metrics.count("ocr_cache_misses")
+                return None
+
+            self.conn.execute("UPDATE crops SET last_used = ? WHERE key = ?", (time.time(), row[0]))
+            self.conn.commit()
+
+        metrics.count("ocr_cache_hits")
+        return row[1], row[2]
+
+    def put(self, crop: dict, text: str, confidence: float):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO crops (key, model, width, height, dhash, text, confidence, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (crop["key"], self.model, crop["width"], crop["height"], crop["dhash"], text, confidence, time.time())
+            )
+
+            # Forget the least recently used crops beyond max_entries, checked every 100 new crops
+            self.puts += 1
+            if self.puts % 100 == 0:
+                count = self.conn.execute("SELECT COUNT(*) FROM crops").fetchone()[0]
+                if count > self.max_entries:
+                    self.conn.execute("DELETE FROM crops WHERE key IN (SELECT key FROM crops ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
+                    logger.debug(f"Removed {count - self.max_entries} least recently used crops from the OCR cache.")
+
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
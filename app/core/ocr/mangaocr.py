@@ -1,4 +1,3 @@
-import os
 import threading
 import faulthandler
 from tqdm import tqdm
@@ -7,6 +6,7 @@ from loguru import logger
 from manga_ocr import MangaOcr
 
 from app.core.image_utils_pil import crop_out_box
+from app.core.resources import budget
 
 
 faulthandler.enable()
@@ -39,6 +39,7 @@ class MangaOCRRecognition:
         upscaler: list[bool | int],
         output_dir: str,
         log_level: str,
+        cache: object | None = None,
     ):
 
         use_upscaler, upscale_ratio = upscaler
@@ -59,7 +60,16 @@ class MangaOCRRecognition:
                 log_level,
             )
 
-            text = self.mocr(cropped_img_resized)
+            # Skip inference for crops recognized before
+            crop = cache.describe(cropped_img_resized) if cache else None
+            cached = cache.get(crop) if cache else None
+
+            if cached:
+                text = cached[0]
+            else:
+                text = self.mocr(cropped_img_resized)
+                if cache:
+                    cache.put(crop, text, 1.0)
 
             if text and text != "．．．":
                 detection["original_text"] = text.strip()
@@ -77,12 +87,19 @@ class MangaOCRRecognition:
         upscaler: list[bool | int],
         output_dir: str,
         log_level: str,
+        first: int = 0,
+        cache: object | None = None,
     ):
-        """Manages thread pool for batch recognition"""
+        """
+        Manages thread pool for batch recognition. first is the index of the first detection, for naming crops.
+        Crops found in cache aren't recognized again.
+        """
 
         all_results = []
-        # Get the number of CPU threads and divide it by 2
-        num_threads = int(os.cpu_count() / 2)
+        # Share of the thread budget (half the CPUs by default)
+        num_threads = budget.ocr_workers
+        # Workers take turns on the model, so each call gets the whole budget
+        budget.use_torch_threads(budget.ocr_threads)
 
         logger.info(f"\nExtracting texts with Manga OCR in {num_threads} threads...")
 
@@ -93,11 +110,12 @@ class MangaOCRRecognition:
                 executor.submit(
                     self.run_mangaocr_on_detections,
                     image,
-                    f"crop{number}_{i:02d}.jpg",
+                    f"crop{number}_{first + i:02d}.jpg",
                     detection,
                     upscaler,
                     output_dir,
                     log_level,
+                    cache,
                 ): detection
                 for i, detection in enumerate(detections)
             }
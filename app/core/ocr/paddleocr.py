@@ -1,4 +1,3 @@
-import os
 import logging
 import threading
 import numpy as np
@@ -9,6 +8,7 @@ from loguru import logger
 from paddleocr import PaddleOCR
 
 from app.core.image_utils_pil import crop_out_box
+from app.core.resources import budget
 
 
 faulthandler.enable()
@@ -44,6 +44,7 @@ class PaddleOCRRecognition:
             use_doc_orientation_classify=False,
             use_doc_unwarping=False,
             use_textline_orientation=False,
+            cpu_threads=budget.ocr_threads, # The worker threads of batch_threaded take turns on the model
         )
 
         logger.info("PaddleOCR model initialized.")
@@ -56,6 +57,7 @@ class PaddleOCRRecognition:
         upscaler: list[bool | int],
         output_dir: str,
         log_level: str,
+        cache: object | None = None,
     ):
         """Runs PaddleOCR on slices and adjusts coordinates to original image space."""
 
@@ -78,6 +80,14 @@ class PaddleOCRRecognition:
                 log_level,
             )
 
+            # Skip inference for crops recognized before
+            crop = cache.describe(cropped_img_resized) if cache else None
+            cached = cache.get(crop) if cache else None
+
+            if cached:
+                detection["original_text"], detection["text_confidence"] = cached
+                return detection
+
             result = self.ppocr.predict(np.array(cropped_img_resized))
 
             recognized_text = ""
@@ -102,6 +112,9 @@ class PaddleOCRRecognition:
 
                 detection["text_confidence"] = avg_conf
 
+                if cache:
+                    cache.put(crop, detection["original_text"], avg_conf)
+
                 if log_level == "TRACE" and recognized_text != "":
                     logger.debug(f"({avg_conf:.2f}) {recognized_text}")
 
@@ -115,12 +128,17 @@ class PaddleOCRRecognition:
         upscaler: list[bool | int],
         output_dir: str,
         log_level: str,
+        first: int = 0,
+        cache: object | None = None,
     ):
-        """Manages thread pool for batch recognition"""
+        """
+        Manages thread pool for batch recognition. first is the index of the first detection, for naming crops.
+        Crops found in cache aren't recognized again.
+        """
 
         all_results = []
-        # Get the number of CPU threads and divide it by 2
-        num_threads = int(os.cpu_count() / 2)
+        # Share of the thread budget (half the CPUs by default)
+        num_threads = budget.ocr_workers
 
         logger.info(f"\nExtracting texts with PaddleOCR in {num_threads} threads...")
 
@@ -131,11 +149,12 @@ class PaddleOCRRecognition:
                 executor.submit(
                     self.run_paddleocr_on_detections,
                     image,
-                    f"crop{number}_{i:02d}.jpg",
+                    f"crop{number}_{first + i:02d}.jpg",
                     detection,
                     upscaler,
                     output_dir,
                     log_level,
+                    cache,
                 ): detection
                 for i, detection in enumerate(detections)
             }
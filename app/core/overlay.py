@@ -1,5 +1,6 @@
 import os
 import textwrap
+from functools import partial
 import numpy as np
 from loguru import logger
 from colorama import Fore, Style, init
@@ -7,16 +8,11 @@ from PIL import Image, ImageDraw, ImageFont
 
 from app.core.detection import get_bbox_coords, get_bbox_orientation
 from app.core.inpainting import inpaint_image_with_lama
+from app.core.metrics import metrics
+from app.core.storage import storage
 
 init(autoreset=True)
 
-# def is_string_in_file(file_path: int, search_string: str):
-#     with open(file_path, 'r', encoding="utf-8") as file:
-#         for line in file:
-#             if search_string in line:
-#                 return True
-#     return False
-
 
 def get_fitted_font_and_text(
     text: str,
@@ -74,6 +70,15 @@ def get_fitted_font_and_text(
     return fitted_size, best_wrapped_text
 
 
+def save_image(image: object, temp_output_path: str, full_output_path: str, done=None):
+    image.save(temp_output_path, quality=100)
+    os.replace(temp_output_path, full_output_path)
+    image.close()
+
+    if done:
+        done()
+
+
 def overlay_translated_texts(
     images: list[dict],
     images_merged: bool,
@@ -85,8 +90,13 @@ def overlay_translated_texts(
     source_language: str,
     output_path: str,
     log_level: str,
+    checkpoint: object | None = None,
+    writer: object | None = None,
 ):
-    """Overlays the detected text boxes and translated texts onto the corresponding safely-splitted images and saves them."""
+    """
+    Overlays the detected text boxes and translated texts onto the corresponding safely-splitted images and saves them,
+    or adds them to writer (an ArchiveWriter) if given. Images already saved by an interrupted run are skipped if a checkpoint is given.
+    """
 
     logger.info("\nOverlaying translated texts...")
 
@@ -105,23 +115,21 @@ def overlay_translated_texts(
 
     # inclusion = ("i", "you", "we", "they", "he", "she", "it", "ah")
 
-    # # Set filter according to source source_language
-    # source_language, lang_code_jp = source_language
+    for i, image_info in enumerate(images):
+        image_name = f"image_{i:02d}" if images_merged else image_info["image_name"]
+        full_output_path = f"{output_path}/{image_name}.{image_extension}"
 
-    # if source_language in lang_code_jp:
-    #     filter_path = "filters/manga.txt"
-    # elif source_language == "korean":
-    #     filter_path = "filters/manhwa.txt"
-    # elif source_language == "ch":
-    #     filter_path = "filters/manhua.txt"
+        # Skip images finished before the run was interrupted, saved as files or in the resumed archive
+        output_exists = writer.has(f"{image_name}.{image_extension}") if writer else os.path.exists(full_output_path)
+        if checkpoint and output_exists and checkpoint.load(f"output_{image_name}"):
+            logger.info(Fore.GREEN + f"- {image_name}.{image_extension} was already saved. SKIPPING...")
+            continue
 
-    for i, image_info in enumerate(images):
         image = image_info["image"]
         image_copy = image.copy()
         draw = ImageDraw.Draw(image)
 
         if images_merged:
-            image_name = f"image_{i:02d}"
             slice_top = image_info["top_offset"]
 
             results_for_this_slice = []
@@ -132,7 +140,6 @@ def overlay_translated_texts(
                 if max(slice_top, s_min_y) < min(slice_top + image.size[1], s_max_y):
                     results_for_this_slice.append(res)
         else:
-            image_name = image_info["image_name"]
             slice_top = 0
 
             results_for_this_slice = []
@@ -149,10 +156,6 @@ def overlay_translated_texts(
             if translated_text == "" or translated_text == " ":
                 continue
 
-            # Filter out sound effects in original_text
-            # if is_string_in_file(filter_path, original_text):
-            #     continue
-
             # Filter out translated texts whose characters are fewer than 3 and not in inclusion list, potentially removing gibberish
             # if len(translated_text) < 3 and translated_text.lower() not in inclusion:
             #     continue
@@ -272,10 +275,16 @@ def overlay_translated_texts(
                     fill="green",
                 )
 
-        # Save the final image
-        full_output_path = f"{output_path}/{image_name}.{image_extension}"
-        image.save(full_output_path, quality=100)
-        image.close()
+        if writer:
+            # Encoded & closed by the writer's thread, and only checkpointed once it's in the archive
+            with metrics.stage("save"):
+                writer.add(f"{image_name}.{image_extension}", image, partial(checkpoint.save, f"output_{image_name}", True) if checkpoint else None)
+        else:
+            # Save the final image to a temporary file first so an interrupted save never looks finished,
+            # and only checkpoint it once it's written, which may be later with write-back
+            temp_output_path = f"{output_path}/.{image_name}.{image_extension}"
+            with metrics.stage("save"):
+                storage.write_back(save_image, image, temp_output_path, full_output_path, partial(checkpoint.save, f"output_{image_name}", True) if checkpoint else None)
 
         # Save the annotated image in debug mode
         if log_level == "TRACE":
@@ -288,4 +297,5 @@ def overlay_translated_texts(
             annotation_image.close()
 
     logger.success("Translated texts overlaid.")
-    logger.success(Fore.GREEN + f"\nTranslated images saved to {output_path}.")
+    if not writer:
+        logger.success(Fore.GREEN + f"\nTranslated images saved to {output_path}.")
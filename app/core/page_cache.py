@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import threading
+import numpy as np
+from PIL import Image
+
+from app.core.result import NumpyEncoder
+from app.core.archive import image_exists, read_file
+from app.core.storage import storage
+
+
+hash_size = 16 # dHash of 16x16 bits
+thumb_size = 32
+block_size = 8
+
+
+def hash_page(image_path: str) -> dict:
+    """
+    Returns the size, difference hash (dHash) & a small grayscale thumbnail of a page.
+    JPEGs are decoded at a fraction of their size (draft mode), so hashing costs far less than loading the page.
+    Other formats have no draft mode and are decoded in full, once for the hash and again if the page isn't reused.
+    """
+    with Image.open(storage.open_page(image_path)) as image:
+        size = image.size
+        image.draft("L", (thumb_size * 4, thumb_size * 4))
+        gray = image.convert("L")
+
+    # Each bit says whether a pixel is brighter than its right neighbour
+    pixels = np.asarray(gray.resize((hash_size + 1, hash_size), Image.Resampling.BOX), dtype=np.int16)
+    bits = np.packbits((pixels[:, 1:] > pixels[:, :-1]).flatten())
+    thumb = np.asarray(gray.resize((thumb_size, thumb_size), Image.Resampling.BOX), dtype=np.uint8)
+
+    return {"path": os.path.abspath(image_path), "width": size[0], "height": size[1], "hash": bits.tobytes(), "thumb": thumb.tobytes()}
+
+
+def load_gray(image_path: str, width: int) -> np.ndarray:
+    with Image.open(storage.open_page(image_path)) as image:
+        height = max(block_size, round(image.height * width / image.width))
+        image.draft("L", (width, height))
+        return np.asarray(image.convert("L").resize((width, height), Image.Resampling.BOX), dtype=np.int16)
+
+
+def get_page_difference(image_path: str, other_path: str, width: int = 256) -> float:
+    """
+    Returns the largest average difference of any small block between two pages, so a few changed words
+    (e.g. other translator names on a credit page) count even though they barely change the whole page.
+    """
+    image, other = load_gray(image_path, width), load_gray(other_path, width)
+    if image.shape != other.shape:
+        return 255.0
+
+    height = image.shape[0] // block_size * block_size
+    difference = np.abs(image[:height] - other[:height]).reshape(height // block_size, block_size, width // block_size, block_size)
+    return float(difference.mean(axis=(1, 3)).max())
+
+
+class PageCache:
+    """
+    Maps pages seen before (e.g. credit, recruitment & end-card pages repeated in every chapter) to their
+    finished detections, translations & rendered output, so near-duplicates are copied instead of going through the models.
+
+    Pages match if they have the same size, their dHashes differ by at most max_distance bits, their thumbnails
+    differ by at most max_thumb_difference on average and, compared with the cached page's source, no small
+    block differs by more than max_block_difference. The last check keeps apart e.g. credit pages with
+    the same layout but other names, which look the same to the hash.
+
+    Only separate pages are looked up, so it's only used with IMAGE_MERGE disabled: merged pages are detected
+    & split together, and a strip of several pages would almost never recur as a whole.
+    """
+
+    def __init__(self, db_path: str = "page_cache.db", max_distance: int = 10, max_thumb_difference: float = 3, max_block_difference: float = 16):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self.max_thumb_difference = max_thumb_difference
+        self.max_block_difference = max_block_difference
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self._create_tables()
+
+        # Keep the hashes in memory so a lookup is one vectorized comparison against every page.
+        # Only the first len(self.ids) rows are used, the rest is room to add pages without copying every hash.
+        rows = self.conn.execute("SELECT id, settings, width, height, hash FROM pages").fetchall()
+        self.ids = [row[0] for row in rows]
+        self.keys = [(row[1], row[2], row[3]) for row in rows]
+        self.hashes = np.array([np.frombuffer(row[4], dtype=np.uint8) for row in rows], dtype=np.uint8).reshape(len(rows), hash_size * hash_size // 8)
+
+    def _create_tables(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                settings TEXT,
+                width INTEGER,
+                height INTEGER,
+                hash BLOB,
+                thumb BLOB,
+                source TEXT,
+                items TEXT,
+                render TEXT,
+                hits INTEGER DEFAULT 0,
+                updated REAL
+            )
+        """)
+        self.conn.commit()
+
+    def find(self, page: dict, settings: str) -> dict | None:
+        """Returns the cached result of the closest matching page made with the same settings, if there's one."""
+        count = len(self.ids)
+        if not count:
+            return None
+
+        distances = np.unpackbits(np.bitwise_xor(self.hashes[:count], np.frombuffer(page["hash"], dtype=np.uint8)), axis=1).sum(axis=1)
+        thumb = np.frombuffer(page["thumb"], dtype=np.uint8).astype(np.int16)
+
+        for i in np.argsort(distances):
+            if distances[i] > self.max_distance:
+                break
+            if self.keys[i] != (settings, page["width"], page["height"]):
+                continue
+
+            with self.lock:
+                row = self.conn.execute("SELECT thumb, items, render, source FROM pages WHERE id = ?", (self.ids[i],)).fetchone()
+            if row is None or not image_exists(row[2]) or not image_exists(row[3]):
+                continue
+            if np.abs(np.frombuffer(row[0], dtype=np.uint8).astype(np.int16) - thumb).mean() > self.max_thumb_difference:
+                continue
+            if get_page_difference(page["path"], row[3]) > self.max_block_difference:
+                continue
+
+            with self.lock:
+                self.conn.execute("UPDATE pages SET hits = hits + 1, updated = ? WHERE id = ?", (time.time(), self.ids[i]))
+                self.conn.commit()
+
+            items = json.loads(row[1])
+            for item in items:
+                item["box"] = np.array(item["box"], dtype=np.int32)
+            return {"id": self.ids[i], "items": items, "render": row[2]}
+
+        return None
+
+    def add(self, page: dict, settings: str, items: list[dict], render_path: str):
+        """
+        Saves a finished page with its translated items and where its source & rendered output are (in a folder or archive).
+        They aren't copied, so a page whose source or output was moved or deleted just stops matching.
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO pages (settings, width, height, hash, thumb, source, items, render, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (settings, page["width"], page["height"], page["hash"], page["thumb"], page["path"], json.dumps(items, cls=NumpyEncoder, ensure_ascii=False), os.path.abspath(render_path), time.time())
+            )
+            self.conn.commit()
+
+            # Double the room when it's full, so adding n pages copies O(n) hashes in total
+            count = len(self.ids)
+            if count == len(self.hashes):
+                hashes = np.zeros((max(2 * count, 64), self.hashes.shape[1]), dtype=np.uint8)
+                hashes[:count] = self.hashes[:count]
+                self.hashes = hashes
+            self.hashes[count] = np.frombuffer(page["hash"], dtype=np.uint8)
+
+            # Lookups only use the new hash once its key & id are in
+            self.keys.append((settings, page["width"], page["height"]))
+            self.ids.append(cursor.lastrowid)
+
+    def restore(self, entry: dict, image_name: str, number: int) -> list[dict]:
+        """Returns the items of a cached page, renamed for this page."""
+        for item in entry["items"]:
+            item["image_name"] = image_name
+            item["number"] = number
+            item["cached"] = True
+        return entry["items"]
+
+    def copy_render(self, entry: dict, output_dir: str, image_name: str, writer: object | None = None):
+        """Copies the cached output of a page to output_dir, or adds it to writer (an ArchiveWriter) if given."""
+        extension = os.path.splitext(entry["render"])[1]
+        if writer:
+            # Already in the archive of a resumed run
+            if not writer.has(f"{image_name}{extension}"):
+                writer.add(f"{image_name}{extension}", entry["render"])
+            return
+
+        temp_path = os.path.join(output_dir, f".{image_name}{extension}")
+        if os.path.exists(entry["render"]):
+            shutil.copyfile(entry["render"], temp_path)
+        else:
+            with open(temp_path, "wb") as f:
+                f.write(read_file(entry["render"]))
+        os.replace(temp_path, os.path.join(output_dir, f"{image_name}{extension}"))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
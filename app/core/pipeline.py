@@ -0,0 +1,656 @@
+import os
+import re
+import json
+import time
+import hashlib
+from PIL import Image
+from pathlib import Path
+from loguru import logger
+from natsort import natsorted
+from collections import Counter
+from colorama import Fore, Style, init
+
+from app.core.image_utils_pil import load_images, merge_images_vertically, scale_detections, split_image_safely
+from app.core.detection import TextAreaDetection, merge_overlapping_boxes
+from app.core.translation.engine import translate_texts_and_build_glossary
+from app.core.translation.memory import TranslationMemory, translate_texts_from_memory
+from app.core.overlay import overlay_translated_texts
+from app.core.result import save_result_json, load_result_json
+from app.core.metrics import metrics
+from app.core.lazy import import_module
+from app.core.library import LibraryIndex, get_chapter_signature, list_images
+from app.core.checkpoint import ChapterCheckpoint
+from app.core.text_filter import get_filter_path, get_text_filter
+from app.core.page_cache import PageCache, hash_page
+from app.core.archive import ArchiveWriter, archive_extensions, image_exists, is_archive
+from app.core.storage import storage
+from app.core.resources import budget
+
+
+init(autoreset=True)
+Image.MAX_IMAGE_PIXELS = None
+
+image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+lang_code_jp = ("japanese", "japan", "jpn", "jp", "ja")
+
+
+class Pipeline:
+    """
+    Translates comic folders chapter by chapter.
+
+    Models are built the first time a stage needs them, so e.g. re-rendering from result.json never loads them.
+    They're kept between runs and only rebuilt when the settings they depend on change,
+    so the daemon can reconfigure it for every job without reloading everything.
+    """
+
+    def __init__(self, config: dict, use_gpu: bool, log_level: str):
+        self.use_gpu = use_gpu
+        self.log_level = log_level
+        self.models = {}
+        self.page_caches = {}
+        self.configure(config)
+
+    def configure(self, config: dict):
+        """Reads the settings from config.json."""
+        # For general settings
+        self.gpu_mode = self.use_gpu or config['GENERAL']['gpu_mode']
+        budget.configure(config['GENERAL'].get('threads', {}))
+        self.overwrite_result = config['GENERAL']['result']['overwrite']
+        self.use_result_json = config['GENERAL']['result']['load_json']
+        self.result_json_path_ = config['GENERAL']['result']['json_path']
+        self.result_format = config['GENERAL']['result'].get('format', "json")
+        self.library_path_ = config['GENERAL'].get('library_path', "output")
+        self.output_format = config['GENERAL'].get('output_format', "folder")
+        storage.configure(config['GENERAL'].get('io', {}))
+        self.use_checkpoint = config['GENERAL'].get('checkpoint', {}).get('enable', True)
+        self.ocr_chunk_size = config['GENERAL'].get('checkpoint', {}).get('ocr_chunk_size', 32)
+        self.use_page_cache = config['GENERAL'].get('page_cache', {}).get('enable', True)
+        self.page_cache_path_ = config['GENERAL'].get('page_cache', {}).get('path', "output")
+        self.page_cache_distance = config['GENERAL'].get('page_cache', {}).get('max_distance', 10)
+        self.load_workers = config['GENERAL'].get('load_workers') or budget.load_workers
+        # For merging images
+        self.merge_images = config['IMAGE_MERGE']['enable']
+        # For detecting text areas
+        self.det_conf_threshold = config['OCR']['confidence_threshold']
+        self.det_merge_threshold = config['DETECTION']['merge_threshold']
+        self.det_merge_times = config['DETECTION']['merge_times']
+        self.tile_height = config['DETECTION']['tile']['height']
+        self.tile_width = config['DETECTION']['tile']['width']
+        self.tile_overlap = config['DETECTION']['tile']['overlap']
+        self.det_tile_config = config['DETECTION']['tile']
+        self.det_coarse_config = config['DETECTION'].get('coarse_to_fine', {})
+        self.det_batch_size = config['DETECTION'].get('batch_size', 1)
+        self.det_session_config = config['DETECTION'].get('session', {})
+        self.det_precision = config['DETECTION'].get('precision', "fp32")
+        self.det_quantization = config['DETECTION'].get('quantization', {})
+        self.det_draft = config['DETECTION'].get('draft', True)
+        self.det_target_size = 640
+        # For OCR
+        self.source_language = config['OCR']['source_language']
+        self.ocr_conf_threshold = config['OCR']['confidence_threshold']
+        self.use_upscaler = config['OCR']['upscale']['enable']
+        self.upscale_ratio = config['OCR']['upscale']['ratio']
+        self.ocr_cache_config = config['OCR'].get('cache', {})
+        self.use_filter = config['OCR'].get('filter', {}).get('enable', True)
+        self.filter_action = config['OCR'].get('filter', {}).get('action', "tag")
+        self.filter_watermarks = config['OCR'].get('filter', {}).get('watermarks', True)
+        # For splitting image
+        self.max_height = config['IMAGE_SPLIT']['max_height']
+        # For translation
+        self.target_language = config['TRANSLATION']['target_language']
+        self.timeout = config['TRANSLATION']['timeout']
+        self.max_retries = config['TRANSLATION']['max_retries']
+        self.retry_delay = config['TRANSLATION']['retry_delay']
+        self.translator_provider = config['TRANSLATION']['translator']['provider']
+        self.translator_model = config['TRANSLATION']['translator']['model']
+        self.translator_base_url = config['TRANSLATION']['translator']['base_url']
+        self.translator_temp = config['TRANSLATION']['translator']['temperature']
+        self.translator_top_p = config['TRANSLATION']['translator']['top_p']
+        self.translator_max_out_tokens = config['TRANSLATION']['translator']['max_output_tokens']
+        self.translator_mock = config['TRANSLATION'].get('mock', {})
+        self.use_memory = config['TRANSLATION']['memory']['enable']
+        self.memory_path_ = config['TRANSLATION']['memory']['path']
+        self.overwrite_memory = config['TRANSLATION']['memory']['overwrite']
+        self.glossary_path_ = config['TRANSLATION']['glossary_path']
+        # For overlay
+        self.box_offset = config['OVERLAY']['box']['offset']
+        self.box_padding = config['OVERLAY']['box']['padding']
+        self.box_fill_color = config['OVERLAY']['box']['fill_color']
+        self.box_outline_color = config['OVERLAY']['box']['outline_color']
+        self.box_outline_thickness = config['OVERLAY']['box']['outline_thickness']
+        self.use_inpainting = config['OVERLAY']['box']['inpaint']
+        self.font_min = config['OVERLAY']['font']['min_size']
+        self.font_max = config['OVERLAY']['font']['max_size']
+        self.font_color = config['OVERLAY']['font']['color']
+        self.font_path = config['OVERLAY']['font']['path']
+
+    def get_model(self, name: str, key: tuple, build):
+        """Returns the cached model if it was built with the same key, or builds it with build()."""
+        cached = self.models.get(name)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        if cached:
+            logger.info(f"\nSettings for {name} changed. Reloading...")
+            self.models.pop(name)
+
+        model = build()
+        self.models[name] = (key, model)
+        return model
+
+    @property
+    def detector(self) -> TextAreaDetection:
+        quantization = [
+            self.det_quantization.get('method', "dynamic"), self.det_quantization.get('calibration_dir'),
+            self.det_quantization.get('calibration_tiles', 32), self.det_tile_config
+        ]
+        key = (self.det_conf_threshold, self.gpu_mode, json.dumps(self.det_session_config, sort_keys=True), self.det_precision, json.dumps(quantization), budget.cpus)
+
+        return self.get_model("detector", key, lambda: TextAreaDetection(
+            confidence_threshold=self.det_conf_threshold,
+            use_gpu=self.gpu_mode,
+            session_config=self.det_session_config,
+            precision=self.det_precision,
+            quantization=quantization,
+        ))
+
+    @property
+    def extractor(self) -> object:
+        def build():
+            if self.source_language in lang_code_jp:
+                MangaOCRRecognition = import_module("app.core.ocr.mangaocr").MangaOCRRecognition
+                return MangaOCRRecognition(use_cpu=not self.gpu_mode)
+            else:
+                PaddleOCRRecognition = import_module("app.core.ocr.paddleocr").PaddleOCRRecognition
+                return PaddleOCRRecognition(ocr_version='PP-OCRv5', language=self.source_language, confidence_threshold=self.ocr_conf_threshold, use_gpu=self.gpu_mode)
+
+        return self.get_model("extractor", (self.source_language, self.ocr_conf_threshold, self.gpu_mode, budget.ocr_threads), build)
+
+    @property
+    def ocr_cache(self) -> object | None:
+        if not self.ocr_cache_config.get('enable', True):
+            return None
+
+        from app.core.ocr.cache import OCRCache
+        # Texts depend on the engine, its language & threshold, not just the crop
+        model = "mangaocr" if self.source_language in lang_code_jp else f"paddleocr/{self.source_language}/{self.ocr_conf_threshold}"
+        path = self.ocr_cache_config.get('path', "temp/ocr_cache.db")
+        key = (model, path, json.dumps(self.ocr_cache_config, sort_keys=True))
+
+        return self.get_model("ocr_cache", key, lambda: OCRCache(
+            path, model,
+            max_entries=self.ocr_cache_config.get('max_entries', 100000),
+            near_match=self.ocr_cache_config.get('near_match', False),
+            max_distance=self.ocr_cache_config.get('max_distance', 6),
+        ))
+
+    @property
+    def inpainter(self) -> object | None:
+        if not self.use_inpainting:
+            return None
+        return self.get_model("inpainter", (), lambda: import_module("simple_lama_inpainting").SimpleLama())
+
+    @property
+    def translator(self) -> list[str | float | list | None]:
+        """
+        Returns the translator settings for the engine, serving translations locally if the provider is "mock".
+        API keys are None to read them from API_KEYS, except for the mock server's own.
+        """
+        provider, base_url, api_keys = self.translator_provider, self.translator_base_url, None
+
+        if provider == "mock":
+            from app.core.translation.mock_server import start_mock_server
+            server, base_url = self.get_model("mock", json.dumps(self.translator_mock, sort_keys=True), lambda: start_mock_server(self.translator_mock))
+            provider = "openai"
+            api_keys = ["mock"]
+
+        return [provider, self.translator_model, base_url, self.translator_temp, self.translator_top_p, self.translator_max_out_tokens, self.timeout, api_keys]
+
+    def load_models(self):
+        """Loads the models now instead of on the first chapter."""
+        self.detector
+        self.extractor
+        self.inpainter
+
+    def open_memory(self, input_path: str, output_path: str) -> TranslationMemory:
+        memory_path = os.path.join(input_path, "memory.db") if self.memory_path_ == "input" else os.path.join(output_path, "memory.db") if self.memory_path_ == "output" else self.memory_path_
+        return TranslationMemory(memory_path)
+
+    def open_index(self, input_path: str, output_path: str) -> LibraryIndex:
+        library_path = os.path.join(input_path, "library.db") if self.library_path_ == "input" else os.path.join(output_path, "library.db") if self.library_path_ == "output" else self.library_path_
+        return LibraryIndex(library_path)
+
+    def open_page_cache(self, input_path: str, output_path: str) -> PageCache:
+        """Returns the page cache, kept open between chapters & runs so its hashes are only read once."""
+        page_cache_path = os.path.join(input_path, "page_cache.db") if self.page_cache_path_ == "input" else os.path.join(output_path, "page_cache.db") if self.page_cache_path_ == "output" else self.page_cache_path_
+        page_cache_path = os.path.abspath(page_cache_path)
+
+        if page_cache_path not in self.page_caches:
+            self.page_caches[page_cache_path] = PageCache(page_cache_path)
+        page_cache = self.page_caches[page_cache_path]
+        page_cache.max_distance = self.page_cache_distance
+        return page_cache
+
+    def get_page_settings(self) -> str:
+        """Returns a hash of the settings a rendered page depends on, so cached pages are only reused with the same ones."""
+        settings = [
+            self.source_language, self.target_language, self.translator_provider, self.translator_model, self.use_memory,
+            [self.det_conf_threshold, self.det_merge_threshold, self.det_merge_times, self.det_tile_config, self.det_precision],
+            [self.ocr_conf_threshold, self.use_upscaler, self.upscale_ratio, self.use_filter, self.filter_action, self.filter_watermarks],
+            [self.box_offset, self.box_padding, self.box_fill_color, self.box_outline_color, self.box_outline_thickness, self.use_inpainting],
+            [self.font_min, self.font_max, self.font_color, self.font_path],
+        ]
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get_checkpoint_key(self, dirpath: str, use_result_json: bool) -> dict:
+        """Returns what a chapter's checkpoint depends on: its images and the settings of the stages before overlay."""
+        return {
+            "images": get_chapter_signature(list_images(dirpath, image_extensions)),
+            "use_result_json": use_result_json,
+            "merge_images": self.merge_images,
+            "detection": [self.det_conf_threshold, self.det_merge_threshold, self.det_merge_times, self.det_tile_config, self.det_coarse_config, self.det_precision],
+            "ocr": [self.source_language, self.ocr_conf_threshold, self.use_upscaler, self.upscale_ratio, self.ocr_chunk_size],
+            "filter": [self.use_filter, self.filter_action, self.filter_watermarks],
+            "split": self.max_height,
+            "translation": [self.target_language, self.translator_provider, self.translator_model, self.use_memory],
+        }
+
+    def translate_folder(self, input_path: str, output_path: str, overwrite: bool = False, load_json: bool = False, progress=None) -> list[dict]:
+        """
+        Translates every chapter (folder with images) in input_path that isn't done in the library index
+        and returns the metrics of each translated chapter. With overwrite (or GENERAL.result.overwrite), every chapter is translated again.
+        progress(done, total, chapter) is called before each chapter and once more at the end.
+        """
+        if not os.path.exists(input_path):
+            raise Exception(Fore.RED + f"{input_path} does not exist!")
+        else:
+            os.makedirs(output_path, exist_ok=True)
+
+        input_path = os.path.abspath(input_path)
+        memory = self.open_memory(input_path, output_path)
+        index = self.open_index(input_path, output_path)
+
+        if overwrite or self.overwrite_result:
+            chapters = []
+            for dirpath, dirnames, filenames in natsorted(os.walk(input_path)):
+                # Archives are chapters of their own
+                archives = [os.path.join(dirpath, f) for f in natsorted(filenames) if f.lower().endswith(archive_extensions)]
+                for chapter_path in [dirpath] + archives:
+                    images = list_images(chapter_path, image_extensions)
+                    if images:
+                        chapters.append((chapter_path, [entry.name for entry in images], get_chapter_signature(images)))
+        else:
+            chapters = index.scan(input_path, image_extensions)
+            logger.info(f"Found {len(chapters)} chapters to translate.")
+
+        results = []
+
+        # Copy the next chapters' pages to the local spool while the current one is translated
+        storage.prefetch([(dirpath, filenames) for dirpath, filenames, signature in chapters[1:]])
+
+        try:
+            for i, (dirpath, filenames, signature) in enumerate(chapters):
+                if progress:
+                    progress(i, len(chapters), dirpath)
+
+                try:
+                    result = self.translate_chapter(input_path, output_path, dirpath, filenames, memory, overwrite, load_json, index)
+                except Exception as e:
+                    index.mark(dirpath, signature, "failed", f"{type(e).__name__}: {e}", len(filenames))
+                    raise
+                finally:
+                    storage.release(dirpath)
+
+                index.mark(dirpath, signature, "done", page_count=len(filenames))
+                if result:
+                    results.append(result)
+        finally:
+            storage.cancel()
+            memory.conn.close()
+            index.close()
+
+        if progress:
+            progress(len(chapters), len(chapters), None)
+
+        logger.success(Style.BRIGHT + Fore.GREEN + f"\nAll translated images saved to '{output_path}'.")
+
+        return results
+
+    def translate_chapter(self, input_path: str, output_path: str, dirpath: str, filenames: list[str], memory: object, overwrite: bool, load_json: bool, index: LibraryIndex | None = None) -> dict | None:
+        """
+        Translates the images of one folder, or archive (.cbz/.zip) read without extracting it.
+        Returns the chapter's metrics, or None if it was skipped. The stages it finishes are recorded in index, if given.
+        """
+        log_level = self.log_level
+        chapter_is_archive = is_archive(dirpath)
+
+        # Define the output path, named after the archive without its extension
+        relative_path = Path(dirpath).relative_to(input_path)
+        if chapter_is_archive:
+            relative_path = relative_path.with_suffix("")
+        output_dir = Path(output_path) / relative_path
+        output_dir.mkdir(parents=True, exist_ok=True) # Create output directory
+
+        logger.info(Style.BRIGHT + Fore.YELLOW + f"\nProcessing '{dirpath}'...")
+
+        # Skip or overwrite if output files already exist
+        already_exist = False
+        regex_pattern = r"^image_.*"
+
+        for filename in os.listdir(output_dir):
+            full_path = os.path.join(output_dir, filename)
+
+            if re.match(regex_pattern, filename):
+                if os.path.exists(full_path):
+                    already_exist = True
+                    break
+
+        # Packed output goes next to the output folder, as <chapter>.cbz
+        archive_path = f"{output_dir}.cbz"
+        if self.output_format == "cbz" and os.path.exists(archive_path):
+            already_exist = True
+
+        # Partial outputs of an interrupted run aren't skipped
+        checkpoint = ChapterCheckpoint(output_dir, self.get_checkpoint_key(dirpath, load_json or self.use_result_json), self.use_checkpoint)
+
+        if already_exist and not checkpoint.exists():
+            if not (self.overwrite_result or overwrite):
+                logger.info(Fore.GREEN + f"- Files already exist in '{output_dir}'. SKIPPING...")
+                return None
+            else:
+                logger.info(Fore.GREEN + f"- Files already exist in '{output_dir}'. OVERWRITING...")
+
+        # Define result.json path
+        # An archive can't be written to, so its result.json always goes to the output folder
+        result_json_path = os.path.join(dirpath, "result.json") if self.result_json_path_ == "input" and not chapter_is_archive else os.path.join(output_dir, "result.json") if self.result_json_path_ == "output" else os.path.join(output_dir, "result.json")
+
+        # Filter for image files and sort files to ensure consistent merging order
+        image_files = [os.path.join(dirpath, f) for f in natsorted(filenames) if f.lower().endswith(image_extensions)]
+
+        if not image_files:
+            logger.info(Fore.BLUE + f"- No image in '{dirpath}'. SKIPPING...")
+            return None
+
+        metrics.start_chapter(dirpath)
+        checkpoint.start()
+
+        use_result_json = (self.use_result_json or load_json) and os.path.exists(result_json_path)
+
+        # Find recurring pages (credits, recruitment, etc) before decoding, so they're never loaded.
+        # Merged pages are detected & split together, so only separate pages can be reused.
+        use_page_cache = self.use_page_cache and not self.merge_images and not use_result_json
+        page_hashes = {}
+        cached_pages = {}
+
+        if use_page_cache:
+            page_cache = self.open_page_cache(input_path, output_path)
+            page_settings = self.get_page_settings()
+
+            with metrics.stage("page_cache"):
+                for n, file in enumerate(image_files):
+                    page_hashes[n] = hash_page(file)
+                    entry = page_cache.find(page_hashes[n], page_settings)
+                    if entry:
+                        cached_pages[n] = entry
+
+            if cached_pages:
+                logger.info(Fore.GREEN + f"- Reusing {len(cached_pages)} recurring pages from the page cache.")
+            metrics.count("cached_pages", len(cached_pages))
+
+        # Separate pages tiled at their full width are downscaled to the detection size anyway,
+        # so detection gets a copy decoded at a fraction of the size (JPEG only) and the full pages are kept for OCR & overlay
+        use_draft = self.det_draft and not self.merge_images and not use_result_json and self.tile_width == "original"
+
+        with metrics.stage("load"):
+            try:
+                # Decode now, all pages at once, so loading isn't counted as merging
+                images, drafts = load_images([None if n in cached_pages else file for n, file in enumerate(image_files)], self.load_workers, self.det_target_size if use_draft else None)
+            except IOError as e:
+                raise Exception(Fore.RED + f"Error opening image: {e}")
+        metrics.count("drafts", sum(draft is not None for draft in drafts))
+        metrics.count("pages", len(images))
+
+        if not images:
+            return None
+
+        # Get the most common original extension
+        original_extensions = []
+        for file in image_files:
+            original_extension = file.split('.')[-1].lower()
+            original_extensions.append(original_extension)
+            original_extension_counts = Counter(original_extensions)
+            common_original_extension, counts = original_extension_counts.most_common(1)[0]
+
+        if self.merge_images:
+            # --- Stage 1: Merge images into one ---
+            with metrics.stage("merge"):
+                merged_image = merge_images_vertically(images, output_dir, log_level)
+
+            image_width, image_height = merged_image.size
+
+            # Use existing result.json if set and exists
+            if use_result_json:
+                with metrics.stage("load_result"):
+                    recognitions = load_result_json(result_json_path, [memory, self.overwrite_memory, self.source_language, self.target_language], self.result_format)
+            else:
+                merged_detections = checkpoint.load("detections")
+
+                if merged_detections is None:
+                    # --- Stage 2: Detect Text Areas with ogkalu/comic-text-and-bubble-detector.onnx
+                    with metrics.stage("detect"):
+                        detections = self.detector.detect_image("", "", [merged_image, image_width, image_height], [self.det_tile_config, self.det_coarse_config, self.det_target_size, self.det_batch_size], output_dir, log_level)
+
+                    # Merge overlapping boxes by the specified number of times because 1x isn't enough to merge all of them
+                    with metrics.stage("merge_boxes"):
+                        for x in range(self.det_merge_times):
+                            detections = merge_overlapping_boxes(detections, self.det_merge_threshold)
+                            merged_detections = detections
+                    checkpoint.save("detections", merged_detections)
+                logger.success(f"Found {len(merged_detections)} detections.")
+                metrics.count("detections", len(merged_detections))
+
+                # --- Stage 3: Extract Texts with Manga OCR/PaddleOCR
+                with metrics.stage("ocr"):
+                    recognitions = self.recognize(merged_image, "", merged_detections, output_dir, checkpoint)
+                metrics.count("crops", len(merged_detections))
+
+            if index and not use_result_json:
+                index.mark_stage(dirpath, "ocr")
+
+            # --- Stage 4: Split Image Safely on Non-Text Areas ---
+            with metrics.stage("split"):
+                image_chunks, chunks_number = split_image_safely([merged_image, image_width, image_height], recognitions, self.max_height)
+        else:
+            image_chunks = []
+            recognitions = []
+
+            for n, image in enumerate(images):
+                if n in cached_pages:
+                    continue
+
+                image_width, image_height = image.size
+                image_name = f"image_{n:02d}"
+                image_chunks.append({
+                    "image_name": image_name,
+                    "image": image
+                })
+
+                # Use existing result.json if set and exists
+                if use_result_json:
+                    continue
+
+                merged_detections = checkpoint.load(f"detections{n}")
+
+                if merged_detections is None:
+                    # --- Stage 1: Detect Text Areas ogkalu/comic-text-and-bubble-detector.onnx
+                    resolved_tile_width = image_width if self.tile_width in ("original", "adaptive") else self.tile_width
+
+                    with metrics.stage("detect"):
+                        if image_width == self.det_target_size and resolved_tile_width == self.det_target_size:
+                            logger.info(f"\nDetecting text areas with ogkalu/comic-text-and-bubble-detector.onnx...")
+                            detections = self.detector.detect_text_areas(image_name, n, image, target_sizes=[self.det_target_size, self.det_target_size], log_level=log_level, image_tiled=False)
+                            metrics.count("tiles")
+                        elif drafts[n] is not None:
+                            draft = drafts[n]
+                            detections = self.detector.detect_image(image_name, n, [draft, draft.width, draft.height], [self.det_tile_config, self.det_coarse_config, self.det_target_size, self.det_batch_size], output_dir, log_level)
+                            detections = scale_detections(detections or [], image_width / draft.width, image_height / draft.height)
+                            drafts[n] = None
+                        else:
+                            detections = self.detector.detect_image(image_name, n, [image, image_width, image_height], [self.det_tile_config, self.det_coarse_config, self.det_target_size, self.det_batch_size], output_dir, log_level)
+
+                    # Merge overlapping boxes by the specified number of times because 1x isn't enough to merge all of them
+                    merged_detections = detections or []
+                    with metrics.stage("merge_boxes"):
+                        for x in range(self.det_merge_times):
+                            detections = merge_overlapping_boxes(detections, self.det_merge_threshold)
+                            merged_detections = detections
+                    checkpoint.save(f"detections{n}", merged_detections)
+
+                if not merged_detections:
+                    logger.warning(Fore.YELLOW + "NO DETECTION! SKIPPING...")
+                    continue
+
+                logger.success(f"Found {len(merged_detections)} detections.")
+                metrics.count("detections", len(merged_detections))
+
+                # --- Stage 2: Extract Texts with Manga OCR/PaddleOCR
+                with metrics.stage("ocr"):
+                    recognition = self.recognize(image, n, merged_detections, output_dir, checkpoint)
+                metrics.count("crops", len(merged_detections))
+
+                recognitions.extend(recognition)
+
+            if use_result_json:
+                with metrics.stage("load_result"):
+                    recognitions = load_result_json(result_json_path, [memory, self.overwrite_memory, self.source_language, self.target_language], self.result_format)
+            elif index:
+                index.mark_stage(dirpath, "ocr")
+
+        # --- Stage 5/3: Translate Extracted Text with Gemini or from memory ---
+        # Use existing result.json if set and exists
+        if use_result_json:
+            translated_text_data = recognitions
+        else:
+            glossary_path = os.path.join(input_path, "glossary.db") if self.glossary_path_ == "input" else os.path.join(output_path, "glossary.db") if self.glossary_path_ == "output" else self.glossary_path_
+
+            translated_text_data = checkpoint.load("translation")
+
+            if translated_text_data is not None:
+                logger.info(Fore.GREEN + f"\nLoaded {len(translated_text_data)} translated texts from the unfinished run.")
+            else:
+                # Keep sound effects & watermarks away from the translator and the overlay
+                filtered = []
+                if self.use_filter:
+                    with metrics.stage("filter"):
+                        text_filter = get_text_filter(get_filter_path(self.source_language, lang_code_jp), self.filter_watermarks)
+                        recognitions, filtered = text_filter.apply(recognitions, self.filter_action)
+
+                if not self.use_memory:
+                    translated_text_data = self.translate(recognitions, glossary_path, memory)
+                else:
+                    with metrics.stage("translate"):
+                        translated_text_data = translate_texts_from_memory(recognitions, [self.source_language, self.target_language], memory, log_level)
+
+                translated_text_data = translated_text_data + filtered
+                checkpoint.save("translation", translated_text_data)
+
+            for n, entry in cached_pages.items():
+                translated_text_data = translated_text_data + page_cache.restore(entry, f"image_{n:02d}", n)
+
+            # Save result to result.json
+            with metrics.stage("save"):
+                storage.write_back(save_result_json, result_json_path, list(translated_text_data), self.result_format)
+
+            if index:
+                index.mark_stage(dirpath, "translate")
+
+        # Images are packed into one archive from a background thread, together with result.json
+        # An interrupted chapter resumes with the pages already in its unfinished archive
+        writer = ArchiveWriter(archive_path, resume=checkpoint.resumed) if self.output_format == "cbz" else None
+
+        try:
+            for n, entry in cached_pages.items():
+                page_cache.copy_render(entry, output_dir, f"image_{n:02d}", writer)
+
+            # Inpainting runs one image at a time with the whole budget, also when OCR was skipped
+            if self.use_inpainting:
+                budget.use_torch_threads(budget.cpus)
+
+            # --- Stage 6/4: Whiten Text Areas & Overlay Translated Texts to Split Images ---
+            with metrics.stage("overlay"):
+                overlay_translated_texts(
+                    image_chunks, self.merge_images, translated_text_data,
+                    [self.box_offset, self.box_padding, self.box_fill_color, self.box_outline_color, self.box_outline_thickness],
+                    [self.use_inpainting, self.inpainter], [self.font_min, self.font_max, self.font_color, self.font_path],
+                    common_original_extension, [self.source_language, lang_code_jp], output_dir, log_level, checkpoint, writer
+                )
+
+            # Wait for the queued writes before the chapter counts as done
+            with metrics.stage("save"):
+                storage.flush()
+
+            if writer:
+                if os.path.exists(result_json_path) and not writer.has("result.json"):
+                    writer.add("result.json", result_json_path)
+                with metrics.stage("save"):
+                    writer.close()
+        except BaseException:
+            # Keep the unfinished archive for the checkpoint to resume from
+            if writer:
+                writer.abort(keep=self.use_checkpoint)
+            raise
+
+        checkpoint.clear()
+
+        if index:
+            index.mark_stage(dirpath, "overlay")
+
+        # Remember the new pages, in case they recur in later chapters
+        for n, page in page_hashes.items():
+            image_name = f"image_{n:02d}"
+            render_path = os.path.join(archive_path if writer else output_dir, f"{image_name}.{common_original_extension}")
+            if n not in cached_pages and image_exists(render_path):
+                page_cache.add(page, page_settings, [item for item in translated_text_data if item.get("image_name") == image_name], render_path)
+
+        return metrics.end_chapter(log_level)
+
+    def recognize(self, image: object, number: int | str, detections: list[dict], output_dir: str, checkpoint: ChapterCheckpoint | None = None) -> list[dict]:
+        """
+        Extracts texts with Manga OCR for Japanese or PaddleOCR for the other languages, skipping crops in the OCR cache.
+        Detections are recognized in chunks of ocr_chunk_size, each saved to the checkpoint once it's done.
+        """
+        chunk_size = self.ocr_chunk_size or len(detections) or 1
+        recognitions = []
+
+        for first in range(0, len(detections), chunk_size):
+            chunk = checkpoint.load(f"ocr{number}_{first}") if checkpoint else None
+
+            if chunk is None:
+                if self.source_language in lang_code_jp:
+                    chunk = self.extractor.batch_threaded2(image, number, detections[first:first + chunk_size], [self.use_upscaler, self.upscale_ratio], output_dir, self.log_level, first, self.ocr_cache)
+                else:
+                    chunk = self.extractor.batch_threaded(image, number, detections[first:first + chunk_size], [self.use_upscaler, self.upscale_ratio], output_dir, self.log_level, first, self.ocr_cache)
+
+                if checkpoint:
+                    checkpoint.save(f"ocr{number}_{first}", chunk)
+
+            recognitions.extend(chunk)
+
+        return recognitions
+
+    def translate(self, recognitions: list[dict], glossary_path: str, memory: object) -> list[dict]:
+        """Translates with the LLM, retrying in case of any translation errors."""
+        attempts = 0
+
+        while attempts <= self.max_retries:
+            try:
+                with metrics.stage("translate"):
+                    return translate_texts_and_build_glossary(recognitions, [self.source_language, self.target_language], self.translator, glossary_path, [memory, self.overwrite_memory], self.log_level)
+            except Exception as e:
+                attempts += 1
+                logger.error(f"\n{Fore.RED}{type(e).__name__}: {e}")
+                if attempts <= self.max_retries:
+                    logger.info(f"({attempts}/{self.max_retries}) Retrying in {self.retry_delay} seconds...")
+                    time.sleep(self.retry_delay)
+                else:
+                    raise Exception(Fore.RED + "Max retries reached!")
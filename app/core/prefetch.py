@@ -0,0 +1,52 @@
+import queue
+import threading
+
+
+class PrefetchError:
+    """Carries an exception raised by the producer thread over to the consumer."""
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+def prefetch(iterable, depth: int = 2):
+    """
+    Iterates over an iterable in a background thread, keeping up to depth items ready ahead of the consumer.
+    Useful when producing the next item (e.g. tiling) and consuming the current one (e.g. inference) both release the GIL.
+    """
+    buffer = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        # Wait for space, but give up once the consumer has stopped
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(PrefetchError(e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, PrefetchError):
+                raise item.exception
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,184 @@
+import os
+import json
+import random
+import hashlib
+import numpy as np
+from PIL import Image
+from loguru import logger
+from natsort import natsorted
+from colorama import Fore, Style, init
+
+from app.core.image_utils_pil import generate_tiles, image_to_array, plan_detection_tiles
+
+
+init(autoreset=True)
+
+image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+
+class TileCalibrationReader:
+    """
+    Feeds preprocessed detection tiles to ONNX Runtime's static quantization calibrator.
+    It follows onnxruntime.quantization.CalibrationDataReader, which isn't imported here to keep onnx optional.
+    """
+
+    def __init__(self, tiles: list[np.ndarray], target_size: int):
+        self.inputs = iter([
+            {
+                "images": tile,
+                "orig_target_sizes": np.array([[target_size, target_size]], dtype=np.int64),
+            }
+            for tile in tiles
+        ])
+
+    def get_next(self) -> dict | None:
+        return next(self.inputs, None)
+
+    def rewind(self):
+        pass
+
+
+def resolve_quantization_method(method: str, calibration_dir: str | None) -> str:
+    """Returns the method that will actually be used: "static" falls back to "dynamic" without a calibration folder."""
+    if method == "static" and not (calibration_dir and os.path.isdir(calibration_dir)):
+        logger.warning(Fore.YELLOW + f"Calibration folder '{calibration_dir}' not found. Falling back to dynamic quantization...")
+        return "dynamic"
+    return method
+
+
+def get_quantized_model_path(snapshot_path: str, file_name: str, method: str, calibration: list[str | int | list]) -> str:
+    """
+    Returns where the quantized model is kept. A statically quantized model depends on what it was calibrated on,
+    so its name also has a hash of the calibration settings ([calibration_dir, calibration_tiles, DETECTION.tile]).
+    """
+    base_name = os.path.splitext(file_name)[0]
+    if method != "static":
+        return f"{snapshot_path}/quantized/{base_name}-int8-{method}.onnx"
+
+    calibration_dir, calibration_tiles, tile_config = calibration
+    key = json.dumps([os.path.abspath(calibration_dir), calibration_tiles, tile_config], sort_keys=True)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:10]
+    return f"{snapshot_path}/quantized/{base_name}-int8-{method}-{digest}.onnx"
+
+
+def load_calibration_tiles(image_dir: str, tile_config: dict, target_size: int, max_tiles: int) -> list[np.ndarray]:
+    """
+    Slices the images in a folder the same way as the detection stage and samples up to max_tiles preprocessed tiles.
+    Tiles are sampled as they're made (reservoir sampling), so only max_tiles of them are ever kept in memory.
+    """
+    from app.core.detection import preprocess_tile
+
+    image_files = natsorted(
+        os.path.join(image_dir, f) for f in os.listdir(image_dir) if f.lower().endswith(image_extensions)
+    )
+
+    # Sample evenly across the folder instead of taking only the first pages
+    rng = random.Random(0)
+    tiles = []
+    seen = 0
+
+    for file in image_files:
+        with Image.open(file) as img:
+            image_np = image_to_array(img)
+
+        tile_height, tile_width, overlap, positions = plan_detection_tiles(image_np, tile_config, target_size)
+        image_slices = generate_tiles(
+            image_np, positions, tile_height, tile_width, target_size,
+            tile_config.get('resample', "bilinear"), tile_config.get('blank_threshold', 0)
+        )
+
+        for slice in image_slices:
+            seen += 1
+            # Copied, as a tile can be a view that would keep its whole image in memory
+            if len(tiles) < max_tiles:
+                tiles.append(np.array(slice["image"]))
+            else:
+                replaced = rng.randrange(seen)
+                if replaced < max_tiles:
+                    tiles[replaced] = np.array(slice["image"])
+
+    return [preprocess_tile(tile) for tile in tiles]
+
+
+def quantize_detector(model_path: str, quantized_model_path: str, method: str, calibration: list[str | int | list]) -> str:
+    """
+    Produces an INT8 copy of the detection model.
+
+    :param method: "dynamic" (weights only, no calibration) or "static" (weights & activations, calibrated on sample tiles),
+        as resolved by resolve_quantization_method().
+    :param calibration: [calibration_dir, max_tiles, DETECTION.tile, target_size].
+
+    :return: Path to the quantized model.
+    """
+    try:
+        from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError as e:
+        raise ImportError(Fore.RED + f"INT8 quantization needs the onnx package. Install it with 'pip install onnx'. ({e})")
+
+    calibration_dir, max_tiles, tile_config, target_size = calibration
+
+    os.makedirs(os.path.dirname(quantized_model_path), exist_ok=True)
+    temp_path = f"{quantized_model_path}.tmp.onnx"
+
+    logger.info(Style.BRIGHT + Fore.YELLOW + f"Quantizing detection model to INT8 ({method})...")
+
+    if method == "dynamic":
+        quantize_dynamic(model_path, temp_path, weight_type=QuantType.QInt8)
+    elif method == "static":
+        tiles = load_calibration_tiles(calibration_dir, tile_config, target_size, max_tiles)
+        if not tiles:
+            raise Exception(Fore.RED + f"No calibration images in '{calibration_dir}'!")
+        logger.info(f"Calibrating on {len(tiles)} tiles from '{calibration_dir}'...")
+
+        # Shape inference & graph cleanup make the calibrator place quantization nodes correctly
+        preprocessed_path = f"{quantized_model_path}.pre.onnx"
+        quant_pre_process(model_path, preprocessed_path, skip_symbolic_shape=True)
+
+        quantize_static(
+            preprocessed_path,
+            temp_path,
+            TileCalibrationReader(tiles, target_size),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+        os.remove(preprocessed_path)
+    else:
+        raise ValueError(Fore.RED + f"Unknown quantization method '{method}'! Use \"dynamic\" or \"static\".")
+
+    os.replace(temp_path, quantized_model_path)
+    logger.info(Style.BRIGHT + Fore.GREEN + f"Quantized model saved to: {quantized_model_path}\n")
+
+    return quantized_model_path
+
+
+def match_detections(reference: list[dict], candidate: list[dict], iou_threshold: float) -> list[float]:
+    """
+    Greedily matches candidate boxes to reference boxes by IoU.
+
+    :return: The IoU of each matched reference box.
+    """
+    from app.core.detection import calculate_iou_2d, get_bbox_coords
+
+    reference_coords = [get_bbox_coords(item["box"]) for item in reference]
+    candidate_coords = [get_bbox_coords(item["box"]) for item in candidate]
+
+    pairs = []
+    for r, r_coords in enumerate(reference_coords):
+        for c, c_coords in enumerate(candidate_coords):
+            iou = calculate_iou_2d(r_coords, c_coords)
+            if iou >= iou_threshold:
+                pairs.append((iou, r, c))
+
+    matched_ious = []
+    used_reference, used_candidate = set(), set()
+    for iou, r, c in sorted(pairs, reverse=True):
+        if r in used_reference or c in used_candidate:
+            continue
+        used_reference.add(r)
+        used_candidate.add(c)
+        matched_ious.append(iou)
+
+    return matched_ious
@@ -0,0 +1,122 @@
+import os
+import sys
+import math
+from loguru import logger
+
+
+def read_cpu_max(path: str) -> float | None:
+    """Reads a cgroup v2 cpu.max ("<quota> <period>" or "max <period>") as a number of CPUs."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        return None
+    return None if quota == "max" else int(quota) / int(period)
+
+
+def read_cfs_quota(folder: str) -> float | None:
+    """Reads a cgroup v1 CFS quota (cpu.cfs_quota_us / cpu.cfs_period_us) as a number of CPUs."""
+    try:
+        with open(os.path.join(folder, "cpu.cfs_quota_us"), "r", encoding="utf-8") as f:
+            quota = int(f.read())
+        with open(os.path.join(folder, "cpu.cfs_period_us"), "r", encoding="utf-8") as f:
+            period = int(f.read())
+    except (OSError, ValueError):
+        return None
+    return None if quota <= 0 or period <= 0 else quota / period
+
+
+def get_cgroup_cpu_limit() -> float | None:
+    """Returns the CPU quota of this process's cgroup (e.g. a container's --cpus), or None if it has none."""
+    try:
+        with open("/proc/self/cgroup", "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    limits = []
+    for line in lines:
+        try:
+            hierarchy, controllers, path = line.split(":", 2)
+        except ValueError:
+            continue
+
+        if hierarchy == "0" and not controllers:
+            # cgroup v2: a parent's quota limits every cgroup below it
+            while True:
+                limits.append(read_cpu_max(os.path.join("/sys/fs/cgroup", path.lstrip("/"), "cpu.max")))
+                if path in ("/", ""):
+                    break
+                path = os.path.dirname(path)
+        elif "cpu" in controllers.split(","):
+            # cgroup v1: mounted as cpu or cpu,cpuacct, with the container's own cgroup at its root
+            for mount in ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct"):
+                limits.append(read_cfs_quota(os.path.join(mount, path.lstrip("/"))))
+                limits.append(read_cfs_quota(mount))
+
+    limits = [limit for limit in limits if limit]
+    return min(limits) if limits else None
+
+
+def get_available_cpus() -> tuple[int, str]:
+    """Returns how many CPUs this process can actually use, from its affinity and cgroup quota, and what limits it."""
+    host_cpus = os.cpu_count() or 1
+    cpus, reason = host_cpus, "host"
+
+    if hasattr(os, "sched_getaffinity"):
+        affinity = len(os.sched_getaffinity(0))
+        if affinity < cpus:
+            cpus, reason = affinity, "affinity"
+
+    quota = get_cgroup_cpu_limit()
+    if quota and math.ceil(quota) < cpus:
+        cpus, reason = max(1, math.ceil(quota)), "cgroup quota"
+
+    return cpus, reason
+
+
+class ThreadBudget:
+    """
+    Hands out thread counts to ONNX Runtime, PaddleOCR, torch and the thread pools from one CPU budget,
+    so they don't each size themselves to the whole host and oversubscribe it.
+
+    The budget is the CPUs this process may use (affinity & cgroup quota, not os.cpu_count()), divided by the
+    number of processes sharing them. Stages run one after another, so each gets the whole budget: detection
+    gives it to ONNX Runtime, and OCR to the model. OCR's worker threads take turns on the model, so each call gets all of it.
+    """
+
+    def __init__(self):
+        self.env = {}
+        self.configure({}, quiet=True)
+
+    def configure(self, config: dict, quiet: bool = False):
+        """Reads GENERAL.threads from config.json."""
+        available, reason = get_available_cpus()
+        if config.get('cpus'):
+            available, reason = config['cpus'], "config.json"
+
+        self.processes = max(1, config.get('processes', 1))
+        self.cpus = max(1, available // self.processes)
+        self.ocr_workers = max(1, min(self.cpus, config.get('ocr_workers') or self.cpus // 2))
+        # The OCR workers run the model one at a time (under the OCR lock), so a call isn't limited to a share
+        self.ocr_threads = self.cpus
+        self.load_workers = min(8, self.cpus)
+
+        # For libraries that size their thread pools from these when they're loaded (e.g. OpenMP in torch & Paddle).
+        # Values set outside of the app are kept.
+        for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            if os.environ.get(name, self.env.get(name)) == self.env.get(name):
+                os.environ[name] = self.env[name] = str(self.cpus)
+
+        if not quiet:
+            logger.debug(f"Thread budget: {self.cpus} CPUs ({available} by {reason}, {self.processes} processes), OCR: {self.ocr_workers} workers, {self.ocr_threads} model threads.")
+
+    def use_torch_threads(self, threads: int):
+        """Sets torch's thread count for the next stage, if torch is loaded. It's shared by the whole process."""
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.get_num_threads() != threads:
+            torch.set_num_threads(threads)
+
+
+# Shared instance, like metrics
+budget = ThreadBudget()
@@ -1,8 +1,21 @@
+import os
 import json
+import mmap
+import struct
+import zipfile
 import numpy as np
 from loguru import logger
 
 
+# Columns with a fixed dtype in result.npz. Any other key is kept in the "extra" JSON column.
+NUMERIC_COLUMNS = {
+    "confidence": np.float64,
+    "text_confidence": np.float64,
+    "center_y": np.float64,
+}
+STRING_COLUMNS = ("image_name", "original_text", "translated_text")
+
+
 class NumpyEncoder(json.JSONEncoder):
     def default(self, obj):
         # Convert NumPy arrays to lists
@@ -17,26 +30,168 @@ class NumpyEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
-def save_result_json(result_json_path: str, translated_text_data: list[dict]):
+def get_result_npz_path(result_json_path: str) -> str:
+    """Returns the path of the columnar store that lives next to result.json."""
+    return os.path.splitext(result_json_path)[0] + ".npz"
+
+
+def save_result_json(result_json_path: str, translated_text_data: list[dict], result_format: str = "json"):
     with open(result_json_path, 'w', encoding='utf-8') as f:
         json.dump(translated_text_data, f, cls=NumpyEncoder, ensure_ascii=False, indent=4)
 
+    # Keep result.json for humans and add the columnar copy for fast re-renders
+    if result_format == "npz":
+        save_result_npz(get_result_npz_path(result_json_path), translated_text_data)
 
-def load_result_json(result_json_path: str, memory: list[object|str|bool]):
+
+def load_result_json(result_json_path: str, memory: list[object|str|bool], result_format: str = "json"):
     logger.info(f"\nLoading existing result.json...")
 
     tm, overwrite_memory, source_language, target_language = memory
 
-    with open(result_json_path, "r", encoding="utf-8") as f:
-        loaded_result_json = json.load(f)
+    result_npz_path = get_result_npz_path(result_json_path)
+
+    # Prefer result.npz unless result.json has been edited after it was written
+    if result_format == "npz" and os.path.exists(result_npz_path) and os.path.getmtime(result_npz_path) >= os.path.getmtime(result_json_path):
+        loaded_result_json = load_result_npz(result_npz_path)
+    else:
+        with open(result_json_path, "r", encoding="utf-8") as f:
+            loaded_result_json = json.load(f)
+
+        for item in loaded_result_json:
+            # Convert bounding boxes back to NumPy arrays
+            item["box"] = np.array(item["box"], dtype=np.int32)
+
+        # Write the columnar copy so the next load can skip JSON parsing
+        if result_format == "npz":
+            save_result_npz(result_npz_path, loaded_result_json)
 
-    for item in loaded_result_json:
-        # Convert bounding boxes back to NumPy arrays
-        item["box"] = np.array(item["box"], dtype=np.int32)
-        # Overwrite or keep translation memory
-        if overwrite_memory:
-            tm.add_translation(item["original_text"], source_language, item["translated_text"], target_language, overwrite_memory)
+    # Overwrite or keep translation memory in one transaction
+    if overwrite_memory:
+        tm.add_translations(
+            [(item["original_text"], item["translated_text"]) for item in loaded_result_json],
+            source_language,
+            target_language,
+            overwrite_memory,
+        )
 
     logger.success(f"Existing result.json loaded.")
 
-    return loaded_result_json
\ No newline at end of file
+    return loaded_result_json
+
+
+def encode_string_column(values: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Packs strings into one UTF-8 byte buffer plus an offsets array (Arrow-style string column)."""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return data, offsets
+
+
+def decode_string_column(data: np.ndarray, offsets: np.ndarray) -> list[str]:
+    buffer = data.tobytes()
+    bounds = offsets.tolist()
+    return [buffer[start:end].decode("utf-8") for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def save_result_npz(result_npz_path: str, translated_text_data: list[dict]):
+    """
+    Saves results as an uncompressed (stored) .npz so every column can be memory-mapped on load.
+    """
+    columns = {}
+
+    boxes = [np.asarray(item["box"], dtype=np.int32).reshape(4, 2) for item in translated_text_data]
+    columns["box"] = np.stack(boxes) if boxes else np.zeros((0, 4, 2), dtype=np.int32)
+
+    for name, dtype in NUMERIC_COLUMNS.items():
+        columns[name] = np.array([item.get(name, 0) for item in translated_text_data], dtype=dtype)
+
+    # "number" is an int for unmerged images and "" for merged ones
+    columns["number"] = np.array(
+        [item["number"] if isinstance(item.get("number"), (int, np.integer)) else -1 for item in translated_text_data],
+        dtype=np.int32,
+    )
+
+    for name in STRING_COLUMNS:
+        data, offsets = encode_string_column([str(item.get(name, "")) for item in translated_text_data])
+        columns[f"{name}_data"] = data
+        columns[f"{name}_offsets"] = offsets
+
+    known_keys = {"box", "number", *NUMERIC_COLUMNS, *STRING_COLUMNS}
+    extras = [
+        json.dumps({key: value for key, value in item.items() if key not in known_keys}, cls=NumpyEncoder, ensure_ascii=False)
+        for item in translated_text_data
+    ]
+    columns["extra_data"], columns["extra_offsets"] = encode_string_column(extras)
+
+    # Write to a temporary file first so readers never see a half-written store
+    temp_path = f"{result_npz_path}.tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(temp_path, result_npz_path)
+
+
+def mmap_npz(result_npz_path: str) -> dict[str, np.ndarray]:
+    """
+    Memory-maps every stored member of an .npz file without reading the arrays into memory.
+    """
+    with zipfile.ZipFile(result_npz_path) as zf:
+        infos = zf.infolist()
+        if any(info.compress_type != zipfile.ZIP_STORED for info in infos):
+            # Compressed members can't be mapped, so read them normally
+            with np.load(result_npz_path) as npz:
+                return {name: npz[name] for name in npz.files}
+
+    arrays = {}
+    with open(result_npz_path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        for info in infos:
+            # Skip the local file header to get to the .npy payload
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+            count = int(np.prod(shape))
+            array = np.frombuffer(mm, dtype=dtype, count=count, offset=f.tell()) if count else np.empty(0, dtype=dtype)
+            arrays[os.path.splitext(info.filename)[0]] = array.reshape(shape, order="F" if fortran_order else "C")
+
+    return arrays
+
+
+def load_result_npz(result_npz_path: str) -> list[dict]:
+    columns = mmap_npz(result_npz_path)
+
+    # Copy the boxes once so the rows don't keep the file mapped
+    boxes = np.array(columns["box"], dtype=np.int32)
+    numbers = columns["number"].tolist()
+    numerics = {name: columns[name].tolist() for name in NUMERIC_COLUMNS}
+    strings = {name: decode_string_column(columns[f"{name}_data"], columns[f"{name}_offsets"]) for name in STRING_COLUMNS}
+    extras = decode_string_column(columns["extra_data"], columns["extra_offsets"])
+    del columns
+
+    loaded_result = []
+    for i in range(len(boxes)):
+        item = {
+            "box": boxes[i],
+            "confidence": numerics["confidence"][i],
+            "original_text": strings["original_text"][i],
+            "text_confidence": numerics["text_confidence"][i],
+            "translated_text": strings["translated_text"][i],
+            "center_y": numerics["center_y"][i],
+            "image_name": strings["image_name"][i],
+            "number": numbers[i] if numbers[i] >= 0 else "",
+        }
+        if extras[i] != "{}":
+            item.update(json.loads(extras[i]))
+        loaded_result.append(item)
+
+    return loaded_result
@@ -0,0 +1,193 @@
+import os
+import io
+import time
+import queue
+import shutil
+import hashlib
+import tempfile
+import threading
+from loguru import logger
+from natsort import natsorted
+
+from app.core.metrics import metrics
+from app.core.archive import open_image_file, read_file
+
+
+class Storage:
+    """
+    File access for libraries on network shares (SMB/NFS), where every open costs a round trip.
+
+    With read_ahead, the pages of the next chapters are copied to a folder of their own in spool_path in the background
+    while the current chapter is in the models, up to spool_size_mb, and pages are opened from there.
+    With write_back, output images & result.json are written by a background thread in the order they were queued,
+    and flush() waits for them. latency_ms adds a delay to every read & write of the library, to test both without a share.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.space = threading.Condition(self.lock)
+        self.spooled = {} # path -> (spooled path, size, chapter)
+        self.spool_bytes = 0
+        self.released = set()
+        self.prefetcher = None
+        self.spool_dir = None
+        self.stop_prefetch = threading.Event()
+        self.writes = None
+        self.writer = None
+        self.write_error = None
+        self.configure({})
+
+    def configure(self, config: dict):
+        """Reads GENERAL.io from config.json. Queued writes are finished first."""
+        self.flush()
+        self.read_ahead = config.get('read_ahead', False)
+        self.spool_path = config.get('spool_path', "temp/spool")
+        self.spool_size = config.get('spool_size_mb', 1024) * 1024 * 1024
+        self.write_back_enabled = config.get('write_back', False)
+        self.write_queue_size = config.get('write_queue_size', 4)
+        self.latency = config.get('latency_ms', 0) / 1000
+
+    def wait(self):
+        """Stands in for the round trip of a network share."""
+        if self.latency:
+            time.sleep(self.latency)
+
+    # --- Read-ahead ---
+
+    def prefetch(self, chapters: list[tuple[str, list[str]]]):
+        """Starts copying the pages of chapters (folder or archive, image names) to the spool, in order."""
+        if not self.read_ahead or not chapters:
+            return
+
+        self.cancel()
+        # A folder of its own in spool_path, so emptying the spool never touches anything else there
+        os.makedirs(self.spool_path, exist_ok=True)
+        self.spool_dir = tempfile.mkdtemp(prefix="spool-", dir=self.spool_path)
+        self.stop_prefetch = threading.Event()
+        self.prefetcher = threading.Thread(target=self._prefetch, args=(chapters, self.spool_dir, self.stop_prefetch), daemon=True)
+        self.prefetcher.start()
+
+    def _prefetch(self, chapters: list[tuple[str, list[str]]], spool_dir: str, stop: threading.Event):
+        for chapter, filenames in chapters:
+            for filename in natsorted(filenames):
+                if stop.is_set():
+                    return
+                if chapter in self.released:
+                    break
+
+                path = os.path.join(chapter, filename)
+                try:
+                    self.wait()
+                    data = read_file(path)
+                except Exception as e:
+                    # The page is read from the library instead when it's needed
+                    logger.debug(f"Couldn't prefetch '{path}': {e}")
+                    continue
+
+                # Wait until finished chapters free enough of the spool
+                with self.space:
+                    while self.spool_bytes and self.spool_bytes + len(data) > self.spool_size and not stop.is_set() and chapter not in self.released:
+                        self.space.wait(1)
+                if stop.is_set():
+                    return
+                if chapter in self.released:
+                    break
+
+                spooled_path = os.path.join(spool_dir, hashlib.sha1(path.encode("utf-8")).hexdigest() + os.path.splitext(filename)[1])
+                with open(spooled_path, "wb") as f:
+                    f.write(data)
+
+                with self.lock:
+                    self.spooled[path] = (spooled_path, len(data), chapter)
+                    self.spool_bytes += len(data)
+
+    def open_page(self, path: str) -> str | io.BytesIO:
+        """Returns what to open a page from: its spooled copy if it was prefetched, or the page itself."""
+        with self.lock:
+            spooled = self.spooled.get(path)
+
+        if spooled:
+            metrics.count("spool_hits")
+            return spooled[0]
+
+        self.wait()
+        return open_image_file(path)
+
+    def release(self, chapter: str):
+        """Removes a finished chapter's pages from the spool, making room for the next ones."""
+        with self.space:
+            self.released.add(chapter)
+            for path, (spooled_path, size, spooled_chapter) in list(self.spooled.items()):
+                if spooled_chapter == chapter:
+                    del self.spooled[path]
+                    self.spool_bytes -= size
+                    try:
+                        os.remove(spooled_path)
+                    except OSError:
+                        pass
+            self.space.notify_all()
+
+    def cancel(self):
+        """Stops prefetching and empties the spool."""
+        if not self.read_ahead:
+            return
+
+        self.stop_prefetch.set()
+        with self.space:
+            self.space.notify_all()
+        if self.prefetcher:
+            self.prefetcher.join()
+            self.prefetcher = None
+
+        with self.lock:
+            self.spooled = {}
+            self.spool_bytes = 0
+            self.released = set()
+        if self.spool_dir:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+            self.spool_dir = None
+
+    # --- Write-back ---
+
+    def write_back(self, func, *args):
+        """Runs a write (e.g. saving an image) in the background if write_back is enabled, or right away."""
+        if not self.write_back_enabled:
+            self.wait()
+            func(*args)
+            return
+
+        if self.write_error:
+            error, self.write_error = self.write_error, None
+            raise error
+
+        if self.writer is None:
+            # Bounded, so finished images waiting to be written don't pile up in memory
+            self.writes = queue.Queue(maxsize=self.write_queue_size)
+            self.writer = threading.Thread(target=self._write, daemon=True)
+            self.writer.start()
+        self.writes.put((func, args))
+
+    def _write(self):
+        while True:
+            func, args = self.writes.get()
+            try:
+                if not self.write_error:
+                    self.wait()
+                    func(*args)
+            except Exception as e:
+                self.write_error = e
+            finally:
+                self.writes.task_done()
+
+    def flush(self):
+        """Waits for the queued writes and raises the first one that failed."""
+        if self.writes is not None:
+            self.writes.join()
+
+        if self.write_error:
+            error, self.write_error = self.write_error, None
+            raise error
+
+
+# Shared instance, like metrics
+storage = Storage()
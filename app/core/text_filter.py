@@ -0,0 +1,122 @@
+import os
+import re
+import unicodedata
+from loguru import logger
+
+from app.core.metrics import metrics
+
+
+# Texts longer than this (after normalization) are never sound effects, which also keeps matching fast
+max_sfx_length = 24
+
+watermark_pattern = re.compile(
+    r"(https?://|www\.|\b[a-z0-9-]+\.(com|net|org|io|me|co|to|xyz|site|top|info|club|online|cc|tv)\b|@[a-z0-9_]{3,})",
+    re.IGNORECASE,
+)
+
+
+def get_filter_path(source_language: str, lang_code_jp: tuple[str]) -> str | None:
+    """Returns the filter list for the source language, if there's one."""
+    if source_language in lang_code_jp:
+        return "filters/manga.txt"
+    elif source_language == "korean":
+        return "filters/manhwa.txt"
+    elif source_language in ("ch", "chinese_cht"):
+        return "filters/manhua.txt"
+    return None
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes a text for matching: unifies full-width & compatibility characters, ignores case,
+    whitespace & punctuation, and shortens drawn-out sounds (e.g. "크으으윽!!" -> "크으윽").
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(char for char in text if not (char.isspace() or unicodedata.category(char)[0] in "PSZ"))
+    return re.sub(r"(.)\1{2,}", r"\1\1", text)
+
+
+class TextFilter:
+    """
+    Finds sound effects & watermarks among recognized texts, so they're never translated or overlaid.
+
+    Sound effects are loaded once from a filter list, one per line as `term` or `term/variant #(romanization): meanings`.
+    A text is a sound effect if it's one of them, or only made of them (e.g. "탁탁" or "두근 두근"),
+    which is checked with a set lookup first and then one compiled pattern of all of them.
+    """
+
+    def __init__(self, filter_path: str | None, watermarks: bool = True):
+        self.terms = set()
+        self.watermarks = watermarks
+
+        if filter_path and os.path.exists(filter_path):
+            with open(filter_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.split("#", 1)[0].split(":", 1)[0]
+                    for term in line.split("/"):
+                        term = normalize_text(term)
+                        if term:
+                            self.terms.add(term)
+
+        # Longest first, so e.g. "스으윽" is tried before "스"
+        alternatives = "|".join(re.escape(term) for term in sorted(self.terms, key=len, reverse=True))
+        self.pattern = re.compile(f"(?:{alternatives})+") if alternatives else None
+
+        logger.debug(f"Loaded {len(self.terms)} sound effects from '{filter_path}'.")
+
+    def classify(self, text: str) -> str | None:
+        """Returns "sfx" or "watermark" if the text is one, or None."""
+        if self.watermarks and watermark_pattern.search(text):
+            return "watermark"
+
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+        if normalized in self.terms:
+            return "sfx"
+        if self.pattern and len(normalized) <= max_sfx_length and self.pattern.fullmatch(normalized):
+            return "sfx"
+        return None
+
+    def apply(self, recognitions: list[dict], action: str = "tag") -> tuple[list[dict], list[dict]]:
+        """
+        Splits recognitions into the ones to translate and the filtered ones.
+        Filtered ones are dropped, or with action "tag", kept with their "filtered" reason and no translation
+        so they're still saved to result.json.
+        """
+        kept, filtered = [], []
+
+        for item in recognitions:
+            reason = self.classify(item["original_text"])
+            if reason is None:
+                kept.append(item)
+                continue
+
+            logger.debug(f"Filtered ({reason}): {item['original_text']}")
+            metrics.count("filtered")
+            if action == "tag":
+                item["filtered"] = reason
+                item["translated_text"] = ""
+                filtered.append(item)
+
+        if len(kept) < len(recognitions):
+            logger.info(f"\nFiltered out {len(recognitions) - len(kept)} sound effects & watermarks.")
+
+        return kept, filtered
+
+
+# (filter path, watermarks) -> (modification time of the list, its filter)
+text_filters = {}
+
+
+def get_text_filter(filter_path: str | None, watermarks: bool = True) -> TextFilter:
+    """Returns the filter for the list, only loading it again if the list changed."""
+    mtime = os.path.getmtime(filter_path) if filter_path and os.path.exists(filter_path) else None
+
+    cached = text_filters.get((filter_path, watermarks))
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    text_filter = TextFilter(filter_path, watermarks)
+    text_filters[(filter_path, watermarks)] = (mtime, text_filter)
+    return text_filter
@@ -2,13 +2,15 @@ import os
 import re
 import json
 import yaml
-import litellm
 from loguru import logger
 from dotenv import load_dotenv
 from colorama import Fore, Style, init
 
-from app.core.translation.glossary import load_glossary, update_glossary
+from app.core.translation.glossary import open_glossary, load_glossary, update_glossary
+from app.core.metrics import metrics
+from app.core.lazy import LazyModule
 
+litellm = LazyModule("litellm")
 
 init(autoreset=True)
 
@@ -20,7 +22,7 @@ def translate_texts_and_build_glossary(text_info_list: list[dict], languages: li
         return text_info_list
 
     source_lang, target_lang = languages
-    provider, model, base_url, temperature, top_p, max_out_tokens, timeout = translator
+    provider, model, base_url, temperature, top_p, max_out_tokens, timeout, api_keys = translator
     tm, overwrite_memory = memory
 
     logger.info(f"\nTranslating texts to ({target_lang.upper()}) with {provider.upper()}...")
@@ -28,8 +30,9 @@ def translate_texts_and_build_glossary(text_info_list: list[dict], languages: li
     # Define placeholder to prevent error when logging exception
     data_dict = "data_dict"
 
-    # Load existing glossary file
-    existing_glossary, ex_glossary_map, glossary_context = load_glossary(glossary_path, source_lang, target_lang)
+    # Load existing glossary file with only the terms found in this chapter
+    glossary = open_glossary(glossary_path)
+    glossary_map, glossary_context = load_glossary(glossary, source_lang, target_lang, [info['original_text'] for info in text_info_list])
 
     # Format input text as list separated by number tag
     enumerated_input = ""
@@ -47,11 +50,10 @@ def translate_texts_and_build_glossary(text_info_list: list[dict], languages: li
 
     logger.info(f"\nPROMPT:\n{prompt}")
 
-    # Load environment variables from .env file
-    load_dotenv()
-
-    # Get the API key from the environment variables
-    api_keys = os.getenv("API_KEYS", "").split(",")
+    # Get the API keys from the environment variables or .env file, unless the translator comes with its own
+    if api_keys is None:
+        load_dotenv()
+        api_keys = os.getenv("API_KEYS", "").split(",")
 
     # Create a model list for the Router
     # Each entry is a "deployment" the router can choose from
@@ -123,6 +125,11 @@ def translate_texts_and_build_glossary(text_info_list: list[dict], languages: li
             }
         )
 
+        usage = getattr(response, "usage", None)
+        if usage:
+            metrics.count("prompt_tokens", usage.prompt_tokens or 0)
+            metrics.count("completion_tokens", usage.completion_tokens or 0)
+
         data_dict = json.loads(response.choices[0].message.content)
 
         translation_text = f"{data_dict['Translation']}"
@@ -159,11 +166,13 @@ def translate_texts_and_build_glossary(text_info_list: list[dict], languages: li
             tm.add_translation(original_text, source_lang, translated_text, target_lang, overwrite_memory)
 
         # Update existing glossary
-        update_glossary(data_dict, existing_glossary, ex_glossary_map, glossary_path, source_lang, target_lang)
+        update_glossary(data_dict, glossary, source_lang, target_lang)
 
     except Exception as e:
         if data_dict:
             logger.debug(f"\n{data_dict}")
         raise type(e)(Fore.RED + f"{e}")
+    finally:
+        glossary.close()
 
     return text_info_list
\ No newline at end of file
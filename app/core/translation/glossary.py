@@ -1,57 +1,379 @@
 import os
 import json
+import sqlite3
+import argparse
 from loguru import logger
+from collections import deque
 
-def load_glossary(glossary_path: str, source_lang: str, target_lang: str):
+from app.core.metrics import metrics
 
-    if os.path.exists(glossary_path):
-        with open(glossary_path, "r", encoding="utf-8") as glossary:
-            existing_glossary = json.load(glossary)["GLOSSARY"]
 
-        # Create a lookup map for AI context: { "source term": "target term" }
-        ex_glossary_map = {item[source_lang]: item[target_lang] for item in existing_glossary if source_lang in item and target_lang in item}
+class GlossaryStore:
+    """
+    Keeps the glossary in SQLite, with each term indexed by language & text, like the translation memory.
 
-        glossary_context = json.dumps(ex_glossary_map, ensure_ascii=False)
-    else:
-        existing_glossary = []
-        ex_glossary_map = {}
-        glossary_context = "Not Available"
+    New terms are merged inside a write transaction, so runs that update the same glossary at once
+    wait for each other instead of overwriting each other's terms, and only the new terms are written.
+    """
+
+    def __init__(self, db_path: str = "glossary.db"):
+        self.db_path = db_path
+        # Wait for other runs' transactions instead of failing with "database is locked"
+        self.conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        self._create_tables()
+        self._migrate()
+
+    def _create_tables(self):
+        # Every language of a term shares its concept_id, like {"korean": "...", "english": "..."} in glossary.json
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS terms (
+                concept_id INTEGER,
+                lang TEXT,
+                term TEXT,
+                PRIMARY KEY (concept_id, lang)
+            )
+        """)
+        # Not unique, since different source terms can share a target term, like two names that are both "Kim"
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_terms_term ON terms (lang, term)
+        """)
+        # The version, bumped whenever terms are added so cached term indexes know when to rebuild,
+        # and the characters each language pair's terms take in the prompt ("chars:source:target")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            )
+        """)
+
+    def _migrate(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            schema = self._get_meta("schema")
+            if schema < 1:
+                # Count the prompt characters of the terms added before they were kept up to date by _add()
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO meta (key, value)
+                    SELECT 'chars:' || s.lang || ':' || t.lang, SUM(LENGTH(s.term) + LENGTH(t.term) + 8) FROM terms s
+                    JOIN terms t ON s.concept_id = t.concept_id AND s.lang != t.lang
+                    GROUP BY s.lang, t.lang
+                """)
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', 1)")
+            if schema < 2:
+                # Terms used to be unique per language, which dropped source terms whose target was already known
+                self.conn.execute("DROP INDEX IF EXISTS idx_terms_lang_term")
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', 2)")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _get_meta(self, key: str) -> int:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def version(self) -> int:
+        return self._get_meta("version")
+
+    def prompt_chars(self, source_lang: str, target_lang: str) -> int:
+        """Returns the length of the whole glossary's context in the prompt, without serializing it."""
+        return self._get_meta(f"chars:{source_lang}:{target_lang}")
+
+    def get_map(self, source_lang: str, target_lang: str) -> dict[str, str]:
+        """Returns { "source term": "target term" } for the terms that have both languages."""
+        return dict(self.conn.execute("""
+            SELECT s.term, t.term FROM terms s
+            JOIN terms t ON s.concept_id = t.concept_id
+            WHERE s.lang = ? AND t.lang = ?
+        """, (source_lang, target_lang)))
+
+    def get_source_terms(self, source_lang: str, target_lang: str) -> list[str]:
+        """Returns the source terms that have a target term, to index them."""
+        return [row[0] for row in self.conn.execute("""
+            SELECT DISTINCT s.term FROM terms s
+            JOIN terms t ON s.concept_id = t.concept_id
+            WHERE s.lang = ? AND t.lang = ?
+        """, (source_lang, target_lang))]
+
+    def get_targets(self, source_terms: list[str], source_lang: str, target_lang: str) -> dict[str, str]:
+        """Returns { "source term": "target term" } for only the given source terms."""
+        targets = {}
+        # Stay below SQLite's limit of variables per query
+        for first in range(0, len(source_terms), 500):
+            chunk = source_terms[first:first + 500]
+            targets.update(self.conn.execute(f"""
+                SELECT s.term, t.term FROM terms s
+                JOIN terms t ON s.concept_id = t.concept_id
+                WHERE s.lang = ? AND t.lang = ? AND s.term IN ({", ".join("?" * len(chunk))})
+            """, (source_lang, target_lang, *chunk)))
+        return targets
+
+    def _find(self, lang: str, term: str) -> int | None:
+        row = self.conn.execute("SELECT concept_id FROM terms WHERE lang = ? AND term = ?", (lang, term)).fetchone()
+        return row[0] if row else None
+
+    def _find_missing(self, lang: str, term: str, missing_lang: str) -> int | None:
+        """Returns a concept with the term that has no term in missing_lang yet."""
+        row = self.conn.execute("""
+            SELECT concept_id FROM terms t WHERE lang = ? AND term = ?
+            AND NOT EXISTS (SELECT 1 FROM terms WHERE concept_id = t.concept_id AND lang = ?)
+        """, (lang, term, missing_lang)).fetchone()
+        return row[0] if row else None
+
+    def _find_all(self, terms: list[tuple[str, str]]) -> int | None:
+        """Returns a concept that already has all the (language, term) pairs."""
+        lang, term = terms[0]
+        for (concept_id,) in self.conn.execute("SELECT concept_id FROM terms WHERE lang = ? AND term = ?", (lang, term)).fetchall():
+            if all(self._find_in(concept_id, other_lang) == other_term for other_lang, other_term in terms[1:]):
+                return concept_id
+        return None
+
+    def _find_in(self, concept_id: int, lang: str) -> str | None:
+        row = self.conn.execute("SELECT term FROM terms WHERE concept_id = ? AND lang = ?", (concept_id, lang)).fetchone()
+        return row[0] if row else None
+
+    def _new_concept(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(concept_id), 0) + 1 FROM terms").fetchone()[0]
+
+    def _add(self, concept_id: int, lang: str, term: str) -> int:
+        added_count = self.conn.execute("INSERT OR IGNORE INTO terms (concept_id, lang, term) VALUES (?, ?, ?)", (concept_id, lang, term)).rowcount
+        if added_count:
+            # Each pair takes "source": "target", in the prompt's JSON, both ways
+            others = self.conn.execute("SELECT lang, term FROM terms WHERE concept_id = ? AND lang != ?", (concept_id, lang)).fetchall()
+            for other_lang, other_term in others:
+                for key in (f"chars:{lang}:{other_lang}", f"chars:{other_lang}:{lang}"):
+                    self.conn.execute(
+                        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = value + excluded.value",
+                        (key, len(term) + len(other_term) + 8)
+                    )
+        return added_count
+
+    def merge(self, new_terms: dict[str, str], source_lang: str, target_lang: str) -> int:
+        """
+        Adds new (source term, target term) pairs and returns how many terms were added.
+        A known source term only gets its missing target term. An unknown one joins a concept that has the target term
+        but no source term yet, or becomes a new concept, so source terms sharing a target term are all kept.
+        """
+        added_count = 0
+
+        # Take the write lock before reading, so no other run can add the same terms in between
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for source_term, target_term in new_terms.items():
+                if not source_term or not target_term:
+                    continue
+
+                source_id = self._find(source_lang, source_term)
+
+                # Add target term if source term exists without one
+                if source_id is not None:
+                    if self._find_in(source_id, target_lang) is None:
+                        added_count += self._add(source_id, target_lang, target_term)
+                    continue
+
+                # Add source term to a concept that has the target term but no source term, or as a new concept
+                concept_id = self._find_missing(target_lang, target_term, source_lang)
+                if concept_id is None:
+                    concept_id = self._new_concept()
+                    added_count += self._add(concept_id, target_lang, target_term)
+                added_count += self._add(concept_id, source_lang, source_term)
+
+            if added_count:
+                self.conn.execute("INSERT INTO meta (key, value) VALUES ('version', 1) ON CONFLICT (key) DO UPDATE SET value = value + 1")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return added_count
+
+    def import_json(self, json_path: str) -> int:
+        """
+        Adds every item of a glossary.json as a concept of its own and returns how many terms were added.
+        Items that are already in the glossary with all their terms are skipped, so importing twice adds nothing.
+        """
+        with open(json_path, "r", encoding="utf-8") as f:
+            items = json.load(f)["GLOSSARY"]
+
+        added_count = 0
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for item in items:
+                terms = [(lang, term) for lang, term in item.items() if term]
+                if not terms or self._find_all(terms) is not None:
+                    continue
+
+                concept_id = self._new_concept()
+                for lang, term in terms:
+                    added_count += self._add(concept_id, lang, term)
+
+            if added_count:
+                self.conn.execute("INSERT INTO meta (key, value) VALUES ('version', 1) ON CONFLICT (key) DO UPDATE SET value = value + 1")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return added_count
+
+    def export_json(self, json_path: str):
+        """Writes the glossary in the glossary.json format."""
+        items = {}
+        for concept_id, lang, term in self.conn.execute("SELECT concept_id, lang, term FROM terms ORDER BY concept_id"):
+            items.setdefault(concept_id, {})[lang] = term
+
+        temp_path = f"{json_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"GLOSSARY": list(items.values())}, f, ensure_ascii=False, indent=4)
+        os.replace(temp_path, json_path)
 
-    return existing_glossary, ex_glossary_map, glossary_context
+    def close(self):
+        self.conn.close()
 
 
-def update_glossary(data_dict: dict, existing_glossary: list, ex_glossary_map: dict, glossary_path: str, source_lang: str, target_lang: str):
+def open_glossary(glossary_path: str) -> GlossaryStore:
+    """
+    Opens the glossary database. A .json path (the old format) opens the .db next to it instead,
+    importing the .json the first time so existing glossaries carry over.
+    """
+    json_path = os.path.splitext(glossary_path)[0] + ".json"
+    if glossary_path.lower().endswith(".json"):
+        glossary_path = os.path.splitext(glossary_path)[0] + ".db"
+
+    is_new = not os.path.exists(glossary_path)
+    store = GlossaryStore(glossary_path)
+
+    if is_new and os.path.exists(json_path):
+        added_count = store.import_json(json_path)
+        logger.info(f"Imported {added_count} terms from '{json_path}' to '{glossary_path}'.")
+
+    return store
+
+
+class GlossaryIndex:
+    """
+    Aho-Corasick automaton over the source terms of a glossary, to find every term that appears
+    in a chapter's texts in one pass over them, no matter how many terms the glossary has.
+
+    Matching ignores case and doesn't need word boundaries, since Japanese & Chinese have none.
+    """
+
+    def __init__(self, terms: list[str]):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.size = len(terms)
+
+        for term in terms:
+            key = term.casefold()
+            if not key:
+                continue
+
+            state = 0
+            for char in key:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(term)
+
+        # Link every state to the longest suffix that's also in the trie, breadth first
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, texts: list[str]) -> set[str]:
+        """Returns the terms that appear in any of the texts."""
+        found = set()
+        for text in texts:
+            state = 0
+            for char in text.casefold():
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                state = self.goto[state].get(char, 0)
+                found.update(self.output[state])
+        return found
+
+
+# (glossary path, source language, target language) -> (version of the glossary, its index)
+glossary_indexes = {}
+
+
+def get_glossary_index(glossary: GlossaryStore, source_lang: str, target_lang: str) -> GlossaryIndex:
+    """Returns the index of the glossary's source terms, only reading them again when terms were added."""
+    version = glossary.version()
+    cache_key = (os.path.abspath(glossary.db_path), source_lang, target_lang)
+
+    cached = glossary_indexes.get(cache_key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    index = GlossaryIndex(glossary.get_source_terms(source_lang, target_lang))
+    glossary_indexes[cache_key] = (version, index)
+    logger.debug(f"Indexed {index.size} glossary terms.")
+    return index
+
+
+def load_glossary(glossary: GlossaryStore, source_lang: str, target_lang: str, texts: list[str] | None = None) -> tuple[dict[str, str], str]:
+    """
+    Loads the glossary and returns its terms with the context for the prompt. If texts are given, only the terms
+    that appear in them are read from the glossary, so neither the prompt nor the work per chapter grows with it.
+    """
+    if texts is None:
+        glossary_map = glossary.get_map(source_lang, target_lang)
+        return glossary_map, json.dumps(glossary_map, ensure_ascii=False) if glossary_map else "Not Available"
+
+    index = get_glossary_index(glossary, source_lang, target_lang)
+    glossary_map = glossary.get_targets(sorted(index.find(texts)), source_lang, target_lang)
+    glossary_context = json.dumps(glossary_map, ensure_ascii=False) if glossary_map else "Not Available"
+
+    chars_saved = max(glossary.prompt_chars(source_lang, target_lang) - len(glossary_context), 0)
+    metrics.count("glossary_terms", len(glossary_map))
+    metrics.count("glossary_chars_saved", chars_saved)
+    logger.info(f"\nUsing {len(glossary_map)}/{index.size} glossary terms found in the texts ({len(glossary_context)} characters, {chars_saved} saved from the prompt).")
+    return glossary_map, glossary_context
+
+
+def update_glossary(data_dict: dict, glossary: GlossaryStore, source_lang: str, target_lang: str):
 
     new_glossary = {item["source_term"]: item["translated_term"] for item in data_dict["Glossary"]}
     logger.info(f"\nGLOSSARY:")
 
-    added_count = 0
     for source_term, target_term in new_glossary.items():
         logger.info(f"{source_term}: {target_term}")
-        # Add new dict if source and target terms do not exist
-        if source_term and source_term not in ex_glossary_map and target_term and target_term not in ex_glossary_map:
-            # Format: {"en": "...", "es": "..."},
-            new_item = {
-                source_lang: source_term,
-                target_lang: target_term
-            }
-            existing_glossary.append(new_item)
-            added_count += 2
-
-    for dict in existing_glossary:
-        for source_term, target_term in new_glossary.items():
-            # Add target term if not exist and source term exists
-            if source_term and source_term in dict.values() and target_lang not in dict:
-                dict[target_lang] = target_term
-                added_count += 1
-            # Add source term if not exist and target term exists
-            elif target_term and target_term in dict.values() and source_lang not in dict:
-                dict[source_lang] = source_term
-                added_count += 1
+
+    added_count = glossary.merge(new_glossary, source_lang, target_lang)
 
     if added_count > 0:
-        with open(glossary_path, "w", encoding="utf-8") as f:
-            json.dump({"GLOSSARY": existing_glossary}, f, ensure_ascii=False, indent=4)
-        logger.info(f"Appended {added_count} new terms to '{glossary_path}'")
+        logger.info(f"Appended {added_count} new terms to '{glossary.db_path}'")
     else:
-        logger.info("No new terms found.")
\ No newline at end of file
+        logger.info("No new terms found.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export a glossary database as glossary.json.")
+    parser.add_argument("command", choices=["import", "export"], help="import a glossary.json into the database, or export the database to a glossary.json")
+    parser.add_argument("--db", type=str, required=True, help="(str): path to glossary database (.db)")
+    parser.add_argument("--json", type=str, required=True, help="(str): path to glossary.json")
+    args = parser.parse_args()
+
+    glossary = GlossaryStore(args.db)
+    if args.command == "import":
+        logger.info(f"Imported {glossary.import_json(args.json)} terms from '{args.json}'.")
+    else:
+        glossary.export_json(args.json)
+        logger.info(f"Exported the glossary to '{args.json}'.")
+    glossary.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import os
 import sqlite3
 from loguru import logger
 
+from app.core.metrics import metrics
+
 
 class TranslationMemory:
     def __init__(self, db_path: str ="memory.db"):
@@ -26,11 +28,25 @@ class TranslationMemory:
                 FOREIGN KEY (concept_id) REFERENCES concepts(concept_id)
             )
         """)
+        # Index for looking up concepts by text, which every insert and lookup does
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_translations_content ON translations (content)
+        """)
         self.conn.commit()
 
     def add_translation(self, text: str, lang_from: str, translation: str, lang_to: str, overwrite: bool):
         cursor = self.conn.cursor()
-        
+        self._insert_translation(cursor, text, lang_from, translation, lang_to, overwrite)
+        self.conn.commit()
+
+    def add_translations(self, pairs: list[tuple[str, str]], lang_from: str, lang_to: str, overwrite: bool):
+        """Adds many (text, translation) pairs in a single transaction."""
+        cursor = self.conn.cursor()
+        for text, translation in pairs:
+            self._insert_translation(cursor, text, lang_from, translation, lang_to, overwrite)
+        self.conn.commit()
+
+    def _insert_translation(self, cursor: object, text: str, lang_from: str, translation: str, lang_to: str, overwrite: bool):
         # 1. Find if the concept already exists in any language
         cursor.execute("SELECT concept_id FROM translations WHERE content = ?", (text,))
         result = cursor.fetchone()
@@ -55,8 +71,6 @@ class TranslationMemory:
             INSERT OR {write} INTO translations (concept_id, lang, content) 
             VALUES (?, ?, ?)
         """, (concept_id, lang_to, translation))
-        
-        self.conn.commit()
 
     def translate(self, text: str, target_lang: str):
         """Translates text to target_lang regardless of original source direction."""
@@ -86,8 +100,10 @@ def translate_texts_from_memory(text_info_list: list[dict], languages: list[str]
         translation = memory.translate(info["original_text"], target_lang)
         if translation:
             info["translated_text"] = translation
+            metrics.count("memory_hits")
         else:
             info["translated_text"] = ""
+            metrics.count("memory_misses")
         logger.info(f"[{memory_name}] {info["original_text"]} ▶▶▶ {info["translated_text"]}")
 
     return text_info_list
\ No newline at end of file
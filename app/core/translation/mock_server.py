@@ -0,0 +1,200 @@
+"""
+OpenAI-compatible stand-in for the translator, to test & benchmark the pipeline without an API.
+
+It answers chat completions with every <|n|> item of the prompt reversed word by word and a glossary
+of its capitalized words, after a configurable delay. Some responses can fail or be cut off on purpose.
+
+Usage:
+    python -m app.core.translation.mock_server [--port 8000] [--latency 2] [--error_rate 0.1] [--truncate_rate 0.1]
+
+Then set "provider" to "openai" and "base_url" to "http://127.0.0.1:8000/v1", or just set "provider" to "mock".
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from loguru import logger
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Same tag pattern the engine uses to read the translation back
+pattern = re.compile(r"<\|(\d+)\|>\s*(.*?)(?=<\|\d+\|>|$)", re.DOTALL)
+
+
+def mock_translate(text: str) -> str:
+    return " ".join(word[::-1] for word in text.split())
+
+
+def build_mock_result(prompt: str) -> dict:
+    """Returns a Translation/Glossary result for every <|n|> item of the prompt."""
+    # The input list is at the end of the prompt, so its items replace the template's own examples
+    items = {}
+    for match in pattern.finditer(prompt):
+        items[int(match.group(1))] = match.group(2).strip()
+
+    terms = {}
+    for text in items.values():
+        for word in re.findall(r"\b[A-Z][a-z]{2,}\b", text):
+            terms[word] = mock_translate(word)
+
+    return {
+        "Translation": " ".join(f"<|{n}|> {mock_translate(text)}" for n, text in sorted(items.items())),
+        "Glossary": [{"source_term": source, "translated_term": target} for source, target in terms.items()],
+    }
+
+
+class MockSettings:
+    def __init__(self, latency: float = 0, jitter: float = 0, error_rate: float = 0, truncate_rate: float = 0, seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "truncated": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def roll(self) -> tuple[float, bool, bool, float]:
+        """Returns the delay, whether to fail, whether to truncate and where to cut, from one shared seeded RNG."""
+        with self.lock:
+            delay = max(0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            fail = self.random.random() < self.error_rate
+            truncate = self.random.random() < self.truncate_rate
+            cut = self.random.uniform(0.2, 0.9)
+        return delay, fail, truncate, cut
+
+    def count(self, **values: int):
+        with self.lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    settings = MockSettings()
+
+    def log_message(self, format, *args):
+        logger.trace(f"[mock] {self.address_string()} {format % args}")
+
+    def send_json(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            with self.settings.lock:
+                self.send_json(200, dict(self.settings.stats))
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path '{self.path}'", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path '{self.path}'", "type": "invalid_request_error"}})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            messages = request["messages"]
+        except (ValueError, KeyError) as e:
+            self.send_json(400, {"error": {"message": f"Invalid request: {e}", "type": "invalid_request_error"}})
+            return
+
+        delay, fail, truncate, cut = self.settings.roll()
+        time.sleep(delay)
+        self.settings.count(requests=1)
+
+        if fail:
+            self.settings.count(errors=1)
+            self.send_json(503, {"error": {"message": "The model is overloaded. Please try again later.", "type": "server_error", "code": 503}})
+            return
+
+        prompt = "\n".join(message["content"] for message in messages if isinstance(message.get("content"), str))
+        content = json.dumps(build_mock_result(messages[-1]["content"]), ensure_ascii=False)
+
+        # Cut the JSON like a response that ran out of output tokens
+        finish_reason = "stop"
+        if truncate:
+            content = content[:int(len(content) * cut)]
+            finish_reason = "length"
+            self.settings.count(truncated=1)
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        self.settings.count(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+        self.send_json(200, {
+            "id": f"chatcmpl-mock-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+def start_mock_server(settings: dict, host: str = "127.0.0.1", port: int = 0) -> tuple[object, str]:
+    """
+    Starts the mock server in a background thread. Port 0 picks a free port.
+    Returns the server and its base url for the "openai" provider.
+    """
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"settings": MockSettings(**settings)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    logger.info(f"Mock translator listening on {base_url}")
+
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an OpenAI-compatible mock translator.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="(str): host to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="(int): port to listen on")
+    parser.add_argument("--latency", type=float, default=0, help="(float): seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0, help="(float): random +/- seconds added to latency")
+    parser.add_argument("--error_rate", type=float, default=0, help="(float): share of requests answered with 503")
+    parser.add_argument("--truncate_rate", type=float, default=0, help="(float): share of responses cut off mid-JSON")
+    parser.add_argument("--seed", type=int, default=None, help="(int): seed for latency, errors & truncation")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, format="{message}", level="INFO")
+
+    settings = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "truncate_rate": args.truncate_rate,
+        "seed": args.seed,
+    }
+    server, base_url = start_mock_server(settings, args.host, args.port)
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        logger.info(f"Stats: {server.RequestHandlerClass.settings.stats}")
+
+
+if __name__ == "__main__":
+    main()
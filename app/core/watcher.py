@@ -0,0 +1,201 @@
+import os
+import time
+import threading
+from loguru import logger
+from colorama import Fore, Style, init
+
+from app.core.library import get_chapter_signature, list_images
+from app.core.archive import archive_extensions, is_archive
+
+
+init(autoreset=True)
+
+
+class ChapterWatcher:
+    """
+    Watches a folder tree and reports chapter folders & archives (.cbz/.zip) once their images stop changing.
+
+    Uses watchdog's file system events if it's installed. Otherwise it polls the modification time
+    of every known folder and only lists the ones that changed, which finds new chapters and added or
+    removed pages (but not pages replaced in place) at the cost of a stat per folder on every poll.
+    """
+
+    def __init__(self, root: str, image_extensions: tuple[str], settle_seconds: float, ignore: list[str] | None = None):
+        self.root = os.path.abspath(root)
+        self.image_extensions = image_extensions
+        self.settle_seconds = settle_seconds
+        self.ignore = [os.path.abspath(path) for path in ignore or []]
+        self.lock = threading.Lock()
+        self.dirty = set()
+        self.pending = {} # path -> (signature, time it last changed)
+        self.mtimes = {}
+        self.observer = None
+
+    def is_ignored(self, path: str) -> bool:
+        return any(path == ignored or path.startswith(ignored + os.sep) for ignored in self.ignore)
+
+    def start(self):
+        """
+        Starts watching. Chapters added while not watching aren't reported, catch up with LibraryIndex.scan() first.
+        Polling needs the modification time of every folder to compare against, so only then is the tree walked.
+        """
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+
+            watcher = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    if event.event_type in ("opened", "closed_no_write"):
+                        return
+                    for path in (event.src_path, getattr(event, "dest_path", "")):
+                        if path:
+                            watcher.mark(os.path.abspath(path), event.is_directory)
+
+            self.observer = Observer()
+            self.observer.schedule(Handler(), self.root, recursive=True)
+            self.observer.start()
+            logger.info(f"Watching '{self.root}' for new chapters...")
+        except ImportError:
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirpath = os.path.abspath(dirpath)
+                if self.is_ignored(dirpath):
+                    dirnames[:] = []
+                    continue
+                self.mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+            logger.info(f"Watching '{self.root}' for new chapters by polling {len(self.mtimes)} folders. Install watchdog to get notified instead.")
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+
+    def mark(self, path: str, is_directory: bool):
+        """Marks the folder of a changed file, a changed archive, or a new folder and everything in it, to be checked."""
+        if self.is_ignored(path):
+            return
+
+        with self.lock:
+            if not is_directory and path.lower().endswith(archive_extensions):
+                self.dirty.add(path)
+            elif not is_directory:
+                self.dirty.add(os.path.dirname(path))
+            elif os.path.isdir(path):
+                # A folder moved in at once only sends one event, so look inside it
+                for dirpath, dirnames, filenames in os.walk(path):
+                    self.dirty.add(os.path.abspath(dirpath))
+            else:
+                self.dirty.add(path)
+
+    def queue(self, dirpath: str, signature: str):
+        """Adds a chapter that's already known to be complete, skipping the wait."""
+        self.pending[dirpath] = (signature, float("-inf"))
+
+    def poll(self):
+        """Finds changed folders by their modification time when watchdog isn't installed."""
+        for dirpath, mtime in list(self.mtimes.items()):
+            try:
+                current = os.stat(dirpath).st_mtime_ns
+            except FileNotFoundError:
+                del self.mtimes[dirpath]
+                continue
+
+            if current == mtime:
+                continue
+
+            self.mtimes[dirpath] = current
+            with self.lock:
+                self.dirty.add(dirpath)
+
+            # Start tracking new subfolders
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    path = os.path.abspath(entry.path)
+                    if entry.is_dir() and path not in self.mtimes and not self.is_ignored(path):
+                        for subpath, dirnames, filenames in os.walk(path):
+                            self.mtimes[os.path.abspath(subpath)] = os.stat(subpath).st_mtime_ns
+                        self.mark(path, True)
+
+    def ready(self) -> list[tuple[str, list[os.DirEntry], str]]:
+        """
+        Returns the (folder or archive, images, signature) of changed chapters whose images
+        haven't changed for settle_seconds, so half-uploaded chapters aren't translated.
+        """
+        if self.observer is None:
+            self.poll()
+
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+
+        now = time.monotonic()
+        for dirpath in dirty:
+            if not dirpath.startswith(self.root):
+                continue
+            if os.path.isdir(dirpath):
+                self.pending.setdefault(dirpath, (None, now))
+                # Archives added to the folder, which polling only sees as a changed folder
+                with os.scandir(dirpath) as entries:
+                    for entry in entries:
+                        if entry.is_file() and entry.name.lower().endswith(archive_extensions):
+                            self.pending.setdefault(os.path.abspath(entry.path), (None, now))
+            elif is_archive(dirpath):
+                self.pending.setdefault(dirpath, (None, now))
+
+        ready = []
+        for dirpath, (signature, since) in list(self.pending.items()):
+            images = list_images(dirpath, self.image_extensions)
+            if not images:
+                del self.pending[dirpath]
+                continue
+
+            current = get_chapter_signature(images)
+            if current != signature:
+                self.pending[dirpath] = (current, now)
+            elif now - since >= self.settle_seconds:
+                del self.pending[dirpath]
+                ready.append((dirpath, images, current))
+
+        return sorted(ready)
+
+
+def watch(pipeline: object, input_path: str, output_path: str, index: object, settle_seconds: float, poll_interval: float):
+    """Translates chapters that aren't done in the index, then every new or changed chapter until interrupted."""
+    from app.core.pipeline import image_extensions
+
+    input_path = os.path.abspath(input_path)
+    os.makedirs(output_path, exist_ok=True)
+    watcher = ChapterWatcher(input_path, image_extensions, settle_seconds, ignore=[output_path])
+    memory = pipeline.open_memory(input_path, output_path)
+
+    # Catch up with chapters added or changed while not watching. The index only lists folders changed since
+    # its last scan, so a library that's done costs a stat per folder instead of listing every page.
+    watcher.start()
+    for dirpath, filenames, signature in index.scan(input_path, image_extensions):
+        if not watcher.is_ignored(dirpath):
+            watcher.queue(dirpath, signature)
+
+    try:
+        while True:
+            for dirpath, images, signature in watcher.ready():
+                if index.is_done(dirpath, signature):
+                    continue
+
+                # Translate again if the chapter was translated before & has changed since
+                chapter = index.get(dirpath)
+                changed = chapter is not None and chapter["status"] in ("done", "failed")
+                try:
+                    pipeline.translate_chapter(input_path, output_path, dirpath, [entry.name for entry in images], memory, changed, False, index)
+                    index.mark(dirpath, signature, "done", page_count=len(images))
+                except Exception as e:
+                    index.mark(dirpath, signature, "failed", f"{type(e).__name__}: {e}", len(images))
+                    logger.opt(exception=e).error(Fore.RED + f"\nFailed to translate '{dirpath}'!")
+
+                logger.info(Style.BRIGHT + Fore.CYAN + f"\nWatching '{input_path}' for new chapters...")
+
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        logger.info("\nStopping...")
+    finally:
+        watcher.stop()
+        memory.conn.close()
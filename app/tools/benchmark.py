@@ -0,0 +1,491 @@
+"""
+Benchmarks each stage on synthetic comic pages, offline & on CPU.
+
+Pages are rendered with Pillow so the text boxes are known in advance. The whole chapter runs through
+Pipeline.translate_chapter like main.py, with detection and OCR replaced by those known boxes & texts
+(unless --detector is given) and the LLM by the "mock" provider.
+
+Usage:
+    python -m app.tools.benchmark [--kind webtoon] [--pages 10] [--repeat 5] [--output bench.json] [--compare old.json]
+"""
+import os
+import re
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import tempfile
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from loguru import logger
+from colorama import Fore, Style, init
+
+from _version import __version__
+from app.core.config import load_config
+from app.core.detection import get_bbox_coords, merge_overlapping_boxes
+from app.core.image_utils_pil import crop_out_box, image_to_array, merge_images_vertically, plan_detection_tiles, slice_image_in_tiles, split_image_safely
+from app.core.overlay import get_fitted_font_and_text, overlay_translated_texts
+from app.core.pipeline import Pipeline
+from app.core.translation.memory import TranslationMemory, translate_texts_from_memory
+from app.core.translation.mock_server import mock_translate
+
+
+init(autoreset=True)
+Image.MAX_IMAGE_PIXELS = None
+
+# Page sizes & bubble counts of each kind of comic
+page_kinds = {
+    "webtoon": {"size": (800, 3000), "bubbles": (4, 7)},
+    "manga": {"size": (1200, 1700), "bubbles": (5, 9)},
+}
+
+words = (
+    "hey what are you doing here I told you not to come this is the only way we can still make it "
+    "wait for me don't go alone they will find us soon enough why did he say that nobody knows "
+    "the truth about what happened that night but I will find out no matter what"
+).split()
+
+
+def get_benchmark_font(font_path: str) -> str:
+    """Uses the configured font, or the first bundled font if it isn't installed."""
+    if os.path.exists(font_path):
+        return font_path
+
+    fonts_dir = "assets/fonts"
+    fonts = sorted(f for f in os.listdir(fonts_dir) if f.lower().endswith((".ttf", ".otf"))) if os.path.isdir(fonts_dir) else []
+    if not fonts:
+        raise FileNotFoundError(Fore.RED + f"Font file '{font_path}' not found.")
+
+    return os.path.join(fonts_dir, fonts[0])
+
+
+def make_page(kind: str, number: int, rng: random.Random, font_path: str) -> tuple[object, list[dict]]:
+    """
+    Renders a page with panels and speech bubbles. Returns the page and its text boxes
+    in the same format as the detector's output, with the rendered text as original_text.
+    """
+    width, height = page_kinds[kind]["size"]
+    min_bubbles, max_bubbles = page_kinds[kind]["bubbles"]
+
+    page = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(page)
+
+    # Gray panels with some texture so they aren't blank, separated by white gutters
+    panel_top = 40
+    while panel_top < height - 200:
+        panel_height = rng.randint(300, 900)
+        panel_bottom = min(panel_top + panel_height, height - 40)
+        shade = rng.randint(120, 220)
+        draw.rectangle((30, panel_top, width - 30, panel_bottom), fill=(shade, shade, shade), outline="black", width=3)
+        for _ in range(40):
+            x, y = rng.randint(30, width - 80), rng.randint(panel_top, max(panel_top, panel_bottom - 50))
+            tone = rng.randint(40, 250)
+            draw.ellipse((x, y, x + rng.randint(10, 50), y + rng.randint(10, 50)), fill=(tone, tone, tone))
+        panel_top = panel_bottom + rng.randint(60, 200)
+
+    font = ImageFont.truetype(font_path, 24)
+    boxes = []
+    bubble_count = rng.randint(min_bubbles, max_bubbles)
+    band_height = height // bubble_count
+
+    # One bubble per horizontal band so they don't overlap
+    for i in range(bubble_count):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(3, 12)))
+        wrapped = "\n".join(re.findall(r".{1,18}(?:\s|$)", text)).strip()
+
+        bbox = draw.multiline_textbbox((0, 0), wrapped, font=font, align="center")
+        text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+        x = rng.randint(60, max(60, width - text_width - 60))
+        y = i * band_height + rng.randint(40, max(40, band_height - text_height - 40))
+
+        draw.ellipse((x - 40, y - 30, x + text_width + 40, y + text_height + 30), fill="white", outline="black", width=3)
+        draw.multiline_text((x, y - bbox[1]), wrapped, font=font, fill="black", align="center")
+
+        xmin, ymin, xmax, ymax = x - 5, y - 5, x + text_width + 5, y + text_height + 5
+        boxes.append({
+            "box": np.array([[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax]], dtype=np.int32),
+            "confidence": 1.0,
+            "original_text": text,
+            "text_confidence": 1.0,
+            "translated_text": "",
+            "center_y": (ymin + ymax) / 2,
+            "image_name": f"{number:03d}.png",
+            "number": number,
+        })
+
+    return page, boxes
+
+
+def make_chapter(kind: str, pages: int, seed: int, font_path: str) -> tuple[list[object], list[dict]]:
+    """Renders a chapter. Boxes are returned in the coordinates of the merged chapter image."""
+    rng = random.Random(seed)
+    images = []
+    boxes = []
+    top = 0
+
+    for number in range(pages):
+        page, page_boxes = make_page(kind, number, rng, font_path)
+        for box in page_boxes:
+            box["box"] = box["box"] + np.array([0, top], dtype=np.int32)
+            box["center_y"] += top
+        images.append(page)
+        boxes.extend(page_boxes)
+        top += page.height
+
+    return images, boxes
+
+
+def jitter_boxes(boxes: list[dict], copies: int, rng: random.Random) -> list[dict]:
+    """Duplicates each box with small offsets, like the same text found in overlapping tiles."""
+    jittered = []
+    for box in boxes:
+        for _ in range(copies):
+            offset = np.array([rng.randint(-8, 8), rng.randint(-8, 8)], dtype=np.int32)
+            jittered.append({**box, "box": box["box"] + offset, "original_text": ""})
+    return jittered
+
+
+def lookup_text(bbox: list[int], boxes: list[dict]) -> str:
+    """Returns the rendered texts whose box centers are inside bbox, top to bottom, in place of OCR."""
+    xmin, ymin, xmax, ymax = bbox
+    texts = []
+    for box in boxes:
+        center_x = (box["box"][0][0] + box["box"][2][0]) / 2
+        if xmin <= center_x <= xmax and ymin <= box["center_y"] <= ymax:
+            texts.append((box["center_y"], box["original_text"]))
+    return " ".join(text for _, text in sorted(texts))
+
+
+class KnownBoxes:
+    """
+    Stands in for the detector & the OCR with the boxes & texts rendered on the pages.
+    number is "" for the merged chapter image, or the page number when merging is disabled.
+    """
+
+    def __init__(self, images: list[object], boxes: list[dict]):
+        self.pages = {"": boxes}
+        top = 0
+        for number, image in enumerate(images):
+            offset = np.array([0, top], dtype=np.int32)
+            self.pages[number] = [
+                {**box, "box": box["box"] - offset, "center_y": box["center_y"] - top}
+                for box in boxes if box["number"] == number
+            ]
+            top += image.height
+
+    def detect_image(self, image_name: str, number: int | str, image: list[object | int], tiling: list, output_dir: str, log_level: str) -> list[dict]:
+        return [
+            {"box": box["box"].copy(), "confidence": 1.0, "image_name": image_name, "number": number}
+            for box in self.pages[number]
+        ]
+
+    def detect_text_areas(self, image_name: str, number: int | str, image: object, **kwargs) -> list[dict]:
+        return self.detect_image(image_name, number, [image, image.width, image.height], [], "", "INFO")
+
+    def recognize(self, image: object, number: int | str, detections: list[dict], upscaler: list[bool | int], output_dir: str, log_level: str, first: int = 0, cache: object | None = None) -> list[dict]:
+        """Crops like the OCR does and goes through its cache, then looks up the rendered text instead of recognizing it."""
+        results = []
+        for i, detection in enumerate(detections):
+            xmin, ymin, xmax, ymax, _ = get_bbox_coords(detection["box"])
+            crop_image = crop_out_box([xmin, ymin, xmax, ymax], image, upscaler, output_dir, f"crop{number}_{first + i:02d}.jpg", log_level)
+
+            crop = cache.describe(crop_image) if cache else None
+            cached = cache.get(crop) if cache else None
+            if cached:
+                text, confidence = cached
+            else:
+                text, confidence = lookup_text([xmin, ymin, xmax, ymax], self.pages[number]), 1.0
+                if cache:
+                    cache.put(crop, text, confidence)
+
+            if text:
+                results.append({**detection, "original_text": text, "text_confidence": confidence})
+        return results
+
+    # Same signature as PaddleOCR's & Manga OCR's
+    batch_threaded = recognize
+    batch_threaded2 = recognize
+
+
+class BenchmarkPipeline(Pipeline):
+    """The pipeline of main.py, with the known boxes & texts in place of OCR, and of detection unless use_detector."""
+
+    def __init__(self, config: dict, known: KnownBoxes, use_detector: bool):
+        self.known = known
+        self.use_detector = use_detector
+        super().__init__(config, False, "INFO")
+
+    @property
+    def detector(self) -> object:
+        return Pipeline.detector.fget(self) if self.use_detector else self.known
+
+    @property
+    def extractor(self) -> object:
+        return self.known
+
+
+def get_run_config(config: dict, font_path: str, llm_latency: float, seed: int, run_dir: str) -> dict:
+    """Returns config.json on CPU with the "mock" translator, and the caches of a run in run_dir, so every run starts cold."""
+    config = copy.deepcopy(config)
+    config['GENERAL']['gpu_mode'] = False
+    config['OVERLAY']['box']['inpaint'] = False
+    config['OVERLAY']['font']['path'] = font_path
+    config['TRANSLATION']['translator']['provider'] = "mock"
+    config['TRANSLATION']['mock'] = {"latency": llm_latency, "jitter": 0, "error_rate": 0, "truncate_rate": 0, "seed": seed}
+    config['OCR']['cache'] = {**config['OCR'].get('cache', {}), "path": os.path.join(run_dir, "ocr_cache.db")}
+    return config
+
+
+def measure(function, repeat: int, setup=None) -> dict:
+    """Runs function repeat times, calling setup before each run (untimed) to get its arguments."""
+    walls = []
+    cpus = []
+    result = None
+
+    for _ in range(repeat):
+        args = setup() if setup else ()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = function(*args)
+        walls.append(time.perf_counter() - wall_start)
+        cpus.append(time.process_time() - cpu_start)
+
+    return {
+        "runs": repeat,
+        "min_s": round(min(walls), 6),
+        "median_s": round(statistics.median(walls), 6),
+        "mean_s": round(statistics.fmean(walls), 6),
+        "cpu_s": round(statistics.median(cpus), 6),
+        "result": result,
+    }
+
+
+def run_pipeline(pipeline: Pipeline, config: dict, chapter: list[str], run_dir: str) -> dict:
+    """
+    Translates the chapter with Pipeline.translate_chapter into run_dir, like main.py does.
+    Returns the chapter's per-stage metrics.
+
+    :param chapter: [input_path, chapter folder, image names].
+    """
+    input_path, dirpath, filenames = chapter
+    output_path = os.path.join(run_dir, "output")
+    os.makedirs(output_path, exist_ok=True)
+
+    pipeline.configure(config)
+    memory = pipeline.open_memory(input_path, output_path)
+    try:
+        return pipeline.translate_chapter(input_path, output_path, dirpath, filenames, memory, True, False)
+    finally:
+        memory.conn.close()
+
+
+def run_benchmarks(args: argparse.Namespace, config: dict) -> dict:
+    detection_config = config['DETECTION']
+    overlay_config = config['OVERLAY']
+    font_path = get_benchmark_font(overlay_config['font']['path'])
+
+    settings = {
+        "tile": detection_config['tile'],
+        "batch_size": detection_config.get('batch_size', 1),
+        "merge_threshold": detection_config['merge_threshold'],
+        "merge_times": detection_config['merge_times'],
+        "max_height": config['IMAGE_SPLIT']['max_height'],
+        "box": [
+            overlay_config['box']['offset'], overlay_config['box']['padding'], overlay_config['box']['fill_color'],
+            overlay_config['box']['outline_color'], overlay_config['box']['outline_thickness'],
+        ],
+        "font": [overlay_config['font']['min_size'], overlay_config['font']['max_size'], overlay_config['font']['color'], font_path],
+    }
+
+    logger.info(f"\nRendering {args.pages} synthetic {args.kind} pages...")
+    images, boxes = make_chapter(args.kind, args.pages, args.seed, font_path)
+    merged_image = merge_images_vertically(images, "", "INFO")
+    width, height = merged_image.size
+    for box in boxes:
+        box["translated_text"] = mock_translate(box["original_text"])
+
+    rng = random.Random(args.seed)
+    stages = {}
+
+    def add(name: str, result: dict, **extra):
+        result.pop("result", None)
+        stages[name] = {**result, **extra}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # The pipeline reads the chapter from disk like any other
+        input_path = os.path.join(work_dir, "input")
+        dirpath = os.path.join(input_path, "chapter")
+        os.makedirs(dirpath)
+        filenames = []
+        for number, image in enumerate(images):
+            filenames.append(f"{number:03d}.png")
+            image.save(os.path.join(dirpath, filenames[-1]))
+
+        pipeline = BenchmarkPipeline(get_run_config(config, font_path, args.llm_latency, args.seed, work_dir), KnownBoxes(images, boxes), args.detector)
+        detector = pipeline.detector if args.detector else None
+
+        logger.info(Style.BRIGHT + f"\nBenchmarking {len(boxes)} text boxes on a {width}x{height} chapter ({args.repeat} runs each)...")
+
+        # Stay quiet while timing, the stages log every step
+        logger.remove()
+        logger.add(sys.stderr, format="{message}", level="WARNING")
+
+        image_np = image_to_array(merged_image)
+
+        def slice_tiles():
+            tile_height, tile_width, overlap, positions = plan_detection_tiles(image_np, settings["tile"], 640)
+            return slice_image_in_tiles(
+                [image_np, width, height], tile_height, tile_width, 640, overlap, "", work_dir, "INFO",
+                settings["tile"].get('resample', "bilinear"), settings["tile"].get('blank_threshold', 0), positions
+            )
+
+        result = measure(slice_tiles, args.repeat)
+        tiles = result["result"]
+        add("slice_image_in_tiles", result, tiles=len(tiles))
+
+        if detector:
+            add("detect_tiles", measure(lambda: detector.detect_tiles("", iter(tiles), [640, 640], "INFO", settings["batch_size"], total=len(tiles)), args.repeat), tiles=len(tiles))
+
+        # merge_overlapping_boxes changes its input, so each run gets a fresh copy
+        duplicates = jitter_boxes(boxes, 3, rng)
+
+        def merge_boxes(detections):
+            for _ in range(settings["merge_times"]):
+                detections = merge_overlapping_boxes(detections, settings["merge_threshold"])
+            return detections
+
+        add("merge_overlapping_boxes", measure(merge_boxes, args.repeat, lambda: (copy.deepcopy(duplicates),)), boxes=len(duplicates))
+
+        add("split_image_safely", measure(lambda: split_image_safely([merged_image, width, height], boxes, settings["max_height"]), args.repeat), boxes=len(boxes))
+
+        def fit_texts():
+            for box in boxes:
+                xmin, ymin, xmax, ymax, _ = get_bbox_coords(box["box"])
+                get_fitted_font_and_text(box["translated_text"], xmax - xmin, ymax - ymin, settings["font"][0], settings["font"][1], font_path)
+
+        add("get_fitted_font_and_text", measure(fit_texts, args.repeat), texts=len(boxes))
+
+        # overlay_translated_texts draws on the chunks, so split again before each run
+        output_dir = os.path.join(work_dir, "overlay")
+        add("overlay_translated_texts", measure(
+            lambda chunks: overlay_translated_texts(chunks, True, boxes, settings["box"], [False, None], settings["font"], "png", ["en", []], output_dir, "INFO"),
+            args.repeat,
+            lambda: (split_image_safely([merged_image, width, height], boxes, settings["max_height"])[0],),
+        ), texts=len(boxes))
+
+        pairs = [(box["original_text"], box["translated_text"]) for box in boxes]
+        memory_runs = []
+
+        def new_memory():
+            memory = TranslationMemory(os.path.join(work_dir, f"memory_{len(memory_runs)}.db"))
+            memory_runs.append(memory)
+            return (memory,)
+
+        add("translation_memory_write", measure(lambda memory: memory.add_translations(pairs, "en", "xx", False), args.repeat, new_memory), texts=len(pairs))
+        add("translation_memory_read", measure(
+            lambda: translate_texts_from_memory(copy.deepcopy(boxes), ["en", "xx"], memory_runs[-1], "INFO"), args.repeat
+        ), texts=len(pairs))
+        for memory in memory_runs:
+            memory.conn.close()
+
+        # The whole chapter, with the breakdown of its median run
+        pipeline_runs = []
+
+        def translate_chapter(run_dir):
+            run_config = get_run_config(config, font_path, args.llm_latency, args.seed, run_dir)
+            pipeline_runs.append(run_pipeline(pipeline, run_config, [input_path, dirpath, filenames], run_dir))
+
+        result = measure(translate_chapter, args.repeat, lambda: (tempfile.mkdtemp(dir=work_dir),))
+        median_run = sorted(pipeline_runs, key=lambda run: sum(stage["wall_s"] for stage in run["stages"].values()))[len(pipeline_runs) // 2]
+        add("pipeline", result, stub_detector=detector is None, breakdown=median_run["stages"], counters=median_run["counters"])
+
+        logger.remove()
+        logger.add(sys.stderr, format="{message}", level="INFO")
+
+    logger.info("")
+    for name, stage in stages.items():
+        logger.info(f"{name:<28} median {stage['median_s'] * 1000:9.1f} ms  (min {stage['min_s'] * 1000:.1f} ms)")
+
+    return {
+        "version": __version__,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "kind": args.kind,
+            "pages": args.pages,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "size": [width, height],
+            "boxes": len(boxes),
+            "tile": settings["tile"],
+            "llm_latency": args.llm_latency,
+        },
+        "stages": stages,
+    }
+
+
+def compare_reports(report: dict, baseline: dict, threshold: float) -> bool:
+    """Logs the median time of each stage against a previous report. Returns True if any stage got slower than threshold."""
+    regressed = False
+    logger.info(Style.BRIGHT + f"\nCompared to v{baseline.get('version', '?')} ({baseline.get('date', '?')}):")
+
+    if baseline.get("settings", {}).get("size") != report["settings"]["size"]:
+        logger.warning(Fore.YELLOW + "The chapters have different sizes, run both with the same --kind, --pages & --seed.")
+
+    for name, stage in report["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old:
+            logger.info(f"{name:<28} new")
+            continue
+
+        ratio = stage["median_s"] / old["median_s"] if old["median_s"] else 1.0
+        color = Fore.RED if ratio > threshold else Fore.GREEN if ratio < 1 / threshold else ""
+        logger.info(color + f"{name:<28} {old['median_s'] * 1000:9.1f} ms -> {stage['median_s'] * 1000:9.1f} ms  ({ratio:.2f}x)")
+        regressed = regressed or ratio > threshold
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage on synthetic comic pages.")
+    parser.add_argument("--kind", type=str, default="webtoon", choices=list(page_kinds), help="(str): kind of pages to render")
+    parser.add_argument("--pages", type=int, default=10, help="(int): number of pages in the chapter")
+    parser.add_argument("--repeat", type=int, default=5, help="(int): runs of each stage")
+    parser.add_argument("--seed", type=int, default=0, help="(int): seed of the page layouts & texts")
+    parser.add_argument("--config", type=str, default="config.json", help="(str): path to config.json")
+    parser.add_argument("--llm_latency", type=float, default=0, help="(float): seconds the stub LLM waits before answering")
+    parser.add_argument("--detector", action='store_true', help="use the real detection model instead of the known boxes (downloads it if needed)")
+    parser.add_argument("--output", type=str, default=None, help="(str): path to save JSON results")
+    parser.add_argument("--compare", type=str, default=None, help="(str): path to previous JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.1, help="(float): slowdown ratio counted as a regression")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, format="{message}", level="INFO")
+
+    report = run_benchmarks(args, load_config(args.config))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        logger.info(f"\nResults saved to '{args.output}'.")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare_reports(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Compares INT8 detection against FP32 on a local image folder.
+
+Usage:
+    python -m app.tools.compare_precision --input "YOUR/IMAGE/FOLDER" [--method static] [--iou 0.5]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from PIL import Image
+from loguru import logger
+from natsort import natsorted
+from colorama import Fore, Style, init
+
+from app.core.config import load_config
+from app.core.detection import TextAreaDetection, merge_overlapping_boxes
+from app.core.image_utils_pil import decode_image, scale_detections
+from app.core.metrics import metrics
+from app.core.quantization import image_extensions, match_detections
+
+
+init(autoreset=True)
+Image.MAX_IMAGE_PIXELS = None
+
+
+def detect_image(detector: object, image_path: str, detection_config: dict, target_size: int) -> tuple[list[dict], float, int]:
+    """
+    Runs the same detection as the pipeline on a separate page (IMAGE_MERGE disabled): tile planning, batching,
+    coarse-to-fine & the draft decode from DETECTION in config.json, then box merging.
+    Returns detections, seconds spent detecting, and tile count.
+    """
+    tile_config = detection_config['tile']
+    tiling = [tile_config, detection_config.get('coarse_to_fine', {}), target_size, detection_config.get('batch_size', 1)]
+    use_draft = detection_config.get('draft', True) and tile_config['width'] == "original"
+
+    image = decode_image(image_path)
+    draft = decode_image(image_path, target_size) if use_draft else None
+    width, height = image.size
+    tiles = metrics.counters.get("tiles", 0)
+
+    start = time.perf_counter()
+    if width == target_size and tile_config['width'] in ("original", "adaptive", target_size):
+        detections = detector.detect_text_areas("", 0, image, target_sizes=[target_size, target_size], log_level="INFO", image_tiled=False)
+        metrics.count("tiles")
+    elif draft is not None:
+        detections = detector.detect_image("", 0, [draft, draft.width, draft.height], tiling, "", "INFO")
+        detections = scale_detections(detections or [], width / draft.width, height / draft.height)
+    else:
+        detections = detector.detect_image("", 0, [image, width, height], tiling, "", "INFO")
+    elapsed = time.perf_counter() - start
+
+    image.close()
+    if draft is not None:
+        draft.close()
+
+    detections = detections or []
+    for _ in range(detection_config['merge_times']):
+        detections = merge_overlapping_boxes(detections, detection_config['merge_threshold'])
+
+    return detections, elapsed, metrics.counters.get("tiles", 0) - tiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare INT8 detection against FP32.")
+    parser.add_argument("--input", type=str, required=True, help="(str): path to image folder")
+    parser.add_argument("--config", type=str, default="config.json", help="(str): path to config.json")
+    parser.add_argument("--method", type=str, default=None, help="(str): quantization method: dynamic/static (default: config.json)")
+    parser.add_argument("--iou", type=float, default=0.5, help="(float): minimum IoU to count a box as found")
+    parser.add_argument("--report", type=str, default=None, help="(str): path to save JSON report")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, format="{message}", level="INFO")
+
+    config = load_config(args.config)
+    detection_config = config['DETECTION']
+    confidence_threshold = config['OCR']['confidence_threshold']
+    session_config = detection_config.get('session', {})
+    quantization = detection_config.get('quantization', {})
+    method = args.method or quantization.get('method', "dynamic")
+    target_size = 640
+
+    fp32 = TextAreaDetection(confidence_threshold, False, session_config, "fp32")
+    int8 = TextAreaDetection(
+        confidence_threshold, False, session_config, "int8",
+        [method, quantization.get('calibration_dir'), quantization.get('calibration_tiles', 32), detection_config['tile']],
+    )
+
+    image_files = natsorted(
+        os.path.join(args.input, f) for f in os.listdir(args.input) if f.lower().endswith(image_extensions)
+    )
+    if not image_files:
+        raise Exception(Fore.RED + f"No image in '{args.input}'!")
+
+    report = {"method": method, "iou_threshold": args.iou, "images": []}
+    totals = {"fp32_boxes": 0, "int8_boxes": 0, "matched": 0, "iou_sum": 0.0, "fp32_seconds": 0.0, "int8_seconds": 0.0, "tiles": 0}
+
+    logger.info(f"\nComparing FP32 & INT8 ({method}) detections on {len(image_files)} images...")
+
+    for file in image_files:
+        reference, fp32_seconds, tiles = detect_image(fp32, file, detection_config, target_size)
+        candidate, int8_seconds, _ = detect_image(int8, file, detection_config, target_size)
+
+        matched_ious = match_detections(reference, candidate, args.iou)
+        recall = len(matched_ious) / len(reference) if reference else 1.0
+        mean_iou = sum(matched_ious) / len(matched_ious) if matched_ious else 0.0
+
+        color = Fore.GREEN if recall == 1.0 else Fore.YELLOW
+        logger.info(color + f"{os.path.basename(file)}: FP32 {len(reference)} / INT8 {len(candidate)} boxes, recall {recall:.3f}, mean IoU {mean_iou:.3f}")
+
+        report["images"].append({
+            "file": file,
+            "fp32_boxes": len(reference),
+            "int8_boxes": len(candidate),
+            "recall": recall,
+            "mean_iou": mean_iou,
+            "fp32_seconds": fp32_seconds,
+            "int8_seconds": int8_seconds,
+        })
+        totals["fp32_boxes"] += len(reference)
+        totals["int8_boxes"] += len(candidate)
+        totals["matched"] += len(matched_ious)
+        totals["iou_sum"] += sum(matched_ious)
+        totals["fp32_seconds"] += fp32_seconds
+        totals["int8_seconds"] += int8_seconds
+        totals["tiles"] += tiles
+
+    report["summary"] = {
+        "fp32_boxes": totals["fp32_boxes"],
+        "int8_boxes": totals["int8_boxes"],
+        "recall": totals["matched"] / totals["fp32_boxes"] if totals["fp32_boxes"] else 1.0,
+        "mean_iou": totals["iou_sum"] / totals["matched"] if totals["matched"] else 0.0,
+        "fp32_ms_per_tile": totals["fp32_seconds"] * 1000 / max(totals["tiles"], 1),
+        "int8_ms_per_tile": totals["int8_seconds"] * 1000 / max(totals["tiles"], 1),
+    }
+    summary = report["summary"]
+
+    logger.info(Style.BRIGHT + f"\nRecall: {summary['recall']:.3f} ({totals['matched']}/{totals['fp32_boxes']} FP32 boxes found by INT8)")
+    logger.info(Style.BRIGHT + f"Mean IoU: {summary['mean_iou']:.3f}")
+    logger.info(Style.BRIGHT + f"Speed: FP32 {summary['fp32_ms_per_tile']:.1f} ms/tile, INT8 {summary['int8_ms_per_tile']:.1f} ms/tile")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        logger.info(f"Report saved to '{args.report}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,24 @@
 import os
-import re
 # import cv2
 import sys
-import json
 import time
 import argparse
 from PIL import Image
-from tqdm import tqdm
-from pathlib import Path
 from loguru import logger
 from datetime import datetime
-from natsort import natsorted
-from collections import Counter
 from colorama import Fore, Back, Style, init
-from simple_lama_inpainting import SimpleLama
+
+# Measure how long importing the app takes, heavy modules are imported later by the stages that need them
+import_start = time.perf_counter()
 
 from _version import __version__
 from app.core.handle import handle_uncaught_exception
 from app.core.config import load_config
-from app.core.model import download_repo_snapshot
-from app.core.image_utils_pil import merge_images_vertically, slice_image_in_tiles, split_image_safely
-from app.core.detection import TextAreaDetection, merge_overlapping_boxes
-from app.core.translation.engine import translate_texts_and_build_glossary
-from app.core.translation.memory import TranslationMemory, translate_texts_from_memory
-from app.core.overlay import overlay_translated_texts
-from app.core.result import save_result_json, load_result_json
+from app.core.pipeline import Pipeline
+from app.core.metrics import metrics, start_profiler
+from app.core.lazy import log_import_times
+
+startup_seconds = time.perf_counter() - import_start
 
 # Measure time
 start_time = time.perf_counter()
@@ -37,12 +31,18 @@ init(autoreset=True)
 
 # Define arguments with argparse
 parser = argparse.ArgumentParser(description="Arguments for Simple Comic Translator.")
+parser.add_argument("command", nargs="?", choices=["translate", "status"], default="translate", help="translate the input folder (default) or show how far its translation got")
 parser.add_argument("--input", type=str, help="(str): path to your comic folder")
 parser.add_argument("--output", type=str, help="(str): path to output folder")
 parser.add_argument("--gpu", action='store_true', help="use GPU")
 parser.add_argument("--debug", action='store_true', help="enable debug mode")
 parser.add_argument("--overwrite", action='store_true', help="overwrite existing output images")
 parser.add_argument("--load_json", action='store_true', help="load existing result.json")
+parser.add_argument("--profile", action='store_true', help="profile the run with pyinstrument (if installed) or cProfile")
+parser.add_argument("--watch", action='store_true', help="keep models loaded and translate new or changed chapters in the input folder as they arrive")
+parser.add_argument("--serve", action='store_true', help="keep models loaded and translate jobs submitted over HTTP")
+parser.add_argument("--host", type=str, default="127.0.0.1", help="(str): host to listen on with --serve")
+parser.add_argument("--port", type=int, default=8765, help="(int): port to listen on with --serve")
 
 args = parser.parse_args()
 
@@ -52,51 +52,8 @@ if config:
     # For general settings
     gpu_mode = config['GENERAL']['gpu_mode']
     debug_mode = config['GENERAL']['debug_mode']
-    overwrite_result = config['GENERAL']['result']['overwrite']
-    use_result_json = config['GENERAL']['result']['load_json']
-    result_json_path_ = config['GENERAL']['result']['json_path']
-    # For merging images
-    merge_images = config['IMAGE_MERGE']['enable']
-    # For detecting text areas
-    det_conf_threshold = config['OCR']['confidence_threshold']
-    det_merge_threshold = config['DETECTION']['merge_threshold']
-    det_merge_times = config['DETECTION']['merge_times']
-    tile_height = config['DETECTION']['tile']['height']
-    tile_width = config['DETECTION']['tile']['width']
-    tile_overlap = config['DETECTION']['tile']['overlap']
-    # For OCR
-    source_language = config['OCR']['source_language']
-    ocr_conf_threshold = config['OCR']['confidence_threshold']
-    use_upscaler = config['OCR']['upscale']['enable']
-    upscale_ratio = config['OCR']['upscale']['ratio']
-    # For splitting image
-    max_height = config['IMAGE_SPLIT']['max_height']
-    # For translation
-    target_language = config['TRANSLATION']['target_language']
-    timeout = config['TRANSLATION']['timeout']
-    max_retries = config['TRANSLATION']['max_retries']
-    retry_delay = config['TRANSLATION']['retry_delay']
-    translator_provider = config['TRANSLATION']['translator']['provider']
-    translator_model = config['TRANSLATION']['translator']['model']
-    translator_base_url = config['TRANSLATION']['translator']['base_url']
-    translator_temp = config['TRANSLATION']['translator']['temperature']
-    translator_top_p = config['TRANSLATION']['translator']['top_p']
-    translator_max_out_tokens = config['TRANSLATION']['translator']['max_output_tokens']
-    use_memory = config['TRANSLATION']['memory']['enable']
-    memory_path = config['TRANSLATION']['memory']['path']
-    overwrite_memory = config['TRANSLATION']['memory']['overwrite']
-    glossary_path_ = config['TRANSLATION']['glossary_path']
-    # For overlay
-    box_offset = config['OVERLAY']['box']['offset']
-    box_padding = config['OVERLAY']['box']['padding']
-    box_fill_color = config['OVERLAY']['box']['fill_color']
-    box_outline_color = config['OVERLAY']['box']['outline_color']
-    box_outline_thickness = config['OVERLAY']['box']['outline_thickness']
-    use_inpainting = config['OVERLAY']['box']['inpaint']
-    font_min = config['OVERLAY']['font']['min_size']
-    font_max = config['OVERLAY']['font']['max_size']
-    font_color = config['OVERLAY']['font']['color']
-    font_path = config['OVERLAY']['font']['path']
+    watch_settle_seconds = config['GENERAL'].get('watch', {}).get('settle_seconds', 10)
+    watch_poll_interval = config['GENERAL'].get('watch', {}).get('poll_interval', 2)
 
 # Start logging
 logger.remove() # Remove the default handler
@@ -107,6 +64,12 @@ formatted_datetime = datetime.now().strftime("%Y-%m-%d_%H.%M")
 logger.add(sys.stderr, format="{message}", level=log_level)
 logger.add(f"temp/logs/{formatted_datetime}.log", format="{message}", level="TRACE")
 
+# Record per-stage timings & counters of each chapter next to the log
+metrics.open(f"temp/logs/{formatted_datetime}.metrics.jsonl")
+
+if args.profile:
+    start_profiler(f"temp/logs/{formatted_datetime}")
+
 # Assign the custom handler to sys.excepthook
 sys.excepthook = handle_uncaught_exception
 
@@ -114,250 +77,49 @@ sys.excepthook = handle_uncaught_exception
 logger.info(f"SCT version: {__version__}\n")
 
 # --- Main Execution ---
-input_path = args.input
-output_path = args.output if args.output else f"{input_path}-shitted"
-
-image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
-lang_code_jp = ("japanese", "japan", "jpn", "jp", "ja")
-
-# Check if input path exists
-if not os.path.exists(input_path):
-    raise Exception(Fore.RED + f"{input_path} does not exist!")
-else:
-    os.makedirs(output_path, exist_ok=True)
-
-# Initialize models
-detector = TextAreaDetection(confidence_threshold=det_conf_threshold, use_gpu=True if args.gpu or gpu_mode else False)
-det_target_size = 640
-
-if source_language in lang_code_jp:
-    from app.core.ocr.mangaocr import MangaOCRRecognition
-    extractor = MangaOCRRecognition(use_cpu=True if args.gpu == False and gpu_mode == False else False)
-else:
-    from app.core.ocr.paddleocr import PaddleOCRRecognition
-    extractor = PaddleOCRRecognition(ocr_version='PP-OCRv5', language=source_language, confidence_threshold=ocr_conf_threshold, use_gpu=True if args.gpu or gpu_mode else False)
-
-memory_path = os.path.join(input_path, "memory.db") if memory_path == "input" else os.path.join(output_path, "memory.db") if memory_path == "output" else memory_path
-memory = TranslationMemory(memory_path)
-
-if use_inpainting:
-    simple_lama = SimpleLama()
-else:
-    simple_lama = None
-
-# Iterate through all directories using os.walk
-for dirpath, dirnames, filenames in natsorted(os.walk(input_path)):
-
-    # Define the output path
-    relative_path = Path(dirpath).relative_to(input_path)
-    output_dir = Path(output_path) / relative_path
-    output_dir.mkdir(parents=True, exist_ok=True) # Create output directory
-
-    logger.info(Style.BRIGHT + Fore.YELLOW + f"\nProcessing '{dirpath}'...")
-
-    # Skip or overwrite if output files already exist
-    already_exist = False
-    regex_pattern = r"^image_.*"
-
-    for filename in os.listdir(output_dir):
-        full_path = os.path.join(output_dir, filename)
-
-        if re.match(regex_pattern, filename):
-            if os.path.exists(full_path):
-                already_exist = True
-                break
-
-    if already_exist:
-        if not overwrite_result:
-            logger.info(Fore.GREEN + f"- Files already exist in '{output_dir}'. SKIPPING...")
-            continue
-        else:
-            logger.info(Fore.GREEN + f"- Files already exist in '{output_dir}'. OVERWRITING...")
-
-    # Define result.json path
-    result_json_path = os.path.join(dirpath, "result.json") if result_json_path_ == "input" else os.path.join(output_dir, "result.json") if result_json_path_ == "output" else os.path.join(output_dir, "result.json")
-
-    # Filter for image files and sort files to ensure consistent merging order
-    image_files = [os.path.join(dirpath, f) for f in natsorted(filenames) if f.lower().endswith(image_extensions)]
-
-    if not image_files:
-        logger.info(Fore.BLUE + f"- No image in '{dirpath}'. SKIPPING...")
-        continue
-
-    images = []
-    try:
-        for file in image_files:
-            img = Image.open(file)
-            images.append(img)
-    except IOError as e:
-        raise Exception(Fore.RED + f"Error opening image {file}: {e}")
-
-    if not images:
-        continue
-
-    # Get the most common original extension
-    original_extensions = []
-    for file in image_files:
-        original_extension = file.split('.')[-1].lower()
-        original_extensions.append(original_extension)
-        original_extension_counts = Counter(original_extensions)
-        common_original_extension, counts = original_extension_counts.most_common(1)[0]
-
-    if merge_images:
-        # --- Stage 1: Merge images into one ---
-        merged_image = merge_images_vertically(images, output_dir, log_level)
+pipeline = Pipeline(config, use_gpu=args.gpu or gpu_mode, log_level=log_level)
 
-        image_width, image_height = merged_image.size
+if args.serve:
+    # Keep the models loaded and translate jobs submitted over HTTP until stopped
+    from app.core.daemon import serve
+    pipeline.load_models()
+    if log_level == "TRACE":
+        log_import_times(startup_seconds)
+    serve(pipeline, config, args.host, args.port)
+    sys.exit(0)
 
-        # Use existing result.json if set and exists
-        if (use_result_json or args.load_json) and os.path.exists(result_json_path):
-            recognitions = load_result_json(result_json_path, [memory, overwrite_memory, source_language, target_language])
-        else:
-            # --- Stage 2: Detect Text Areas with ogkalu/comic-text-and-bubble-detector.onnx
-            tile_width = image_width if tile_width == "original" else tile_width
+if not args.input:
+    parser.error("--input is required unless --serve is set")
 
-            tile_height = tile_width if tile_height == "tile_width" else tile_height
-
-            tile_overlap_px = int(tile_height * tile_overlap)
-
-            image_slices = slice_image_in_tiles(
-                [merged_image, image_width, image_height], tile_height, tile_width, det_target_size, tile_overlap_px, "", output_dir, log_level
-            )
-
-            # detections = detector.batch_threaded("", image_slices, target_sizes=[tile_height, tile_width], log_level=log_level, image_tiled=True)
-
-            logger.info(f"\nDetecting text areas with ogkalu/comic-text-and-bubble-detector.onnx...")
-            detections = []
-            for i, slice in enumerate(tqdm(image_slices)):
-                detection = detector.detect_text_areas("", i, slice, target_sizes=[det_target_size, det_target_size], log_level=log_level, image_tiled=True)
-                if detection:
-                    detections.extend(detection)
-
-            # Merge overlapping boxes by the specified number of times because 1x isn't enough to merge all of them
-            merged_detections = None
-            for x in range(det_merge_times):
-                detections = merge_overlapping_boxes(detections, det_merge_threshold)
-                merged_detections = detections
-            logger.success(f"Found {len(merged_detections)} detections.")
-
-            # --- Stage 3: Extract Texts with Manga OCR/PaddleOCR
-            if source_language in lang_code_jp:
-                recognitions = extractor.batch_threaded2(merged_image, "", merged_detections, [use_upscaler, upscale_ratio], output_dir, log_level)
-            else:
-                recognitions = extractor.batch_threaded(merged_image, "", merged_detections, [use_upscaler, upscale_ratio], output_dir, log_level)
-
-        # --- Stage 4: Split Image Safely on Non-Text Areas ---
-        image_chunks, chunks_number = split_image_safely([merged_image, image_width, image_height], recognitions, max_height)
-    else:
-        # Use existing result.json if set and exists
-        if (use_result_json or args.load_json) and os.path.exists(result_json_path):
-            image_chunks = []
-            for n, image in enumerate(images):
-                image_width, image_height = image.size
-                image_name = f"image_{n:02d}"
-                image_chunks.append({
-                    "image_name": image_name,
-                    "image": image
-                })
-
-            recognitions = load_result_json(result_json_path, [memory, overwrite_memory, source_language, target_language])
-        else:
-            image_chunks = []
-            recognitions = []
-
-            for n, image in enumerate(images):
-                image_width, image_height = image.size
-                image_name = f"image_{n:02d}"
-                image_chunks.append({
-                    "image_name": image_name,
-                    "image": image
-                })
-
-                # --- Stage 1: Detect Text Areas ogkalu/comic-text-and-bubble-detector.onnx
-                tile_width = image_width if tile_width == "original" else tile_width
-
-                tile_height = tile_width if tile_height == "tile_width" else tile_height
-
-                tile_overlap_px = int(tile_height * tile_overlap)
-
-                if image_width == det_target_size and tile_width == det_target_size:
-                    logger.info(f"\nDetecting text areas with ogkalu/comic-text-and-bubble-detector.onnx...")
-                    detections = detector.detect_text_areas(image_name, n, image, target_sizes=[det_target_size, det_target_size], log_level=log_level, image_tiled=False)
-                else:
-                    image_slices = slice_image_in_tiles([image, image_width, image_height], tile_height, tile_width, det_target_size, tile_overlap_px, n, output_dir, log_level)
-
-                    # detections = detector.batch_threaded(image_name,image_slices, target_sizes=[tile_height, tile_width], log_level=log_level, image_tiled=True)
-
-                    logger.info(f"\nDetecting text areas with ogkalu/comic-text-and-bubble-detector.onnx...")
-                    detections = []
-                    for i, slice in enumerate(tqdm(image_slices)):
-                        detection = detector.detect_text_areas(image_name, i, slice, target_sizes=[det_target_size, det_target_size], log_level=log_level, image_tiled=True)
-                        detections.extend(detection)
-
-                if not detections:
-                    logger.warning(Fore.YELLOW + "NO DETECTION! SKIPPING...")
-                    continue
-
-                # Merge overlapping boxes by the specified number of times because 1x isn't enough to merge all of them
-                merged_detections = None
-                for x in range(det_merge_times):
-                    detections = merge_overlapping_boxes(detections, det_merge_threshold)
-                    merged_detections = detections
-                logger.success(f"Found {len(merged_detections)} detections.")
-
-                # --- Stage 2: Extract Texts with Manga OCR/PaddleOCR
-                if source_language in lang_code_jp:
-                    recognition = extractor.batch_threaded2(image, n, merged_detections, [use_upscaler, upscale_ratio], output_dir, log_level)
-
-                    # recognition = []
-                    # for i, detection in enumerate(merged_detections):
-                    #     rec = extractor.run_mangaocr_on_detections(image, f"crop{n}_{i:02d}.jpg", detection, [use_upscaler, upscale_ratio], output_dir, log_level)
-                    #     if rec:
-                    #         recognition.append(rec)
-                else:
-                    recognition = extractor.batch_threaded(image, n, merged_detections, [use_upscaler, upscale_ratio], output_dir, log_level)
-
-                recognitions.extend(recognition)
-
-    # --- Stage 5/3: Translate Extracted Text with Gemini or from memory ---
-    # Use existing result.json if set and exists
-    if (use_result_json or args.load_json) and os.path.exists(result_json_path):
-        translated_text_data = recognitions
-    else:
-        glossary_path = os.path.join(input_path, "glossary.json") if glossary_path_ == "input" else os.path.join(output_path, "glossary.json") if glossary_path_ == "output" else glossary_path_
-
-        if not use_memory:
-            # Use automatic retry in case of any translation errors
-            max_retries = max_retries
-            retry_delay = retry_delay
-            attempts = 0
+input_path = args.input
+output_path = args.output if args.output else f"{input_path}-shitted"
 
-            while attempts <= max_retries:
-                try:
-                    translated_text_data = translate_texts_and_build_glossary(recognitions, [source_language, target_language], [translator_provider, translator_model, translator_base_url, translator_temp, translator_top_p, translator_max_out_tokens, timeout], glossary_path, [memory, overwrite_memory], log_level)
-                    break
-                except Exception as e:
-                    attempts += 1
-                    logger.error(f"\n{Fore.RED}{type(e).__name__}: {e}")
-                    if attempts <= max_retries:
-                        logger.info(f"({attempts}/{max_retries}) Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-                    else:
-                        raise Exception(Fore.RED + "Max retries reached!")
-        else:
-            translated_text_data = translate_texts_from_memory(recognitions, [source_language, target_language], memory, log_level)
+if args.command == "status":
+    # Summarize the library index without translating anything
+    from app.core.library import show_status
+    from app.core.pipeline import image_extensions
+    index = pipeline.open_index(input_path, output_path)
+    show_status(index, input_path, image_extensions)
+    index.close()
+    sys.exit(0)
 
-        # Save result to result.json
-        save_result_json(result_json_path, translated_text_data)
+if args.watch:
+    from app.core.watcher import watch
 
-    # --- Stage 6/4: Whiten Text Areas & Overlay Translated Texts to Split Images ---
-    overlay_translated_texts(image_chunks, merge_images, translated_text_data, [box_offset, box_padding, box_fill_color, box_outline_color, box_outline_thickness], [use_inpainting, simple_lama], [font_min, font_max, font_color, font_path], common_original_extension, [source_language, lang_code_jp], output_dir, log_level)
+    index = pipeline.open_index(input_path, output_path)
+    pipeline.load_models()
+    watch(pipeline, input_path, output_path, index, watch_settle_seconds, watch_poll_interval)
+    index.close()
+    sys.exit(0)
 
-logger.success(Style.BRIGHT + Fore.GREEN + f"\nAll translated images saved to '{output_path}'.")
+pipeline.translate_folder(input_path, output_path, args.overwrite, args.load_json)
 
 # --- End of Execution ---
 end_time = time.perf_counter()
 elapsed_seconds = end_time - start_time
 hours, remainder = divmod(int(elapsed_seconds), 3600)
 minutes, seconds = divmod(remainder, 60)
-logger.info(f"\nTime taken: {hours:02}:{minutes:02}:{seconds:02}")
\ No newline at end of file
+logger.info(f"\nTime taken: {hours:02}:{minutes:02}:{seconds:02}")
+
+if log_level == "TRACE":
+    log_import_times(startup_seconds)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import json
+import sqlite3
+
+from app.core.translation.glossary import GlossaryStore, open_glossary
+
+
+def test_import_keeps_source_terms_with_the_same_target(tmp_path):
+    json_path = tmp_path / "glossary.json"
+    json_path.write_text(json.dumps({"GLOSSARY": [
+        {"korean": "김민수", "english": "Kim"},
+        {"korean": "김철수", "english": "Kim"},
+    ]}, ensure_ascii=False), encoding="utf-8")
+
+    glossary = open_glossary(str(json_path))
+    assert glossary.get_map("korean", "english") == {"김민수": "Kim", "김철수": "Kim"}
+
+    # Importing again adds nothing
+    assert glossary.import_json(str(json_path)) == 0
+    glossary.close()
+
+
+def test_merge_keeps_source_terms_with_the_same_target(tmp_path):
+    glossary = GlossaryStore(str(tmp_path / "glossary.db"))
+    glossary.merge({"김민수": "Kim"}, "korean", "english")
+    glossary.merge({"김영희": "Kim", "방패": "shield"}, "korean", "english")
+    glossary.merge({"김민수": "Minsu"}, "korean", "english")
+
+    assert glossary.get_map("korean", "english") == {"김민수": "Kim", "김영희": "Kim", "방패": "shield"}
+    glossary.close()
+
+
+def test_old_glossary_drops_unique_terms(tmp_path):
+    db_path = str(tmp_path / "glossary.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE terms (concept_id INTEGER, lang TEXT, term TEXT, PRIMARY KEY (concept_id, lang))")
+    conn.execute("CREATE UNIQUE INDEX idx_terms_lang_term ON terms (lang, term)")
+    conn.executemany("INSERT INTO terms VALUES (?, ?, ?)", [(1, "korean", "김민수"), (1, "english", "Kim")])
+    conn.commit()
+    conn.close()
+
+    glossary = GlossaryStore(db_path)
+    assert glossary.merge({"김철수": "Kim"}, "korean", "english") == 2
+    assert glossary.get_map("korean", "english") == {"김민수": "Kim", "김철수": "Kim"}
+    assert glossary.prompt_chars("korean", "english") == len(json.dumps(glossary.get_map("korean", "english"), ensure_ascii=False))
+    glossary.close()
@@ -0,0 +1,25 @@
+import numpy as np
+
+from app.core.image_utils_pil import find_gutter_rows, is_blank_tile
+
+
+def test_flat_colored_tile_is_blank():
+    tile = np.zeros((640, 640, 3), dtype=np.uint8)
+    tile[:] = (230, 200, 250)
+    assert is_blank_tile(tile, 2)
+
+
+def test_tile_with_text_is_not_blank():
+    tile = np.full((640, 640, 3), 255, dtype=np.uint8)
+    tile[300:310, 100:500] = 0
+    assert not is_blank_tile(tile, 2)
+
+
+def test_flat_colored_rows_are_gutters():
+    page = np.zeros((300, 400, 3), dtype=np.uint8)
+    page[:] = (230, 200, 250)
+    page[100:200, 50:350] = (20, 20, 20)
+    page[100:200, ::7] = 255
+    gutter_rows = find_gutter_rows(page, 2)
+    assert gutter_rows[:100].all() and gutter_rows[200:].all()
+    assert not gutter_rows[100:200].any()